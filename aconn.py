@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import struct
+import time
+
+import cfgcache
+import common
+import ctlrcfg as cc
+import udpchan
+import window
+
+DELMT = common.DELMT
+
+
+# asyncio counterpart of common.Conn. Timeouts raise asyncio.TimeoutError
+# instead of exiting, so one event loop can host many connections.
+class AsyncConn:
+  def __init__(self, reader=None, writer=None):
+    self.reader = reader
+    self.writer = writer
+
+  async def connect(self, host, port, timeout=1):
+    self.reader, self.writer = await asyncio.wait_for(
+      asyncio.open_connection(host, port), timeout)
+
+  async def send(self, msg):
+    if DELMT in msg:
+      raise ValueError('Cannot use delimiter in msg (probably newline)')
+    await self.send_bytes((msg + DELMT).encode())
+
+  # returns (connection still valid, full message)
+  async def recv(self):
+    try:
+      line = await self.reader.readuntil(DELMT.encode())
+    except asyncio.IncompleteReadError as e:
+      return (False, e.partial.decode('utf-8'))
+    return (True, line[:-1].decode('utf-8').rstrip())
+
+  async def send_bytes(self, msg):
+    self.writer.write(msg)
+    await self.writer.drain()
+
+  async def recv_bytes(self, num_bytes, timeout=2):
+    try:
+      msg = await asyncio.wait_for(self.reader.readexactly(num_bytes), timeout)
+    except asyncio.IncompleteReadError as e:
+      return (False, e.partial)
+    return (True, msg)
+
+  # returns (connection still valid, code, payload) for one StoC message
+  async def recv_stoc(self, timeout=2):
+    valid, header = await self.recv_bytes(common.STOC_HEADER_LEN, timeout)
+    if not valid:
+      return (False, None, header)
+    code, length = common.STOC_HEADER.unpack(header)
+    if length == 0:
+      return (True, code, b'')
+    valid, payload = await self.recv_bytes(length, timeout)
+    return (valid, code, payload)
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+
+  async def wait_closed(self):
+    try:
+      await self.writer.wait_closed()
+    except OSError:
+      pass
+
+
+# The handshake and send_datum flow of DragSender over an AsyncConn, without
+# a scene: Dimensions, the config reply, then windowed ControlPackets whose
+# replies are matched in order by a reader task.
+class AsyncController:
+  def __init__(self, conn, w, h, window_size=8, cache=None, on_config=None,
+               caps=0):
+    self.conn = conn
+    self.w = w
+    self.h = h
+    self.caps = caps
+    self.accepted_caps = 0
+    self.udp_token = None
+    self.slots = asyncio.Semaphore(max(1, window_size))
+    self.cache = cache if cache is not None else cfgcache.CfgCache()
+    self.on_config = on_config
+    self.config = None
+    self.next_seq = 1
+    self.in_flight = collections.deque() # (seq, time sent, future)
+    self.closed = None # the ConnectionError once replies stopped coming
+    self.reader_task = None
+    self.last_rtt = None
+    self.rtt_sink = None # list that collects every reply's round trip time
+
+  async def setup(self):
+    self.reader_task = asyncio.ensure_future(self.read_replies())
+    dims = cc.CtoS(cc.MSG_TYPES['Dimensions'], self.w, self.h,
+                   cc.ControlPacket(0, None), caps=self.caps).to_bytes()
+    await (await self.send_datum(dims))
+    if self.config is None:
+      raise RuntimeError('failed to receive initial controller config')
+
+  # sends once a window slot is free; the returned future resolves to
+  # (code, payload) when the reply arrives. Raises ConnectionError once the
+  # connection is gone.
+  async def send_datum(self, datum):
+    if self.closed is not None:
+      raise self.closed
+    await self.slots.acquire()
+    if self.closed is not None:
+      self.slots.release()
+      raise self.closed
+    seq = self.next_seq
+    self.next_seq = seq + 1 if seq < window.SEQ_MAX else 1
+    if len(datum) >= cc.NUM_BYTES_CTOS and datum[0] in window.SEQUENCED:
+      datum = bytearray(datum)
+      struct.pack_into('<i', datum, cc.SEQ_OFFSET, seq)
+    fut = asyncio.get_running_loop().create_future()
+    self.in_flight.append((seq, time.monotonic(), fut))
+    try:
+      await self.conn.send_bytes(datum)
+    except Exception:
+      self.in_flight.pop()
+      self.slots.release()
+      raise
+    return fut
+
+  async def heartbeat(self):
+    return await self.send_datum(cc.HEARTBEAT_BYTES)
+
+  # waits for every reply; raises ConnectionError if the connection was lost
+  async def drain(self):
+    if self.in_flight:
+      await asyncio.gather(*[f for s, t, f in self.in_flight],
+                           return_exceptions=True)
+    if self.closed is not None:
+      raise self.closed
+
+  async def read_replies(self):
+    error = 'end of stream'
+    try:
+      while True:
+        valid, code, payload = await self.conn.recv_stoc(timeout=None)
+        if not valid:
+          break
+        if code == window.STOC_CAPS:
+          self.accepted_caps, self.udp_token = udpchan.CAPS_PAYLOAD.unpack(payload)
+          continue
+        if code == window.STOC_UDP_SEEN:
+          continue
+        seq, sent, fut = self.in_flight.popleft()
+        self.last_rtt = time.monotonic() - sent
+        if self.rtt_sink is not None:
+          self.rtt_sink.append(self.last_rtt)
+        self.slots.release()
+        if code == window.STOC_STRING_SPEC or code == window.STOC_BINARY_SPEC:
+          self.config = self.cache.get(code, payload)
+          if self.on_config:
+            self.on_config(self.config)
+        elif code != window.STOC_NONE:
+          print('StoC magic number ' + str(code) + ' cannot be handled')
+        if not fut.done():
+          fut.set_result((code, payload))
+    except (OSError, IndexError) as e:
+      error = e
+    self.closed = ConnectionError('connection closed: ' + str(error))
+    # the slots of the dropped frames wake any send_datum waiting for one,
+    # which then sees closed
+    for seq, sent, fut in self.in_flight:
+      if not fut.done():
+        fut.set_exception(self.closed)
+      self.slots.release()
+    self.in_flight.clear()
+
+  async def close(self):
+    try:
+      await self.conn.send_bytes(cc.DISCONNECT_BYTES)
+    except OSError:
+      pass
+    self.conn.close()
+    if self.reader_task is not None:
+      await self.reader_task
+    await self.conn.wait_closed()
@@ -0,0 +1,83 @@
+# Syscalls and bytes for N simultaneous touches per frame, sent as N single
+# ControlPacket frames or as one Batch. Then checks the engine only sends
+# Batches to a server that accepts CAP_BATCH. Run from the repo root:
+#   python -m bench.batch
+import argparse
+import socket
+import time
+
+import common
+import ctlrcfg as cc
+import standin
+import window
+from bench import engine as engine_bench
+
+
+class CountingSocket(socket.socket):
+  def __init__(self, *args):
+    super().__init__(*args)
+    self.syscalls = 0
+    self.sent = 0
+
+  def send(self, data, *args):
+    self.syscalls += 1
+    n = super().send(data, *args)
+    self.sent += n
+    return n
+
+  def recv(self, *args):
+    self.syscalls += 1
+    return super().recv(*args)
+
+
+def run(port, touches, batched, duration):
+  sock = CountingSocket(socket.AF_INET, socket.SOCK_STREAM)
+  sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+  conn = common.Conn(sock)
+  conn.connect('127.0.0.1', port)
+  sender = window.WindowedSender(conn, 8)
+  sender.send(cc.CtoS(cc.MSG_TYPES['Dimensions'], 1024, 768,
+                      cc.ControlPacket(0, None),
+                      caps=cc.CAP_BATCH if batched else 0).to_bytes())
+  sender.drain()
+  batcher = cc.BatchEncoder()
+  frames = [cc.packet_to_bytes(i, cc.MOVE, 0.25 * i, -0.5) for i in range(touches)]
+  sock.syscalls = 0
+  sock.sent = 0
+  count = 0
+  start = time.monotonic()
+  end = start + duration
+  while time.monotonic() < end:
+    if batched and touches > 1:
+      sender.send(batcher.encode(frames))
+    else:
+      for frame in frames:
+        sender.send(frame)
+    sender.poll()
+    count += 1
+  sender.drain()
+  elapsed = time.monotonic() - start
+  conn.close()
+  return count / elapsed, sock.syscalls / count, sock.sent / count, sock.sent / elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--duration', type=float, default=0.5)
+  args = parser.parse_args()
+  server = standin.StandInServer().start()
+  print('touches  mode     frames/s  syscalls/frame  bytes/frame     bytes/s')
+  for touches in range(1, 11):
+    for batched in (False, True):
+      fps, calls, bpf, bps = run(server.port, touches, batched, args.duration)
+      print('%7d  %-7s %9.0f  %14.2f  %11.0f  %10.0f' %
+            (touches, 'batch' if batched else 'single', fps, calls, bpf, bps))
+  server.stop()
+
+  for batch in (True, False):
+    server = standin.StandInServer(batch=batch).start()
+    engine_bench.run(server.port, 'taps', 600, False)
+    server.stop()
+    print('engine against a server %s CAP_BATCH: %d packets in %d Batches' %
+          ('with' if batch else 'without', server.packets, server.batches))
+    assert server.packets > 0 and (server.batches > 0) == batch
@@ -0,0 +1,71 @@
+# Config cache: a spec the server sends again against parsing it, and the
+# state of the config handed out. Holds the stand-in layout's joystick
+# through a switch to a layout that moves it, lets go, and switches back;
+# the cached layout must come back with the stick released and centred.
+# Run from the repo root: python -m bench.cache
+import argparse
+import random
+import time
+
+import cfgcache
+import ctlrcfg as cc
+import engine
+import standin
+import window
+from bench import spec as spec_bench
+
+H = 768
+MOVED_SPEC = standin.DEFAULT_SPEC.replace('4,800,200,150;', '4,800,220,140;')
+
+
+def best(fn, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+
+def swap_back():
+  eng = engine.Engine('127.0.0.1', 0, 1024, H, cache=cfgcache.CfgCache())
+  a = standin.DEFAULT_SPEC.encode()
+  b = MOVED_SPEC.encode()
+  eng.handle_reply(1, window.STOC_STRING_SPEC, a)
+  eng.touch_began(1, 800, H - 200)
+  eng.touch_moved(1, 900, H - 300)
+  eng.handle_reply(2, window.STOC_STRING_SPEC, b)
+  eng.touch_moved(1, 910, H - 310)
+  eng.touch_ended(1, 910, H - 310)
+  eng.handle_reply(3, window.STOC_STRING_SPEC, a)
+  assert eng.cache.hits == 1 and eng.cache.misses == 2
+  # the same spec again leaves the config alone
+  config = eng.config
+  eng.handle_reply(4, window.STOC_STRING_SPEC, a)
+  assert eng.config is config
+  return eng.config.joysticks[0]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--elements', type=int, default=1000)
+  args = parser.parse_args()
+  jstk = swap_back()
+  print('joystick after A -> B -> A: depressed %s, sent_level %s, knob at '
+        '(%g, %g)' % (jstk.depressed, jstk.sent_level, jstk.knob_x, jstk.knob_y))
+  assert not jstk.depressed and jstk.sent_level == (0, 0)
+  assert (jstk.knob_x, jstk.knob_y) == (jstk.x, jstk.y)
+
+  payload = spec_bench.make_spec(args.elements, random.Random(1)).encode()
+  cache = cfgcache.CfgCache()
+  cache.get(window.STOC_STRING_SPEC, payload)
+  parse = best(lambda: cfgcache.parse_spec(window.STOC_STRING_SPEC, payload), 20)
+  # alternate with another spec so every get is a hit handing out a copy
+  other = b'0,0,0,10,10,0;]]]'
+  def hit():
+    cache.get(window.STOC_STRING_SPEC, other)
+    cache.get(window.STOC_STRING_SPEC, payload)
+  hit_time = best(hit, 20)
+  print('%d elements: parse %.2f ms, cache hit %.2f ms' %
+        (args.elements, parse * 1e3, hit_time * 1e3))
+  assert hit_time < parse
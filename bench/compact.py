@@ -0,0 +1,83 @@
+# Bytes on the wire for heavy two-stick input: every frame both sticks move,
+# sent as single ControlPackets, as one Batch per frame, or as CompactMove
+# frames when the stand-in accepts CAP_COMPACT_MOVES. Checks the server
+# decodes the last compact values to within one quantization step.
+# Run from the repo root: python -m bench.compact
+import argparse
+import math
+import time
+
+import common
+import ctlrcfg as cc
+import standin
+import udpchan
+import window
+
+STICKS = (4, 5)
+
+
+def stick_values(i):
+  a = i / 30
+  return ((STICKS[0], round(math.cos(a), 2), round(math.sin(a), 2)),
+          (STICKS[1], round(-math.sin(a), 2), round(math.cos(a), 2)))
+
+
+def run(mode, frames):
+  caps = {'compact': cc.CAP_COMPACT_MOVES, 'batch': cc.CAP_BATCH}.get(mode, 0)
+  server = standin.StandInServer(compact=True).start()
+  conn = common.Conn()
+  conn.connect('127.0.0.1', server.port)
+  accepted = []
+  sender = window.WindowedSender(
+    conn, 8, lambda seq, code, payload: accepted.append(payload)
+    if code == window.STOC_CAPS else None)
+  sender.send(cc.CtoS(cc.MSG_TYPES['Dimensions'], 1024, 768,
+                      cc.ControlPacket(0, None), caps=caps).to_bytes())
+  sender.drain()
+  if mode == 'compact':
+    assert udpchan.CAPS_PAYLOAD.unpack(accepted[0])[0] & cc.CAP_COMPACT_MOVES
+  batcher = cc.BatchEncoder()
+  base = server.bytes
+  start = time.monotonic()
+  for i in range(frames):
+    moves = stick_values(i)
+    if mode == 'compact':
+      sender.send_many([cc.compact_move(e, x, y) for e, x, y in moves])
+    else:
+      datums = [cc.packet_to_bytes(e, cc.MOVE, x, y) for e, x, y in moves]
+      if mode == 'batch':
+        sender.send(batcher.encode(datums))
+      else:
+        for datum in datums:
+          sender.send(datum)
+    sender.poll()
+  sender.drain()
+  elapsed = time.monotonic() - start
+  sent = server.bytes - base
+  if mode == 'compact':
+    for e, x, y in stick_values(frames - 1):
+      sx, sy = server.compact_moves[e]
+      assert abs(sx - x) <= 1 / cc.COMPACT_SCALE and abs(sy - y) <= 1 / cc.COMPACT_SCALE
+  assert server.packets == 2 * frames
+  conn.close()
+  server.stop()
+  return sent, elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--frames', type=int, default=6000)
+  parser.add_argument('--fps', type=float, default=120,
+                      help='input rate the bytes/s figure is scaled to')
+  args = parser.parse_args()
+  results = {}
+  for mode in ('single', 'batch', 'compact'):
+    sent, elapsed = run(mode, args.frames)
+    results[mode] = sent
+    print('%-8s %7d bytes, %5.1f bytes/frame, %6.0f bytes/s at %g fps (%.2f s)' %
+          (mode, sent, sent / args.frames, sent / args.frames * args.fps,
+           args.fps, elapsed))
+  assert results['compact'] < min(results['batch'], results['single'])
+  print('compact saves %.0f%% over single frames, %.0f%% over batches' %
+        (100 - 100 * results['compact'] / results['single'],
+         100 - 100 * results['compact'] / results['batch']))
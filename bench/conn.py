@@ -0,0 +1,89 @@
+# Many small frames arriving back to back: checks Conn returns every one of
+# them in order and reports frames/s. Run from the repo root:
+#   python -m bench.conn
+import socket
+import threading
+import time
+
+import common
+
+COUNT = 200000
+
+
+def serve(sock, payload):
+  sock.sendall(payload)
+  sock.close()
+
+
+def pair(payload):
+  a, b = socket.socketpair()
+  threading.Thread(target=serve, args=(a, payload), daemon=True).start()
+  return b
+
+
+# the recv_bytes loop Conn used before the buffered reader
+def legacy_recv_bytes(sock, num_bytes):
+  msg = b''
+  while len(msg) < num_bytes:
+    chunk = sock.recv(num_bytes - len(msg))
+    if chunk == b'':
+      return (False, msg)
+    msg += chunk
+  return (True, msg)
+
+
+def lines():
+  payload = b''.join(b'msg ' + str(i).encode() + b'\n' for i in range(COUNT))
+  conn = common.Conn(pair(payload))
+  start = time.perf_counter()
+  got = 0
+  while got < COUNT:
+    valid, msgs = conn.recv_lines()
+    for msg in msgs:
+      assert msg == 'msg ' + str(got), msg
+      got += 1
+  return COUNT / (time.perf_counter() - start)
+
+
+def stoc_payload():
+  frames = []
+  for i in range(COUNT):
+    if i % 100 == 0:
+      body = str(i).encode()
+      frames.append(bytes([32]) + len(body).to_bytes(4, 'little') + body)
+    else:
+      frames.append(bytes([31, 0, 0, 0, 0]))
+  return b''.join(frames)
+
+
+def check_stoc(i, code, payload):
+  if i % 100 == 0:
+    assert code == 32 and payload == str(i).encode()
+  else:
+    assert code == 31
+
+
+def stocs():
+  conn = common.Conn(pair(stoc_payload()))
+  start = time.perf_counter()
+  for i in range(COUNT):
+    valid, code, payload = conn.recv_stoc()
+    check_stoc(i, code, payload)
+  return COUNT / (time.perf_counter() - start)
+
+
+def legacy_stocs():
+  sock = pair(stoc_payload())
+  start = time.perf_counter()
+  for i in range(COUNT):
+    valid, msg = legacy_recv_bytes(sock, 5)
+    length = int.from_bytes(msg[1:], 'little')
+    payload = legacy_recv_bytes(sock, length)[1] if length else None
+    check_stoc(i, msg[0], payload)
+  return COUNT / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+  print('newline frames     %10.0f frames/s' % lines())
+  print('StoC frames        %10.0f frames/s' % stocs())
+  print('StoC frames legacy %10.0f frames/s' % legacy_stocs())
@@ -0,0 +1,100 @@
+# Server-side decoding of a CtoS byte stream: one frame at a time with
+# CTOS_STRUCT, as standin does, against ctosdecode's column decoder over the
+# whole buffer. Checks both agree, including a stream fed in odd-sized
+# chunks that split frames, and Batch bodies.
+# Run from the repo root: python -m bench.decode
+import argparse
+import random
+import time
+
+import ctlrcfg as cc
+import ctosdecode
+
+
+def make_stream(n, seed=1):
+  rng = random.Random(seed)
+  frames = []
+  for i in range(n):
+    kind = rng.random()
+    if kind < 0.7:
+      frames.append(cc.packet_to_bytes(rng.randrange(1, 64), cc.MOVE,
+                                       rng.uniform(-1, 1), rng.uniform(-1, 1), i))
+    elif kind < 0.8:
+      frames.append(cc.packet_to_bytes(rng.randrange(1, 64), cc.SQUEEZE,
+                                       rng.uniform(0, 1), 0, i))
+    elif kind < 0.95:
+      frames.append(cc.packet_to_bytes(rng.randrange(1, 64),
+                                       rng.choice((cc.PRESS, cc.RELEASE)), 0, 0, i))
+    else:
+      frames.append(cc.HEARTBEAT_BYTES)
+  return b''.join(frames)
+
+
+# the decode a server does today: a tuple per frame
+def per_frame(buf):
+  out = []
+  for msg_type, elem_id, datum_type, a, b, c, d, seq in \
+      cc.CTOS_STRUCT.iter_unpack(buf):
+    out.append((msg_type, elem_id, datum_type, a + b / cc.INT_MAX,
+                c + d / cc.INT_MAX, seq))
+  return out
+
+
+def check(buf):
+  expect = per_frame(buf)
+  cols = ctosdecode.decode(buf + buf[:13])
+  assert cols.count == len(expect) and cols.used == len(buf)
+  assert cols.rows() == expect
+  # the same stream in chunks that split frames anywhere
+  rng = random.Random(2)
+  dec = ctosdecode.CtoSStreamDecoder()
+  got = []
+  pos = 0
+  while pos < len(buf):
+    step = rng.randrange(1, 200)
+    got += dec.feed(buf[pos:pos + step]).rows()
+    pos += step
+  assert got == expect and not dec.pending
+  # a Batch body is the same packets without msg_type and seq
+  batcher = cc.BatchEncoder()
+  frames = [buf[i:i + cc.NUM_BYTES_CTOS] for i in range(0, 16 * cc.NUM_BYTES_CTOS,
+                                                        cc.NUM_BYTES_CTOS)]
+  frames = [f for f in frames if f[0] == cc.CONTROL_PACKET]
+  body = bytes(batcher.encode(frames)[cc.NUM_BYTES_CTOS:])
+  packed = ctosdecode.decode_packed(body).rows()
+  assert [r[1:5] for r in packed] == list(cc.unpack_batch(body))
+  return len(expect)
+
+
+def rate(fn, buf, frames, repeat=5):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn(buf)
+    t = time.perf_counter() - start
+    best = t if best is None else min(best, t)
+  return frames / best
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--frames', type=int, default=200000)
+  args = parser.parse_args()
+  buf = make_stream(args.frames)
+  print('decoded alike: %d frames (%s columns)' %
+        (check(buf), 'numpy' if ctosdecode.numpy is not None else 'array'))
+  chunk = 64 * 1024 // cc.NUM_BYTES_CTOS * cc.NUM_BYTES_CTOS + 7
+
+  def stream(buf):
+    dec = ctosdecode.CtoSStreamDecoder()
+    view = memoryview(buf)
+    for pos in range(0, len(buf), chunk):
+      dec.feed(view[pos:pos + chunk])
+
+  cases = [
+    ('CTOS_STRUCT per frame', per_frame),
+    ('decode', ctosdecode.decode),
+    ('stream, 64 KB chunks', stream),
+  ]
+  for name, fn in cases:
+    print('%-22s %12.0f frames/s' % (name, rate(fn, buf, args.frames)))
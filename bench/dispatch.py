@@ -0,0 +1,137 @@
+# Server-side event dispatch: the dispatcher's elem_id -> handler table
+# against finding each packet's element by scanning the config, for a
+# stream of button taps and stick sweeps with a few impossible datums mixed
+# in. Checks every callback fires as often as it should and every
+# impossible datum is rejected.
+# Run from the repo root: python -m bench.dispatch
+import argparse
+import random
+import time
+
+import ctlrcfg as cc
+import ctosdecode
+import dispatch
+
+
+def make_config(buttons):
+  btns = ''.join('%d,%d,0,40,40;' % (i + 1, i * 50) for i in range(buttons))
+  jstks = '%d,800,200,150;%d,200,500,150;' % (buttons + 1, buttons + 2)
+  pads = '%d,400,400,300,300,80;%d,0,400,300,300,80;' % (buttons + 3,
+                                                        buttons + 4)
+  return cc.CtlrCfg.from_str(']' + btns + ']' + jstks + ']' + pads)
+
+
+# (elem_id, datum_type, x, y) packets, and the callbacks and rejections
+# they should cause
+def make_events(config, n, seed=1):
+  rng = random.Random(seed)
+  sticks = config.joysticks + config.joystickpads
+  events = []
+  expect = {'press': 0, 'release': 0, 'move': 0, 'rejected': 0}
+  while len(events) < n:
+    r = rng.random()
+    if r < 0.01:
+      events.append(rng.choice([(9999, cc.PRESS, 0, 0),
+                                (config.buttons[0].elem_id, cc.RELEASE, 0, 0),
+                                (config.buttons[1].elem_id, cc.MOVE, 0.5, 0.5)]))
+      expect['rejected'] += 1
+    elif r < 0.2:
+      elem_id = rng.choice(config.buttons).elem_id
+      events.append((elem_id, cc.PRESS, 0, 0))
+      events.append((elem_id, cc.RELEASE, 0, 0))
+      expect['press'] += 1
+      expect['release'] += 1
+    else:
+      elem_id = rng.choice(sticks).elem_id
+      steps = rng.randrange(2, 30)
+      for i in range(steps):
+        a = i / steps
+        events.append((elem_id, cc.MOVE, round(a, 2) or 0.01, round(-a / 2, 2)))
+      events.append((elem_id, cc.MOVE, 0, 0))
+      expect['press'] += 1
+      expect['move'] += steps - 1
+      expect['release'] += 1
+  return events, expect
+
+
+def counting_callbacks(config):
+  counts = {'press': 0, 'release': 0, 'move': 0}
+
+  def press(*args):
+    counts['press'] += 1
+
+  def release(*args):
+    counts['release'] += 1
+
+  def move(x, y):
+    counts['move'] += 1
+
+  for elem in config.buttons + config.joysticks + config.joystickpads:
+    elem.set_on_press(press)
+    elem.set_on_release(release)
+    if elem.elem_type != cc.TYPE_BUTTON:
+      elem.set_on_move(move)
+  return counts
+
+
+# looks each packet's element up by scanning the config's lists, then
+# dispatches to the same handlers
+def scan_dispatch(config, handlers, events):
+  kinds = (config.buttons, config.joysticks, config.joystickpads)
+  rejected = 0
+  for elem_id, datum_type, x, y in events:
+    found = None
+    for elems in kinds:
+      for e in elems:
+        if e.elem_id == elem_id:
+          found = e
+          break
+      if found is not None:
+        break
+    if found is None or handlers[id(found)].datum(datum_type, x, y) is not None:
+      rejected += 1
+  return rejected
+
+
+def timed(fn):
+  start = time.perf_counter()
+  fn()
+  return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--events', type=int, default=1000000)
+  parser.add_argument('--buttons', type=int, default=28)
+  args = parser.parse_args()
+  config = make_config(args.buttons)
+  events, expect = make_events(config, args.events)
+  n = len(events)
+
+  counts = counting_callbacks(config)
+  d = dispatch.Dispatcher(config)
+  t = timed(lambda: d.dispatch_packets(events))
+  counts['rejected'] = d.rejected
+  assert counts == expect, (counts, expect)
+  assert not any(h.pressed for h in d.handlers.values())
+  print('callbacks and rejections as expected: %s' % expect)
+  print('%-26s %10.0f events/s' % ('table, counting callbacks', n / t))
+
+  # the same packets as CtoS frames, through the column decoder
+  frames = b''.join(cc.packet_to_bytes(*e) for e in events)
+  d = dispatch.Dispatcher(config)
+  t = timed(lambda: d.dispatch_columns(ctosdecode.decode(frames)))
+  assert d.rejected == expect['rejected'] and d.events == n
+  print('%-26s %10.0f events/s' % ('decode + columns', n / t))
+
+  for elem in config.buttons + config.joysticks + config.joystickpads:
+    elem.on_press = elem.on_release = None
+    if elem.elem_type != cc.TYPE_BUTTON:
+      elem.on_move = None
+  d = dispatch.Dispatcher(config)
+  t = timed(lambda: d.dispatch_packets(events))
+  print('%-26s %10.0f events/s' % ('table, no callbacks', n / t))
+  d = dispatch.Dispatcher(config)
+  handlers = {id(h.elem): h for h in d.handlers.values()}
+  t = timed(lambda: scan_dispatch(config, handlers, events))
+  print('%-26s %10.0f events/s' % ('scan, no callbacks', n / t))
@@ -0,0 +1,44 @@
+# Compares the CtoS encoders and checks they produce identical bytes.
+# Run from the repo root: python -m bench.encode
+import random
+import timeit
+
+import ctlrcfg as cc
+
+
+def old_to_bytes(ctos):
+  return cc.nums_to_bytes(ctos.to_nums())
+
+
+def check_identical():
+  rng = random.Random(1)
+  checked = 0
+  for msg_type in cc.MSG_TYPES.values():
+    for datum_type in cc.DATUM_TYPES.values():
+      for _ in range(2000):
+        x = rng.uniform(-1000, 1000)
+        y = rng.choice([0.0, -0.0, 1.0, -1.0, rng.uniform(-1, 1), rng.uniform(-1000, 1000)])
+        elem_id = rng.randrange(0, 1 << 20)
+        packet = cc.ControlPacket(elem_id, cc.ControlDatum(datum_type, x, y))
+        ctos = cc.CtoS(msg_type, x, abs(y), packet)
+        expect = old_to_bytes(ctos)
+        assert ctos.to_bytes() == expect
+        if msg_type == cc.CONTROL_PACKET:
+          assert cc.packet_to_bytes(elem_id, datum_type, x, y) == expect
+        checked += 1
+  return checked
+
+
+if __name__ == '__main__':
+  print('identical for ' + str(check_identical()) + ' frames')
+  n = 200000
+  ctos = lambda: cc.CtoS(cc.CONTROL_PACKET, 0, 0, cc.ControlPacket
+                         (7, cc.ControlDatum(cc.MOVE, 0.37, -0.81)))
+  cases = [
+    ('nums_to_bytes (old)', lambda: old_to_bytes(ctos())),
+    ('CtoS.to_bytes', lambda: ctos().to_bytes()),
+    ('packet_to_bytes', lambda: cc.packet_to_bytes(7, cc.MOVE, 0.37, -0.81)),
+  ]
+  for name, fn in cases:
+    t = min(timeit.repeat(fn, number=n, repeat=3))
+    print('%-22s %7.0f ns/frame' % (name, t / n * 1e9))
@@ -0,0 +1,104 @@
+# Per-frame CPU time and allocations of the client engine, headless against
+# the stand-in server, for synthetic multi-touch streams: no touches, two
+# thumbs on the sticks, and two thumbs plus button taps. Each frame feeds
+# two touch samples per thumb (a 120 Hz digitizer at 60 frames/s) through
+# touch_began/moved/ended and then runs update().
+# Run from the repo root: python -m bench.engine
+import argparse
+import math
+import time
+import tracemalloc
+
+import cfgcache
+import engine
+import standin
+
+W = 1024
+H = 768
+# touch points in screen coordinates (y from the bottom) inside the stand-in
+# layout's joystick, joystick pad and buttons
+JOYSTICK = (800, H - 200)
+PAD = (550, H - 550)
+BUTTONS = [(100, H - 100), (100, H - 280), (280, H - 100)]
+
+
+def thumb(centre, r, i):
+  a = i / 40
+  return (centre[0] + r * math.cos(a), centre[1] + r * math.sin(a))
+
+
+# the touch events of frame i as (method name, touch id, x, y)
+def frame_events(scenario, i):
+  events = []
+  if scenario == 'idle':
+    return events
+  for k in range(2):
+    sample = 2 * i + k
+    if sample % 240 == 0:
+      events.append(('touch_began', 1, *JOYSTICK))
+      events.append(('touch_began', 2, *PAD))
+    elif sample % 240 == 239:
+      events.append(('touch_ended', 1, *JOYSTICK))
+      events.append(('touch_ended', 2, *PAD))
+    else:
+      events.append(('touch_moved', 1, *thumb(JOYSTICK, 60, sample)))
+      events.append(('touch_moved', 2, *thumb(PAD, 40, sample)))
+  if scenario == 'taps' and i % 6 < 2:
+    x, y = BUTTONS[(i // 6) % len(BUTTONS)]
+    events.append(('touch_began' if i % 6 == 0 else 'touch_ended', 3, x, y))
+  return events
+
+
+def run(port, scenario, frames, trace):
+  renderer = engine.HeadlessRenderer()
+  eng = engine.Engine('127.0.0.1', port, W, H, renderer,
+                      cache=cfgcache.CfgCache())
+  assert eng.start()
+  while eng.config is None:
+    eng.update()
+    time.sleep(0.001)
+  frame_events(scenario, 0) # warm up
+  events = [frame_events(scenario, i) for i in range(frames)]
+  times = []
+  allocs = []
+  if trace:
+    tracemalloc.start()
+  for batch in events:
+    if trace:
+      tracemalloc.reset_peak()
+      base = tracemalloc.get_traced_memory()[0]
+    start = time.process_time()
+    for name, touch_id, x, y in batch:
+      getattr(eng, name)(touch_id, x, y)
+    eng.update()
+    times.append(time.process_time() - start)
+    if trace:
+      allocs.append(tracemalloc.get_traced_memory()[1] - base)
+  if trace:
+    tracemalloc.stop()
+  eng.sender.drain()
+  eng.stop()
+  return sorted(times), sorted(allocs), renderer
+
+
+def pct(vals, p):
+  return vals[min(len(vals) - 1, int(p * len(vals)))]
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--frames', type=int, default=3000)
+  args = parser.parse_args()
+  server = standin.StandInServer(compact=True).start()
+  print('%-7s %9s %9s %9s %12s %12s' % ('touches', 'mean us', 'p50 us',
+                                       'p99 us', 'p50 alloc B', 'p99 alloc B'))
+  for scenario in ('idle', 'sticks', 'taps'):
+    before = server.packets
+    times, _, renderer = run(server.port, scenario, args.frames, False)
+    _, allocs, _ = run(server.port, scenario, args.frames, True)
+    if scenario != 'idle':
+      assert renderer.changed > 0 and server.packets > before
+    print('%-7s %9.1f %9.1f %9.1f %12d %12d' %
+          (scenario, sum(times) / len(times) * 1e6, pct(times, 0.5) * 1e6,
+           pct(times, 0.99) * 1e6, pct(allocs, 0.5), pct(allocs, 0.99)))
+  server.stop()
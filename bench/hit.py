@@ -0,0 +1,63 @@
+# get_element_containing_point: grid index versus the linear scan, across
+# layout sizes, and a check that applying a config leaves building the grid
+# to the first touch. Run from the repo root: python -m bench.hit
+import random
+import time
+
+import cfgcache
+import ctlrcfg as cc
+import engine
+import standin
+
+W = 2048
+H = 1536
+
+
+def make_layout(n, rng):
+  btns = []
+  for i in range(n):
+    w = rng.uniform(20, 120)
+    h = rng.uniform(20, 120)
+    x = rng.uniform(0, W - w)
+    y = rng.uniform(0, H - h)
+    btns.append(cc.Button(i, x, y, x + w, y + h))
+  jstks = [cc.Joystick(n + i, rng.uniform(0, W), rng.uniform(0, H),
+                       rng.uniform(40, 150)) for i in range(max(1, n // 50))]
+  pads = [cc.JoystickPad(2*n + i, 0, H*i/4, W/2, H*(i+1)/4, 60) for i in range(2)]
+  return cc.CtlrCfg([], btns, jstks, pads)
+
+
+def timed(fn, points):
+  start = time.perf_counter()
+  for x, y in points:
+    fn(x, y)
+  return (time.perf_counter() - start) / len(points)
+
+
+if __name__ == '__main__':
+  rng = random.Random(5)
+  points = [(rng.uniform(-10, W + 10), rng.uniform(-10, H + 10))
+            for _ in range(20000)]
+  print('elements  build ms   scan us  grid us  speedup')
+  for n in (10, 100, 500, 1000, 5000):
+    start = time.perf_counter()
+    cfg = make_layout(n, rng)
+    # the first query builds the grid
+    cfg.get_element_containing_point(0, 0)
+    build = time.perf_counter() - start
+    for x, y in points:
+      assert (cfg.get_element_containing_point(x, y) ==
+              cfg.scan_element_containing_point(x, y))
+    scan = timed(cfg.scan_element_containing_point, points)
+    grid = timed(cfg.get_element_containing_point, points)
+    total = len(cfg.buttons) + len(cfg.joysticks) + len(cfg.joystickpads)
+    print('%8d  %8.2f  %8.2f  %7.2f  %6.1fx' %
+          (total, build * 1e3, scan * 1e6, grid * 1e6, scan / grid))
+
+  eng = engine.Engine('127.0.0.1', 0, 1024, 768, cache=cfgcache.CfgCache())
+  eng.apply_config(cc.CtlrCfg.from_str(standin.DEFAULT_SPEC))
+  eng.apply_config(cc.CtlrCfg.from_str(
+    standin.DEFAULT_SPEC.replace('4,800,200,150;', '4,800,220,140;')))
+  assert eng.config.grid is None
+  eng.touch_began(1, 100, 768 - 100)
+  assert eng.config.grid is not None and eng.ctouches[1] is eng.config.buttons[0]
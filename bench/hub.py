@@ -0,0 +1,69 @@
+# Scaling of the controller hub from 1 to 500 controllers. For each count,
+# two loadgen processes connect half the controllers each at two screen
+# sizes and stream ControlPackets at 60/s per controller, while the hub
+# pushes new layouts. Reports throughput, reply latency and the hub loop's
+# CPU time per packet, and checks each push was encoded once per screen
+# size however many controllers share it.
+# Run from the repo root: python -m bench.hub
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import hub
+import standin
+
+SIZES = [(1024, 768), (2048, 1536)]
+PUSHED_SPEC = standin.DEFAULT_SPEC.replace('4,800,200,150;', '4,800,220,140;')
+
+
+def loadgen(port, clients, size, duration, rate):
+  return subprocess.Popen([sys.executable, '-m', 'loadgen', '--port', str(port),
+                           '--clients', str(clients), '--width', str(size[0]),
+                           '--height', str(size[1]), '--duration', str(duration),
+                           '--rate', str(rate), '--json'],
+                          stdout=subprocess.PIPE)
+
+
+def run(clients, duration, rate, pushes):
+  server = hub.Hub(standin.DEFAULT_SPEC, design=SIZES[0]).start()
+  counts = [clients - clients // 2, clients // 2]
+  procs = [loadgen(server.port, n, size, duration, rate)
+           for n, size in zip(counts, SIZES) if n]
+  # loadgen starts sending half a second after launch
+  time.sleep(0.5 + duration / 4)
+  for i in range(pushes):
+    server.push_config(PUSHED_SPEC if i % 2 == 0 else standin.DEFAULT_SPEC)
+    time.sleep(duration / 4 / pushes)
+  reports = [json.loads(p.communicate()[0]) for p in procs]
+  server.stop()
+  groups = len(procs)
+  assert server.encodes == groups * (pushes + 1), server.encodes
+  assert sum(r['failed'] for r in reports) == 0
+  packets = sum(r['packets'] for r in reports)
+  assert server.packets == packets, (server.packets, packets)
+  return {
+    'clients': clients,
+    'encodes': server.encodes,
+    'packets_per_s': sum(r['packets_per_s'] for r in reports),
+    'rtt_p50_ms': max(r['rtt_p50_ms'] for r in reports),
+    'rtt_p99_ms': max(r['rtt_p99_ms'] for r in reports),
+    'cpu_us_per_packet': server.cpu / max(1, server.packets) * 1e6,
+  }
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--clients', default='1,10,50,100,250,500')
+  parser.add_argument('--duration', type=float, default=2)
+  parser.add_argument('--rate', type=float, default=60)
+  parser.add_argument('--pushes', type=int, default=2)
+  args = parser.parse_args()
+  print('%7s %8s %12s %10s %10s %14s' % ('clients', 'encodes', 'packets/s',
+                                         'p50 ms', 'p99 ms', 'hub us/packet'))
+  for n in [int(v) for v in args.clients.split(',')]:
+    r = run(n, args.duration, args.rate, args.pushes)
+    print('%7d %8d %12.0f %10.2f %10.2f %14.1f' %
+          (r['clients'], r['encodes'], r['packets_per_s'], r['rtt_p50_ms'],
+           r['rtt_p99_ms'], r['cpu_us_per_packet']))
@@ -0,0 +1,152 @@
+# Memory of slotted elements against dict-backed copies of the same
+# attributes, whole-layout y flip and bounds through the coordinate arrays
+# against per-element loops, and the cost of a scale. Checks both give the
+# same coordinates, also once a scale has made the arrays stale.
+# Run from the repo root: python -m bench.layout
+import random
+import time
+import tracemalloc
+
+import cfgarrays
+import ctlrcfg as cc
+
+W = 2048
+H = 1536
+
+
+class Plain:
+  pass
+
+
+def make_elements(n, rng):
+  pnls = [cc.Panel(3*n + i, 0, H*i/8, W, H*(i+1)/8, 0x202020) for i in range(8)]
+  btns = []
+  for i in range(n):
+    w = rng.uniform(20, 120)
+    h = rng.uniform(20, 120)
+    x = rng.uniform(0, W - w)
+    y = rng.uniform(0, H - h)
+    btns.append(cc.Button(i, x, y, x + w, y + h))
+  jstks = [cc.Joystick(n + i, rng.uniform(0, W), rng.uniform(0, H),
+                       rng.uniform(40, 150)) for i in range(max(1, n // 10))]
+  pads = [cc.JoystickPad(2*n + i, 0, H*i/4, W/2, H*(i+1)/4, 60)
+          for i in range(max(2, n // 50))]
+  return pnls, btns, jstks, pads
+
+
+def make_layout(n, rng):
+  return cc.CtlrCfg(*make_elements(n, rng))
+
+
+# copies of the elements sharing their attribute values, as the slotted
+# classes or as ordinary objects with a __dict__
+def copies(kinds, slotted):
+  ret = []
+  for elems in kinds:
+    for e in elems:
+      p = object.__new__(type(e)) if slotted else Plain()
+      for attr in type(e).__slots__:
+        setattr(p, attr, getattr(e, attr))
+      ret.append(p)
+  return ret
+
+
+def allocated(fn):
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  obj = fn()
+  size = tracemalloc.get_traced_memory()[0] - before
+  tracemalloc.stop()
+  return obj, size
+
+
+def loop_rows(cfg, kind, height):
+  return [cfgarrays.flip_elem(kind, e, height) for e in getattr(cfg, kind)]
+
+
+# scaling has to rebuild the hit grid either way
+def loop_scale(cfg, sx, sy):
+  r = min(sx, sy)
+  for e in cfg.panels + cfg.buttons:
+    e.x1 *= sx
+    e.x2 *= sx
+    e.y1 *= sy
+    e.y2 *= sy
+  for e in cfg.joysticks:
+    e.x *= sx
+    e.y *= sy
+    e.r *= r
+  for e in cfg.joystickpads:
+    e.x1 *= sx
+    e.x2 *= sx
+    e.y1 *= sy
+    e.y2 *= sy
+    e.r *= r
+  cfg.reindex()
+
+
+def loop_bounds(cfg):
+  boxes = [(e.x1, e.y1, e.x2, e.y2)
+           for e in cfg.panels + cfg.buttons + cfg.joystickpads]
+  boxes += [(e.x - e.r, e.y - e.r, e.x + e.r, e.y + e.r) for e in cfg.joysticks]
+  return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+          max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def best_of(fn, repeat=5):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    t = time.perf_counter() - start
+    best = t if best is None or t < best else best
+  return best * 1e3
+
+
+def close(a, b):
+  return all(abs(p - q) < 1e-6 for p, q in zip(a, b))
+
+
+if __name__ == '__main__':
+  print('coordinate arrays: ' + ('numpy' if cfgarrays.numpy else 'array'))
+  print('elements  slots KB  dict KB   flip ms loop/arr   bounds ms loop/arr'
+        '   scale ms')
+  for n in (100, 1000, 5000, 20000):
+    rng = random.Random(n)
+    kinds = make_elements(n, rng)
+    elems, slotted = allocated(lambda: copies(kinds, True))
+    del elems
+    elems, dicts = allocated(lambda: copies(kinds, False))
+    count = len(elems)
+    del elems
+    cfg = cc.CtlrCfg(*kinds)
+
+    for kind in cc.ELEMENT_KINDS:
+      for a, b in zip(cfg.screen_rows(kind, H), loop_rows(cfg, kind, H)):
+        assert close(a, b)
+    flip_loop = best_of(lambda: [loop_rows(cfg, k, H) for k in cc.ELEMENT_KINDS])
+    flip_arr = best_of(lambda: [cfg.screen_rows(k, H) for k in cc.ELEMENT_KINDS])
+
+    assert close(cfg.bounds(), loop_bounds(cfg))
+    bounds_loop = best_of(lambda: loop_bounds(cfg))
+    bounds_arr = best_of(lambda: cfg.bounds())
+
+    # scale up and back down so every repeat starts from the same layout
+    other = make_layout(n, random.Random(n))
+    loop_scale(other, 1.25, 0.8)
+    cfg.scale(1.25, 0.8)
+    for kind in cc.ELEMENT_KINDS:
+      for a, b in zip(getattr(cfg, kind), getattr(other, kind)):
+        assert close(a.geometry(), b.geometry())
+      for a, b in zip(cfg.screen_rows(kind, H), loop_rows(cfg, kind, H)):
+        assert close(a, b)
+    assert close(cfg.bounds(), loop_bounds(cfg))
+    for _ in range(200):
+      x, y = rng.uniform(0, W * 1.25), rng.uniform(0, H * 0.8)
+      assert cfg.get_element_containing_point(x, y) == \
+        cfg.scan_element_containing_point(x, y)
+    scale = best_of(lambda: (cfg.scale(2, 2), cfg.scale(0.5, 0.5)), 3) / 2
+
+    print('%8d  %8.0f  %7.0f   %6.2f / %-6.2f   %6.3f / %-6.3f   %8.2f' %
+          (count, slotted / 1024, dicts / 1024, flip_loop, flip_arr,
+           bounds_loop, bounds_arr, scale))
@@ -0,0 +1,64 @@
+# Cost of the metrics hooks: per-frame engine time with metrics off and on
+# (the bench.engine touch streams against the stand-in), and the guard on
+# its own. Checks the snapshot has round trips, encode times and traffic per
+# message and datum type, and that its storage stays bounded.
+# Run from the repo root: python -m bench.metrics
+import argparse
+import timeit
+
+import metrics
+import standin
+import udpchan
+from bench import engine as engine_bench
+
+
+def per_frame_us(port, scenario, frames):
+  times, _, _ = engine_bench.run(port, scenario, frames, False)
+  return sum(times) / len(times) * 1e6
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--frames', type=int, default=3000)
+  args = parser.parse_args()
+  n = 2000000
+  guard = min(timeit.repeat('if metrics.ENABLED: pass', number=n, repeat=3,
+                            globals={'metrics': metrics}))
+  print('disabled guard: %.1f ns' % (guard / n * 1e9))
+
+  server = standin.StandInServer(compact=True).start()
+  print('%-7s %12s %12s' % ('touches', 'off us', 'on us'))
+  for scenario in ('idle', 'sticks', 'taps'):
+    metrics.disable()
+    off = per_frame_us(server.port, scenario, args.frames)
+    metrics.enable()
+    on = per_frame_us(server.port, scenario, args.frames)
+    print('%-7s %12.1f %12.1f' % (scenario, off, on))
+  # stick Moves sent as datagrams are counted too
+  server.stop()
+  server = standin.StandInServer(udp=True).start()
+  per_frame_us(server.port, 'sticks', 300)
+  metrics.disable()
+  server.stop()
+
+  snap = metrics.snapshot()
+  counters = snap['counters']
+  hists = snap['histograms']
+  assert counters['conn.bytes_out'] > 0 and counters['conn.bytes_in'] > 0
+  assert counters['packets.ControlPacket.Press'] > 0
+  assert counters['packets.CompactMove'] > 0
+  assert counters['sticks.emitted'] > 0 and counters['sticks.suppressed'] > 0
+  assert counters['packets.UdpMove'] > 0
+  assert (counters['bytes.UdpMove'] ==
+          counters['packets.UdpMove'] * udpchan.DATAGRAM_LEN)
+  assert hists['rtt.Dimensions']['count'] > 0
+  assert hists['rtt.CompactMove']['p50'] is not None
+  assert hists['encode.touch_moved']['count'] > 0
+  assert hists['conn.recv_wait']['count'] > 0
+  assert len(metrics.NOTES) <= metrics.NOTE_RING
+  assert all(len(h.buckets) == len(h.bounds) + 1
+             for h in metrics.HISTOGRAMS.values())
+  print('%d counters, %d histograms, %d notes kept' %
+        (len(counters), len(hists), len(metrics.NOTES)))
+  metrics.NOTES.clear()
+  metrics.dump()
@@ -0,0 +1,74 @@
+# Memory allocated per event for the constant packets: Button press and
+# release, the centred stick Move and Heartbeat, built through CtoS objects
+# as the client used to, through packet_to_bytes, and taken from the bytes
+# each element precomputes. Every result is kept alive so what an event
+# allocates shows up in tracemalloc. Run from the repo root:
+# python -m bench.packets
+import argparse
+import time
+import tracemalloc
+
+import ctlrcfg as cc
+
+
+def ctos_packet(elem_id, datum_type):
+  return cc.CtoS(cc.CONTROL_PACKET, 0, 0, cc.ControlPacket(
+    elem_id, cc.ControlDatum(datum_type, 0, 0))).to_bytes()
+
+
+def measure(fn, events):
+  out = [None] * events
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  start = time.perf_counter()
+  for i in range(events):
+    out[i] = fn()
+  elapsed = time.perf_counter() - start
+  grown = tracemalloc.get_traced_memory()[0] - before
+  tracemalloc.stop()
+  return out[0], grown / events, elapsed / events * 1e9
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--events', type=int, default=100000)
+  args = parser.parse_args()
+  btn = cc.Button(7, 0, 0, 10, 10)
+  jstk = cc.Joystick(8, 50, 50, 20)
+  pad = cc.JoystickPad(9, 0, 0, 100, 100, 20)
+
+  def stick_release(elem):
+    # off centre first so the release is not suppressed
+    elem.sent_level = (1, 1)
+    return elem.datum_from_TE(0, 0)
+
+  cases = [
+    ('press', lambda: ctos_packet(7, cc.PRESS),
+     lambda: cc.packet_to_bytes(7, cc.PRESS, 0, 0),
+     lambda: btn.datum_from_TB(0, 0)),
+    ('release', lambda: ctos_packet(7, cc.RELEASE),
+     lambda: cc.packet_to_bytes(7, cc.RELEASE, 0, 0),
+     lambda: btn.datum_from_TE(0, 0)),
+    ('stick centre', lambda: ctos_packet(8, cc.MOVE),
+     lambda: cc.packet_to_bytes(8, cc.MOVE, 0, 0),
+     lambda: stick_release(jstk)),
+    ('pad centre', lambda: ctos_packet(9, cc.MOVE),
+     lambda: cc.packet_to_bytes(9, cc.MOVE, 0, 0),
+     lambda: stick_release(pad)),
+    ('heartbeat', lambda: cc.CtoS(cc.MSG_TYPES['Heartbeat'], 0, 0, None).to_bytes(),
+     lambda: cc.CTOS_STRUCT.pack(cc.MSG_TYPES['Heartbeat'], 0, 0, 0, 0, 0, 0, 0),
+     lambda: cc.HEARTBEAT_BYTES),
+  ]
+  print('bytes kept and ns per event, timed under tracemalloc')
+  print('%-13s %22s %22s %22s' % ('event', 'CtoS objects', 'packet_to_bytes',
+                                  'precomputed'))
+  rows = []
+  for name, *fns in cases:
+    results = [measure(fn, args.events) for fn in fns]
+    assert len(set(r[0] for r in results)) == 1
+    rows.append((name, results))
+  for name, results in rows:
+    print('%-13s' % name + ''.join('%13.1f B %6.0f ns' % (b, ns)
+                                   for _, b, ns in results))
+  # well under one packet per event once the fixed costs are spread out
+  assert all(results[2][1] < 8 for _, results in rows)
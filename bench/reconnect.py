@@ -0,0 +1,129 @@
+# Time to detect a lost server and be back in business with the config
+# restored, for a server restart and for a server that stops answering.
+# Drives the client engine headless at 60 ticks/s, and checks no update()
+# blocks while the port only takes connections that never complete.
+# Run from the repo root: python -m bench.reconnect
+import socket
+import time
+
+import cfgcache
+import engine
+import standin
+import window
+
+TICK = 1 / 60
+
+
+# the client engine with nothing drawn, noting when configs arrive and when
+# the connection was declared lost
+class HeadlessLink(engine.Engine):
+  def __init__(self, port):
+    engine.Engine.__init__(self, '127.0.0.1', port, 1024, 768,
+                           cache=cfgcache.CfgCache())
+    self.config_at = None
+    self.dropped_at = None
+    self.longest_update = 0
+
+  def handle_reply(self, seq, code, payload):
+    engine.Engine.handle_reply(self, seq, code, payload)
+    if code == window.STOC_STRING_SPEC:
+      self.config_at = time.monotonic()
+
+  def connection_lost(self, err):
+    engine.Engine.connection_lost(self, err)
+    self.dropped_at = self.lost_at
+    self.config_at = None
+
+  def run_until(self, cond, limit=15):
+    end = time.monotonic() + limit
+    while not cond() and time.monotonic() < end:
+      start = time.monotonic()
+      self.update()
+      self.longest_update = max(self.longest_update, time.monotonic() - start)
+      time.sleep(TICK)
+    return cond()
+
+
+def restart(port, downtime):
+  server = standin.StandInServer(port=port).start()
+  link = HeadlessLink(server.port)
+  link.start()
+  link.run_until(lambda: link.config_at is not None)
+  link.run_until(lambda: False, 0.3)
+  stopped = time.monotonic()
+  server.stop()
+  link.run_until(lambda: False, downtime)
+  server = standin.StandInServer(port=port).start()
+  restarted = time.monotonic()
+  link.run_until(lambda: link.config_at is not None and link.config_at > restarted)
+  server.stop()
+  return link.dropped_at - stopped, link.config_at - restarted
+
+
+def hung(port):
+  server = standin.StandInServer(port=port).start()
+  link = HeadlessLink(server.port)
+  link.start()
+  link.run_until(lambda: link.config_at is not None)
+  link.run_until(lambda: False, 0.5) # let a few heartbeats measure the RTT
+  server.silent = True
+  hung_at = time.monotonic()
+  link.run_until(lambda: link.dropped_at is not None)
+  detect = link.dropped_at - hung_at
+  server.silent = False
+  link.run_until(lambda: link.config_at is not None)
+  restored = link.config_at - hung_at
+  server.stop()
+  return detect, restored
+
+
+# a listener that never accepts, with its backlog already full, so further
+# connects hang until they time out
+def stuck_listener(port):
+  lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  lsock.bind(('127.0.0.1', port))
+  lsock.listen(0)
+  fillers = []
+  for i in range(4):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.connect_ex(('127.0.0.1', port))
+    fillers.append(sock)
+  return [lsock] + fillers
+
+
+def stuck(port, downtime):
+  server = standin.StandInServer(port=port).start()
+  link = HeadlessLink(server.port)
+  link.start()
+  link.run_until(lambda: link.config_at is not None)
+  server.stop()
+  link.run_until(lambda: link.dropped_at is not None)
+  socks = stuck_listener(port)
+  link.longest_update = 0
+  link.run_until(lambda: False, downtime)
+  longest = link.longest_update
+  for sock in socks:
+    sock.close()
+  server = standin.StandInServer(port=port).start()
+  restarted = time.monotonic()
+  link.run_until(lambda: link.config_at is not None)
+  server.stop()
+  return longest, link.config_at - restarted
+
+
+if __name__ == '__main__':
+  port = 50179
+  for downtime in (0.0, 0.5, 2.0):
+    detect, back = restart(port, downtime)
+    print('server restart, %.1f s down: detected after %.0f ms, '
+          'config restored %.0f ms after restart' %
+          (downtime, detect * 1e3, back * 1e3))
+  detect, restored = hung(port)
+  print('silent server: detected after %.0f ms, config restored after %.0f ms' %
+        (detect * 1e3, restored * 1e3))
+  longest, back = stuck(port, 2.5)
+  print('connects hanging for 2.5 s: longest update %.1f ms, config restored '
+        '%.0f ms after the server came back' % (longest * 1e3, back * 1e3))
+  assert longest < engine.CONNECT_TIMEOUT / 2
@@ -0,0 +1,99 @@
+# Records a synthetic session (handshake, button presses, two sticks sent
+# as CompactMoves and Batches, MoveFences) against the stand-in, then replays
+# the log at the recorded speed, 4x and flat out. Checks every recorded frame
+# but the fences reaches the server and the 1x replay keeps the recorded
+# timing.
+# Run from the repo root: python -m bench.replay
+import argparse
+import os
+import tempfile
+import time
+
+import common
+import ctlrcfg as cc
+import recorder
+import replay
+import standin
+import udpchan
+import window
+
+
+def record(path, frames):
+  server = standin.StandInServer(compact=True).start()
+  conn = common.Conn()
+  conn.connect('127.0.0.1', server.port)
+  sender = window.WindowedSender(conn, 8)
+  rec = recorder.Recorder(path)
+  sender.recorder = rec
+  sender.send(cc.CtoS(cc.MSG_TYPES['Dimensions'], 1024, 768,
+                      cc.ControlPacket(0, None),
+                      caps=cc.CAP_COMPACT_MOVES | cc.CAP_BATCH).to_bytes())
+  sender.drain()
+  btn = cc.Button(1, 0, 0, 10, 10)
+  batcher = cc.BatchEncoder()
+  # a fence as an engine with UDP Moves records it
+  fence = cc.CTOS_STRUCT.pack(udpchan.MOVE_FENCE, 4, 1, 0, 0, 0, 0, 0)
+  sent = 1
+  fences = 0
+  for i in range(frames):
+    x = (i % 200) / 100 - 1
+    if i % 3 == 0:
+      sender.send_many([cc.compact_move(4, x, -x), cc.compact_move(5, -x, x)])
+      sent += 2
+    elif i % 3 == 1:
+      sender.send(batcher.encode([cc.packet_to_bytes(4, cc.MOVE, x, 0.5),
+                                  btn.press_bytes, btn.release_bytes]))
+      sent += 1
+    elif i % 30 == 2:
+      sender.send(fence)
+      sent += 1
+      fences += 1
+    else:
+      sender.send(cc.HEARTBEAT_BYTES)
+      sent += 1
+    sender.poll()
+    if i % 20 == 0:
+      time.sleep(0.002)
+  sender.drain()
+  rec.close()
+  conn.close()
+  server.stop()
+  assert server.frames == sent
+  return sent, fences
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--frames', type=int, default=3000)
+  args = parser.parse_args()
+  path = os.path.join(tempfile.mkdtemp(), 'session.ctlrec')
+  sent, fences = record(path, args.frames)
+  log = recorder.LogReader(path)
+  print('recorded %d frames in %d records (%d bytes)' %
+        (sent, log.count, os.path.getsize(path)))
+  for speed in (1, 4, 0):
+    server = standin.StandInServer(compact=True).start()
+    report = replay.replay(log, '127.0.0.1', server.port, speed)
+    server.stop()
+    # none of these servers take datagrams, so the MoveFences stay behind
+    kept = sent - fences
+    assert report['frames'] == kept and server.frames == kept
+    if speed == 1:
+      assert report['elapsed_s'] >= 0.9 * report['recorded_s']
+    print('speed %-4s %6d frames in %6.3f s (recorded %.3f s): %8.0f frames/s, '
+          'rtt p50 %.3f ms p99 %.3f ms' %
+          (speed or 'max', report['frames'], report['elapsed_s'],
+           report['recorded_s'], report['frames_per_s'],
+           report['rtt_p50_ms'], report['rtt_p99_ms']))
+  # a server without CompactMove or Batch support gets ControlPackets
+  # instead; each recorded Batch holds 3
+  server = standin.StandInServer(batch=False).start()
+  report = replay.replay(log, '127.0.0.1', server.port, 0)
+  server.stop()
+  batches = (args.frames + 1) // 3
+  assert server.batches == 0
+  assert server.frames == report['frames'] == sent - fences + 2 * batches
+  print('replayed against a server without CompactMoves or Batches: %d frames' %
+        server.frames)
+  log.close()
+  os.remove(path)
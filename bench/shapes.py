@@ -0,0 +1,147 @@
+# ui.Path and ShapeNode constructions per layout change for the scene
+# renderer, with the shape cache and node pool off and on. Stub scene and ui
+# modules stand in for Pythonista and count what gets built. The engine
+# applies a run of config pushes that move, add and remove a few of many
+# same-sized buttons, then redraws the whole layout a few times.
+# Run from the repo root: python -m bench.shapes
+import argparse
+import sys
+import time
+import types
+
+PATHS = {'built': 0}
+NODES = {'built': 0}
+
+
+class Path:
+  def __init__(self, *args):
+    PATHS['built'] += 1
+    self.args = args
+
+  @classmethod
+  def rounded_rect(cls, x, y, w, h, r):
+    return cls('rounded_rect', w, h, r)
+
+  @classmethod
+  def rect(cls, x, y, w, h):
+    return cls('rect', w, h)
+
+  @classmethod
+  def oval(cls, x, y, w, h):
+    return cls('oval', w, h)
+
+
+class ShapeNode:
+  def __init__(self, path, fill_color):
+    NODES['built'] += 1
+    self.path = path
+    self.fill_color = fill_color
+    self.position = (0, 0)
+    self.alpha = 1
+    self.z_position = 0
+    self.parent = None
+
+  def remove_from_parent(self):
+    if self.parent is not None:
+      self.parent.children.remove(self)
+      self.parent = None
+
+
+class Size:
+  def __init__(self, x, y):
+    self.x = x
+    self.y = y
+
+
+class StubScene:
+  def __init__(self, w, h):
+    self.size = Size(w, h)
+    self.children = []
+
+  def add_child(self, node):
+    node.parent = self
+    self.children.append(node)
+
+
+ui_stub = types.ModuleType('ui')
+ui_stub.Path = Path
+scene_stub = types.ModuleType('scene')
+scene_stub.ShapeNode = ShapeNode
+scene_stub.__all__ = ['ShapeNode']
+sys.modules.setdefault('ui', ui_stub)
+sys.modules.setdefault('scene', scene_stub)
+
+import cfgarrays
+import cfgcache
+import ctlrcfg as cc
+import engine
+import scene_render
+
+W = 1024
+H = 768
+SIZES = [(80, 80), (120, 60), (60, 120)]
+
+
+# a grid of buttons in three sizes; push i shifts every fifth button and
+# swaps a few in and out
+def layout_spec(i, n):
+  pnls = '0,0,0,%d,%d,4286611584;' % (W, H)
+  btns = ''
+  for b in range(n):
+    if (b + i) % 17 == 0:
+      continue
+    w, h = SIZES[b % len(SIZES)]
+    x = (b % 8) * 125 + (10 if b % 5 == i % 5 else 0)
+    y = (b // 8) * 125
+    btns += '%d,%d,%d,%d,%d;' % (b + 1, x, y, w, h)
+  jstks = '%d,800,200,150;%d,200,500,150;' % (n + 1, n + 2)
+  pads = '%d,400,400,300,300,80;' % (n + 3)
+  return pnls + ']' + btns + ']' + jstks + ']' + pads
+
+
+def run(shapes, pushes, redraws, n):
+  PATHS['built'] = 0
+  NODES['built'] = 0
+  scene = StubScene(W, H)
+  renderer = scene_render.SceneRenderer(scene, shapes)
+  eng = engine.Engine('127.0.0.1', 0, W, H, renderer, cache=cfgcache.CfgCache())
+  eng.apply_config(cc.CtlrCfg.from_str(layout_spec(0, n)))
+  first = (PATHS['built'], NODES['built'])
+  start = time.perf_counter()
+  for i in range(1, pushes + 1):
+    eng.apply_config(cc.CtlrCfg.from_str(layout_spec(i, n)))
+  for _ in range(redraws):
+    renderer.show_config(eng.config)
+  elapsed = time.perf_counter() - start
+  changes = pushes + redraws
+  on_screen = sum(len(e.nodes) for kind in cc.ELEMENT_KINDS
+                  for e in getattr(eng.config, kind))
+  assert on_screen == len(scene.children)
+  # pooled nodes were moved to where their new element is
+  for btn in eng.config.buttons:
+    x1, y1, x2, y2 = cfgarrays.flip_elem('buttons', btn, H)
+    w = x2 - x1
+    h = y2 - y1
+    assert btn.nodes[0].position == (scene_render.SPACE + x1 + w/2,
+                                     scene_render.SPACE + y1 + h/2)
+  return (first, (PATHS['built'] - first[0]) / changes,
+          (NODES['built'] - first[1]) / changes, elapsed / changes * 1e3)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--buttons', type=int, default=48)
+  parser.add_argument('--pushes', type=int, default=200)
+  parser.add_argument('--redraws', type=int, default=20)
+  args = parser.parse_args()
+  print('%-10s %15s %15s %15s %10s' % ('cache', 'first paths', 'paths/change',
+                                       'nodes/change', 'ms/change'))
+  results = {}
+  for name, shapes in (('off', scene_render.ShapeCache(0, 0)),
+                       ('on', scene_render.ShapeCache())):
+    first, paths, nodes, ms = run(shapes, args.pushes, args.redraws,
+                                  args.buttons)
+    results[name] = (paths, nodes)
+    print('%-10s %15d %15.2f %15.2f %10.3f' % (name, first[0], paths, nodes, ms))
+  assert results['on'][0] < results['off'][0]
+  assert results['on'][1] < results['off'][1]
@@ -0,0 +1,99 @@
+# Loopback round trip latency for each Conn tuning option against the
+# stand-in server. Each round sends a Move and a Press back to back and
+# waits for both replies, the write-write-read pattern where Nagle and
+# delayed ACKs interact. Run from the repo root: python -m bench.sockopts
+import argparse
+import socket
+import threading
+import time
+
+import common
+import ctlrcfg as cc
+import standin
+import window
+
+OPTIONS = [
+  ('nagle', {'nodelay': False}),
+  ('nodelay', {'nodelay': True}),
+  ('nodelay+quickack', {'nodelay': True, 'quickack': True}),
+  ('4k buffers', {'nodelay': True, 'sndbuf': 4096, 'rcvbuf': 4096}),
+  ('keepalive 5s', {'nodelay': True, 'keepalive': 5}),
+]
+
+
+def percentile(sorted_vals, p):
+  return sorted_vals[min(len(sorted_vals) - 1, int(p * len(sorted_vals)))]
+
+
+def run(port, tuning, rounds):
+  conn = common.Conn()
+  conn.tune(**tuning)
+  conn.connect('127.0.0.1', port)
+  sender = window.WindowedSender(conn, 2)
+  sender.send(cc.CtoS(cc.MSG_TYPES['Dimensions'], 1024, 768,
+                      cc.ControlPacket(0, None)).to_bytes())
+  sender.drain()
+  btn = cc.Button(1, 0, 0, 10, 10)
+  rtts = []
+  for i in range(rounds):
+    start = time.perf_counter()
+    sender.send(cc.packet_to_bytes(4, cc.MOVE, (i % 200) / 100 - 1, 0.5))
+    sender.send(btn.release_bytes)
+    sender.drain()
+    rtts.append(time.perf_counter() - start)
+  conn.close()
+  rtts.sort()
+  return rtts
+
+
+def discard(lsock):
+  sock, addr = lsock.accept()
+  while sock.recv(1 << 20):
+    pass
+  sock.close()
+
+
+# joining buffers into one send against sendmsg, for a few CompactMoves and
+# for a few config sized payloads; send_frames picks by size
+def send_path(rounds):
+  lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  lsock.bind(('127.0.0.1', 0))
+  lsock.listen(1)
+  sink = threading.Thread(target=discard, args=(lsock,), daemon=True)
+  sink.start()
+  conn = common.Conn()
+  conn.connect('127.0.0.1', lsock.getsockname()[1])
+  small = [cc.compact_move(4, i / 10, -i / 10) for i in range(4)]
+  large = [bytes(8192) for i in range(4)]
+  times = []
+  for label, frames in (('4 CompactMoves', small), ('4 x 8 KB', large)):
+    for name, fn in (('joined', lambda: conn.send_bytes(b''.join(frames))),
+                     ('sendmsg', lambda: conn.sock.sendmsg(frames)),
+                     ('send_frames', lambda: conn.send_frames(frames))):
+      start = time.perf_counter()
+      for _ in range(rounds):
+        fn()
+      times.append((label, name, (time.perf_counter() - start) / rounds * 1e6))
+  conn.close()
+  sink.join()
+  lsock.close()
+  return times
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--rounds', type=int, default=2000)
+  args = parser.parse_args()
+  server = standin.StandInServer(compact=True).start()
+  print('%-18s %9s %9s %9s' % ('option', 'p50 us', 'p99 us', 'max us'))
+  results = {}
+  for name, tuning in OPTIONS:
+    rtts = run(server.port, tuning, args.rounds)
+    results[name] = rtts
+    print('%-18s %9.0f %9.0f %9.0f' % (name, percentile(rtts, 0.5) * 1e6,
+                                       percentile(rtts, 0.99) * 1e6,
+                                       rtts[-1] * 1e6))
+  assert server.packets == 2 * args.rounds * len(OPTIONS)
+  server.stop()
+  for label, name, us in send_path(args.rounds):
+    print('%-15s %-12s %7.2f us per call' % (label, name, us))
@@ -0,0 +1,92 @@
+# StringSpec text versus the binary config: payload size and parse time,
+# and a check that both decode to the same CtlrCfg, for layouts in whole
+# pixels and with fractional coordinates. Run from the repo root:
+#   python -m bench.spec
+import random
+import time
+
+import ctlrcfg as cc
+import standin
+
+
+def make_spec(n, rng, whole=False):
+  def num():
+    if whole:
+      return str(rng.randrange(2000))
+    return str(round(rng.uniform(0, 2000), rng.choice([0, 1, 2, 6])))
+  parts = [[], [], [], []]
+  for i in range(n):
+    kind = 1 if i % 10 < 7 else i % 4
+    if kind == 0:
+      parts[0].append(','.join([str(i), num(), num(), num(), num(),
+                                str(rng.randrange(1 << 32))]))
+    elif kind == 1:
+      parts[1].append(','.join([str(i), num(), num(), num(), num()]))
+    elif kind == 2:
+      parts[2].append(','.join([str(i), num(), num(), num()]))
+    else:
+      parts[3].append(','.join([str(i), num(), num(), num(), num(), num()]))
+  return ']'.join(''.join(e + ';' for e in p) for p in parts)
+
+
+# the format cost alone, without building element objects
+def fields_from_text(text):
+  return [[[float(f) for f in e.split(',')] for e in part.split(';')[:-1]]
+          for part in text.decode('utf-8').split(']')]
+
+
+def fields_from_bin(binary):
+  view = memoryview(binary)
+  magic, version, fmt, *counts = cc.BIN_HEADER.unpack_from(view)
+  offset = cc.BIN_HEADER.size
+  ret = []
+  for count, record in zip(counts, cc.BIN_RECORDS[fmt]):
+    end = offset + count * record.size
+    ret.append(list(record.iter_unpack(view[offset:end])))
+    offset = end
+  return ret
+
+
+def best(fn, arg, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn(arg)
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+
+if __name__ == '__main__':
+  rng = random.Random(8)
+  print('coords    elements  text bytes  bin bytes  from_str ms  from_bin ms' +
+        '  text fields ms  bin fields ms')
+  for whole in (True, False):
+    for n in (10, 100, 1000, 10000):
+      text = make_spec(n, rng, whole).encode()
+      cfg = cc.CtlrCfg.from_str(text.decode('utf-8'))
+      binary = cfg.to_bin()
+      assert cc.CtlrCfg.from_bin(binary).same_layout(cfg)
+      fmt = cc.BIN_HEADER.unpack_from(binary)[2]
+      repeat = 20 if n < 10000 else 5
+      t_text = best(lambda b: cc.CtlrCfg.from_str(b.decode('utf-8')), text, repeat)
+      t_bin = best(cc.CtlrCfg.from_bin, binary, repeat)
+      f_text = best(fields_from_text, text, repeat)
+      f_bin = best(fields_from_bin, binary, repeat)
+      print('%-6s  %10d  %10d  %9d  %11.3f  %11.3f  %14.3f  %13.3f' %
+            ('whole' if whole else 'frac', n, len(text), len(binary),
+             t_text * 1e3, t_bin * 1e3, f_text * 1e3, f_bin * 1e3))
+      if n >= 100:
+        assert t_bin < t_text
+      if whole:
+        assert fmt == b'h' and len(binary) < len(text)
+  # the stand-in layout, as the controller gets it
+  text = standin.DEFAULT_SPEC.encode()
+  binary = cc.CtlrCfg.from_str(standin.DEFAULT_SPEC).to_bin()
+  print('stand-in layout: %d bytes as text, %d binary' % (len(text), len(binary)))
+  # anything else is refused
+  for bad in (binary[:10], b'XXXX' + binary[4:], binary[:4] + b'\x02' + binary[5:]):
+    try:
+      cc.CtlrCfg.from_bin(bad)
+    except SystemExit:
+      continue
+    raise AssertionError('accepted a bad binary config')
@@ -0,0 +1,47 @@
+# Move packets emitted for a jittery 120 Hz thumb on a Joystick and a
+# JoystickPad, for a few quantization settings. Every sample used to send a
+# packet. Run from the repo root: python -m bench.sticks
+import math
+import random
+
+import ctlrcfg as cc
+
+
+def thumb_path(rng, cx, cy, r, samples):
+  # slow circles with long rests and sub-pixel sensor noise
+  points = []
+  for i in range(samples):
+    phase = i / samples * 6 * math.pi
+    radius = r * (0.8 if (i // 240) % 2 else 0.1)
+    if (i // 120) % 3 == 0:
+      phase = 0
+    points.append((cx + radius * math.cos(phase) + rng.gauss(0, 0.3),
+                   cy + radius * math.sin(phase) + rng.gauss(0, 0.3)))
+  return points
+
+
+def run(step, dead_zone, samples=12000):
+  rng = random.Random(11)
+  jstk = cc.Joystick(1, 200, 200, 100)
+  pad = cc.JoystickPad(2, 400, 0, 800, 400, 80)
+  for e in (jstk, pad):
+    e.set_quantization(step, dead_zone)
+  sent = 0
+  for elem, (cx, cy), r in ((jstk, (200, 200), 100), (pad, (600, 200), 80)):
+    path = thumb_path(rng, cx, cy, r, samples)
+    for i, (x, y) in enumerate(path):
+      if i % 600 == 0:
+        sent += elem.datum_from_TB(x, y) is not None
+      elif i % 600 == 599:
+        sent += elem.datum_from_TE(x, y) is not None
+      else:
+        sent += elem.datum_from_TM(x, y) is not None
+  return 2 * samples, sent
+
+
+if __name__ == '__main__':
+  print('step   dead zone  samples  packets  saved')
+  for step, dead_zone in ((0.01, 0.0), (0.01, 0.05), (0.02, 0.05), (0.05, 0.1)):
+    samples, sent = run(step, dead_zone)
+    print('%.2f   %9.2f  %7d  %7d  %4.0f%%' %
+          (step, dead_zone, samples, sent, 100 * (samples - sent) / samples))
@@ -0,0 +1,241 @@
+# UDP Move side channel through a relay that drops and reorders datagrams.
+# Checks the stand-in accepts exactly the datagrams that are newer than
+# everything already seen for their element, while Press/Release still
+# arrive over TCP. Then drives a joystick through the engine over the same
+# lossy relay and checks every release leaves the stick centred on the
+# server, that a held stick whose last datagram was lost is resent, and that
+# with every datagram dropped the engine keeps its Moves on TCP.
+# Run from the repo root: python -m bench.udp
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+
+import cfgcache
+import coalesce
+import common
+import ctlrcfg as cc
+import engine
+import standin
+import udpchan
+import window
+
+
+class LossyRelay:
+  def __init__(self, dest_port, loss, reorder, seed=3):
+    self.dest = ('127.0.0.1', dest_port)
+    self.loss = loss
+    self.reorder = reorder
+    self.rng = random.Random(seed)
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.sock.bind(('127.0.0.1', 0))
+    self.sock.settimeout(0.2)
+    self.port = self.sock.getsockname()[1]
+    self.out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.forwarded = [] # datagrams in the order the server gets them
+    self.dropped = 0
+    self.held = []
+    self.running = True
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def forward(self, datagram):
+    self.forwarded.append(datagram)
+    self.out.sendto(datagram, self.dest)
+
+  def run(self):
+    while self.running:
+      try:
+        datagram = self.sock.recv(2048)
+      except socket.timeout:
+        continue
+      if self.rng.random() < self.loss:
+        self.dropped += 1
+        continue
+      if self.rng.random() < self.reorder:
+        # hold it back until a few later datagrams have gone past
+        self.held.append([self.rng.randint(1, 5), datagram])
+        continue
+      self.forward(datagram)
+      for entry in self.held:
+        entry[0] -= 1
+      for entry in [e for e in self.held if e[0] <= 0]:
+        self.held.remove(entry)
+        self.forward(entry[1])
+
+  # sends the held datagrams; only while nothing is being relayed
+  def flush(self):
+    held, self.held = self.held, []
+    for entry in held:
+      self.forward(entry[1])
+
+  def stop(self):
+    self.running = False
+    self.thread.join()
+    self.flush()
+
+
+def expected_accepts(datagrams):
+  newest = {}
+  count = 0
+  for d in datagrams:
+    elem_id = struct.unpack_from('<i', d, 8)[0]
+    seq = struct.unpack_from('<i', d, udpchan.SEQ_OFFSET)[0]
+    if elem_id not in newest or seq > newest[elem_id]:
+      newest[elem_id] = seq
+      count += 1
+  return count
+
+
+def run_engine(eng, seconds):
+  stop_at = time.monotonic() + seconds
+  while time.monotonic() < stop_at:
+    eng.update()
+    time.sleep(0.005)
+
+
+# an engine on the stand-in whose datagrams go through a relay, once the
+# server has reported one of them unless the relay drops everything;
+# returns (server, relay, engine, token)
+def relayed_engine(loss, reorder, H):
+  server = standin.StandInServer(udp=True).start()
+  relay = LossyRelay(server.port, loss, reorder)
+  eng = engine.Engine('127.0.0.1', server.port, 1024, H,
+                      cache=cfgcache.CfgCache())
+  assert eng.start()
+  # the UDP sender, made when the Caps reply is handled, sends to the port
+  # the engine connected to
+  eng.port = relay.port
+  while eng.config is None or eng.udp is None:
+    eng.update()
+    time.sleep(0.001)
+  if loss < 1:
+    while not eng.udp.confirmed:
+      eng.update()
+      time.sleep(0.001)
+  token, = udpchan.DATAGRAM_HEADER.unpack_from(eng.udp.buf)
+  return server, relay, eng, token
+
+
+# the Move the server holds for an element, without its sequence number
+def server_move(server, token, elem_id):
+  return server.latest_moves[(token, elem_id)][:cc.SEQ_OFFSET]
+
+
+# touch sweeps on the stand-in layout's joystick (elem 4 at 800, 200, r 150)
+# through the engine and the relay; returns the stick's Move on the server
+# after each release
+def stick_release(sweeps, loss, reorder, H=768):
+  server, relay, eng, token = relayed_engine(loss, reorder, H)
+  x, y = 800, H - 200
+  released = []
+  for sweep in range(sweeps):
+    eng.touch_began(1, x + 30, y)
+    for i in range(40):
+      eng.touch_moved(1, x + 30 + 2 * i, y - 3 * i)
+      eng.update()
+    eng.touch_ended(1, x + 110, y - 117)
+    eng.update()
+    eng.sender.drain()
+    # held datagrams arrive late, after the release
+    time.sleep(0.02)
+    relay.flush()
+    time.sleep(0.02)
+    released.append(server.latest_moves[(token, 4)])
+  relay.stop()
+  eng.stop()
+  server.stop()
+  return released, relay.dropped
+
+
+# pushes the joystick over and holds it there; with blocked every datagram
+# is dropped, otherwise only the one for the last move. Returns whether the
+# engine sent Moves as datagrams and whether the server ends up with the
+# held stick's Move.
+def stick_hold(blocked, H=768):
+  server, relay, eng, token = relayed_engine(1 if blocked else 0, 0, H)
+  run_engine(eng, 0.6)
+  x, y = 800, H - 200
+  eng.touch_began(1, x + 30, y)
+  for i in range(20):
+    eng.touch_moved(1, x + 30 + 3 * i, y - 2 * i)
+    eng.update()
+  time.sleep(0.02)
+  relay.loss = 1
+  eng.touch_moved(1, x + 100, y - 60)
+  eng.update()
+  time.sleep(0.02)
+  relay.loss = 1 if blocked else 0
+  jstk = eng.config.joysticks[0]
+  run_engine(eng, 2 * engine.liveness.KEEPALIVE_INTERVAL + 0.1)
+  held = server_move(server, token, 4) == cc.stick_move_bytes(jstk)[:cc.SEQ_OFFSET]
+  used_udp = eng.udp.confirmed
+  relay.stop()
+  eng.stop()
+  server.stop()
+  return used_udp, held
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--moves', type=int, default=20000)
+  parser.add_argument('--loss', type=float, default=0.1)
+  parser.add_argument('--reorder', type=float, default=0.1)
+  args = parser.parse_args()
+  server = standin.StandInServer(udp=True).start()
+  relay = LossyRelay(server.port, args.loss, args.reorder)
+  conn = common.Conn()
+  conn.connect('127.0.0.1', server.port)
+  caps = []
+  sender = window.WindowedSender(
+    conn, 8, lambda seq, code, payload: caps.append(payload)
+    if code == window.STOC_CAPS else None)
+  sender.send(cc.CtoS(cc.MSG_TYPES['Dimensions'], 1024, 768,
+                      cc.ControlPacket(0, None), caps=cc.CAP_UDP_MOVES).to_bytes())
+  sender.drain()
+  accepted_caps, token = udpchan.CAPS_PAYLOAD.unpack(caps[0])
+  assert accepted_caps & cc.CAP_UDP_MOVES
+  udp = udpchan.UdpMoveSender('127.0.0.1', relay.port, token)
+  start = time.monotonic()
+  for i in range(args.moves):
+    udp.send(cc.packet_to_bytes(4 + i % 2, cc.MOVE, (i % 200) / 100 - 1, 0.5))
+    if i % 100 == 0:
+      sender.send(cc.packet_to_bytes(1, cc.PRESS if i % 200 == 0 else cc.RELEASE, 0, 0))
+      sender.poll()
+      time.sleep(0.001)
+  sender.drain()
+  elapsed = time.monotonic() - start
+  time.sleep(0.3)
+  relay.stop()
+  time.sleep(0.3)
+  recv = server.udp_receiver
+  expect = expected_accepts(relay.forwarded)
+  print('sent %d moves in %.2f s, relay dropped %d, forwarded %d' %
+        (udp.sent, elapsed, relay.dropped, len(relay.forwarded)))
+  print('server accepted %d (expected %d), dropped %d stale' %
+        (recv.accepted, expect, recv.stale))
+  print('TCP control packets received: %d of %d' %
+        (server.packets, args.moves // 100))
+  assert recv.accepted == expect
+  assert recv.accepted + recv.stale == len(relay.forwarded)
+  assert server.packets == args.moves // 100
+  udp.close()
+  conn.close()
+  server.stop()
+
+  released, dropped = stick_release(20, args.loss, args.reorder)
+  centred = sum(1 for frame in released if coalesce.is_centre_move(frame))
+  print('stick released %d times, %d datagrams dropped; centred on the '
+        'server after %d' % (len(released), dropped, centred))
+  assert centred == len(released)
+
+  used_udp, held = stick_hold(False)
+  print('held stick after its last datagram was lost: %s on the server' %
+        ('resent' if held else 'stale'))
+  assert used_udp and held
+  used_udp, held = stick_hold(True)
+  print('every datagram dropped: Moves over %s, held stick %s on the server' %
+        ('UDP' if used_udp else 'TCP', 'current' if held else 'stale'))
+  assert not used_udp and held
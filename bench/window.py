@@ -0,0 +1,55 @@
+# Packets/s versus window size against the stand-in server with injected
+# reply latency. Run from the repo root: python -m bench.window
+import argparse
+import time
+
+import common
+import ctlrcfg as cc
+import standin
+import window
+
+
+def move_bytes(i):
+  x = (i % 200 - 100) / 100
+  return cc.CtoS(cc.MSG_TYPES['ControlPacket'], 0, 0, cc.ControlPacket
+                 (4, cc.ControlDatum(cc.DATUM_TYPES['Move'], x, -x))).to_bytes()
+
+
+def run(port, window_size, duration, nagle):
+  conn = common.Conn()
+  # with Nagle every packet after the first in flight is held back
+  conn.tune(nodelay=not nagle)
+  conn.connect('127.0.0.1', port)
+  sender = window.WindowedSender(conn, window_size)
+  sender.send(cc.CtoS(cc.MSG_TYPES['Dimensions'], 1024, 768,
+                      cc.ControlPacket(0, None)).to_bytes())
+  sender.drain()
+  datums = [move_bytes(i) for i in range(200)]
+  sent = 0
+  start = time.monotonic()
+  end = start + duration
+  while time.monotonic() < end:
+    sender.send(datums[sent % 200])
+    sender.poll()
+    sent += 1
+  sender.drain()
+  elapsed = time.monotonic() - start
+  conn.close()
+  return sent / elapsed
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--latency', type=float, nargs='+', default=[0.005, 0.02])
+  parser.add_argument('--windows', type=int, nargs='+',
+                      default=[1, 2, 4, 8, 16, 32])
+  parser.add_argument('--duration', type=float, default=1.0)
+  parser.add_argument('--nagle', action='store_true')
+  args = parser.parse_args()
+  for latency in args.latency:
+    server = standin.StandInServer(latency=latency).start()
+    print('latency ' + str(int(latency*1000)) + ' ms')
+    for w in args.windows:
+      pps = run(server.port, w, args.duration, args.nagle)
+      print('  window %3d: %9.1f packets/s' % (w, pps))
+    server.stop()
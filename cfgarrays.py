@@ -0,0 +1,97 @@
+import array
+import itertools
+import operator
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# the coordinate attributes of each element kind, in array column order
+COLUMNS = {
+  'panels': ('x1', 'y1', 'x2', 'y2'),
+  'buttons': ('x1', 'y1', 'x2', 'y2'),
+  'joysticks': ('x', 'y', 'r'),
+  'joystickpads': ('x1', 'y1', 'x2', 'y2', 'r'),
+}
+# a y flip turns a box's top edge into its bottom edge
+FLIP_SOURCE = {'y': 'y', 'y1': 'y2', 'y2': 'y1'}
+
+
+def flip_row(kind, row, height):
+  cols = COLUMNS[kind]
+  return tuple(height - row[cols.index(FLIP_SOURCE[c])] if c in FLIP_SOURCE
+               else v for c, v in zip(cols, row))
+
+
+# one element's coordinates with y measured from the other edge
+def flip_elem(kind, elem, height):
+  return flip_row(kind, operator.attrgetter(*COLUMNS[kind])(elem), height)
+
+
+# Coordinates of all elements of one kind in a single contiguous array, one
+# row per element: a 2d float64 numpy array when numpy is available, else a
+# flat array('d'). A snapshot for whole-layout reads; it does not follow
+# later changes to the elements.
+class CoordArray:
+  def __init__(self, kind, elems):
+    self.kind = kind
+    self.columns = COLUMNS[kind]
+    self.width = len(self.columns)
+    self.count = len(elems)
+    get = operator.attrgetter(*self.columns)
+    flat = array.array('d', itertools.chain.from_iterable(map(get, elems)))
+    if numpy is not None:
+      self.data = numpy.frombuffer(flat, dtype=numpy.float64).reshape(
+        self.count, self.width).copy()
+    else:
+      self.data = flat
+
+  def col(self, name):
+    i = self.columns.index(name)
+    if numpy is not None:
+      return self.data[:, i]
+    return self.data[i::self.width]
+
+  def rows(self):
+    if numpy is not None:
+      return [tuple(r) for r in self.data.tolist()]
+    w = self.width
+    return [tuple(self.data[i:i + w]) for i in range(0, len(self.data), w)]
+
+  # rows with y measured from the top instead of the bottom of a screen
+  # height high
+  def flipped_rows(self, height):
+    if numpy is None:
+      cols = [[height - v for v in self.col(FLIP_SOURCE[c])]
+              if c in FLIP_SOURCE else self.col(c) for c in self.columns]
+      return list(zip(*cols))
+    out = self.data.copy()
+    for i, c in enumerate(self.columns):
+      if c in FLIP_SOURCE:
+        out[:, i] = height - self.data[:, self.columns.index(FLIP_SOURCE[c])]
+    return [tuple(r) for r in out.tolist()]
+
+  # (x1, y1, x2, y2) covering every element, or None if there are none
+  def bounds(self):
+    if not self.count:
+      return None
+    if 'r' in self.columns and 'x' in self.columns:
+      x = self.col('x')
+      y = self.col('y')
+      r = self.col('r')
+      if numpy is not None:
+        return ((x - r).min(), (y - r).min(), (x + r).max(), (y + r).max())
+      return (min(map(operator.sub, x, r)), min(map(operator.sub, y, r)),
+              max(map(operator.add, x, r)), max(map(operator.add, y, r)))
+    return (min(self.col('x1')), min(self.col('y1')),
+            max(self.col('x2')), max(self.col('y2')))
+
+
+# the union of several bounds, skipping None
+def union(bounds):
+  bounds = [b for b in bounds if b is not None]
+  if not bounds:
+    return None
+  return (float(min(b[0] for b in bounds)), float(min(b[1] for b in bounds)),
+          float(max(b[2] for b in bounds)), float(max(b[3] for b in bounds)))
@@ -0,0 +1,114 @@
+import collections
+import hashlib
+import os
+import struct
+
+import ctlrcfg as cc
+import window
+
+CACHE_DIR = os.path.expanduser('~/.ctlcache')
+MAX_ENTRIES = 16
+MAX_PERSISTED = 4
+
+# on disk: records of StoC code, payload length, payload; oldest first
+RECORD_HEADER = struct.Struct('<BI')
+
+
+def spec_digest(code, payload):
+  return hashlib.blake2b(bytes([code]) + payload, digest_size=16).digest()
+
+
+def parse_spec(code, payload):
+  if code == window.STOC_BINARY_SPEC:
+    return cc.CtlrCfg.from_bin(payload)
+  return cc.CtlrCfg.from_str(payload.decode('utf-8'))
+
+
+def cache_path(host, port, w, h):
+  name = host + '_' + str(port) + '_' + str(int(w)) + 'x' + str(int(h)) + '.cfg'
+  return os.path.join(CACHE_DIR, name)
+
+
+# Parsed CtlrCfgs keyed by a digest of the spec they came from, so a spec
+# the server sends again is not parsed again. With a path, the most recent
+# specs are also written to disk and loaded back on the next start.
+# The parsed configs are only copied from: the engine keeps touch and sent
+# state on the elements of the config it shows, so each switch gets fresh
+# ones. Asking again for the spec handed out last returns that same config.
+class CfgCache:
+  def __init__(self, path=None, max_entries=MAX_ENTRIES):
+    self.path = path
+    self.max_entries = max_entries
+    self.entries = collections.OrderedDict() # digest -> (code, payload, cfg)
+    self.current_key = None
+    self.current = None # the config handed out last
+    self.hits = 0
+    self.misses = 0
+    if path:
+      self.load()
+
+  def get(self, code, payload):
+    key = spec_digest(code, payload)
+    entry = self.entries.get(key)
+    if entry is not None:
+      self.hits += 1
+      self.entries.move_to_end(key)
+      if key == self.current_key:
+        return self.current
+      return self.hand_out(key, entry[2])
+    self.misses += 1
+    cfg = parse_spec(code, payload)
+    self.entries[key] = (code, payload, cfg)
+    while len(self.entries) > self.max_entries:
+      self.entries.popitem(last=False)
+    if self.path:
+      self.save()
+    return self.hand_out(key, cfg)
+
+  def hand_out(self, key, cfg):
+    self.current_key = key
+    self.current = cfg.copy()
+    return self.current
+
+  # the most recently used config, or None
+  def latest(self):
+    if not self.entries:
+      return None
+    key = next(reversed(self.entries))
+    if key == self.current_key:
+      return self.current
+    return self.hand_out(key, self.entries[key][2])
+
+  def load(self):
+    try:
+      with open(self.path, 'rb') as f:
+        data = f.read()
+    except OSError:
+      return
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+      code, length = RECORD_HEADER.unpack_from(data, offset)
+      offset += RECORD_HEADER.size
+      payload = data[offset:offset + length]
+      offset += length
+      if len(payload) != length:
+        break
+      try:
+        cfg = parse_spec(code, payload)
+      except (Exception, SystemExit):
+        print('skipping unreadable cached config in ' + self.path)
+        continue
+      self.entries[spec_digest(code, payload)] = (code, payload, cfg)
+
+  def save(self):
+    recent = list(self.entries.values())[-MAX_PERSISTED:]
+    tmp = self.path + '.tmp'
+    try:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+      with open(tmp, 'wb') as f:
+        for code, payload, cfg in recent:
+          f.write(RECORD_HEADER.pack(code, len(payload)))
+          f.write(payload)
+      os.replace(tmp, self.path)
+    except OSError as e:
+      print('could not save config cache: ' + str(e))
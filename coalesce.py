@@ -0,0 +1,61 @@
+import struct
+
+import ctlrcfg as cc
+
+# msg_type, element_id, datum_type at the start of a CtoS frame
+CTOS_HEAD = struct.Struct('<3i')
+# the four ints holding a Move's x and y, all zero for a centred stick
+MOVE_VALUES_START = 3 * cc.BYTES_PER_INT
+CENTRE_VALUES = bytes(cc.SEQ_OFFSET - MOVE_VALUES_START)
+
+
+def move_elem_id(datum):
+  if len(datum) != cc.NUM_BYTES_CTOS:
+    return None
+  msg_type, elem_id, datum_type = CTOS_HEAD.unpack_from(datum)
+  if (msg_type == cc.MSG_TYPES['ControlPacket'] and
+      datum_type == cc.DATUM_TYPES['Move']):
+    return elem_id
+  return None
+
+
+# a Move frame back to (0, 0), which is how a stick is released
+def is_centre_move(datum):
+  return datum[MOVE_VALUES_START:cc.SEQ_OFFSET] == CENTRE_VALUES
+
+
+# Holds Move frames until the end of the frame, keeping only the newest one
+# per element. Any other frame flushes the pending Moves first so the order
+# of everything that is sent matches the order it was produced in.
+class MoveCoalescer:
+  def __init__(self):
+    self.pending = {} # elem_id -> newest Move frame
+    self.moves_in = 0
+    self.moves_out = 0
+
+  # returns the frames that must be sent now, in order
+  def push(self, datum):
+    elem_id = move_elem_id(datum)
+    if elem_id is not None:
+      self.moves_in += 1
+      self.pending[elem_id] = datum
+      return []
+    out = self.flush()
+    out.append(datum)
+    return out
+
+  def flush(self):
+    if not self.pending:
+      return []
+    out = list(self.pending.values())
+    self.pending.clear()
+    self.moves_out += len(out)
+    return out
+
+  # forgets the pending Moves, which were for a connection that is gone
+  def clear(self):
+    self.moves_in -= len(self.pending)
+    self.pending.clear()
+
+  def saved(self):
+    return self.moves_in - self.moves_out - len(self.pending)
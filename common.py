@@ -1,10 +1,42 @@
 #!/usr/bin/python
+import errno
+import os
+import select
 import socket
-import sys
+import struct
+import time
+
+import metrics
 
 
 DELMT = '\n'
 
+class ConnectionLost(RuntimeError):
+  pass
+
+
+RECV_BUF_SIZE = 65536
+STOC_HEADER = struct.Struct('<BI')
+STOC_HEADER_LEN = STOC_HEADER.size
+
+# socket options every Conn starts with; see Conn.tune
+#   nodelay: disable Nagle so each small frame goes out at once
+#   quickack: ACK every segment right away (Linux only; the kernel clears it
+#     again, so it is set after every recv)
+#   sndbuf, rcvbuf: kernel buffer sizes in bytes, None for the OS default
+#   keepalive: idle seconds before TCP keepalive probes, None for off
+TUNING = {'nodelay': True, 'quickack': False, 'sndbuf': None, 'rcvbuf': None,
+          'keepalive': None}
+KEEPALIVE_PROBES = 3
+HAVE_QUICKACK = hasattr(socket, 'TCP_QUICKACK')
+HAVE_SENDMSG = hasattr(socket.socket, 'sendmsg')
+# below this many bytes joining the buffers costs less than sendmsg
+SENDMSG_MIN_BYTES = 4096
+TCP_FAMILIES = (socket.AF_INET, socket.AF_INET6)
+
+# Frames are read out of one reusable receive buffer filled with recv_into.
+# Whatever a recv returns beyond the current frame stays buffered for the
+# next call, so back to back frames are never lost.
 class Conn:
   def __init__(self, sock=None):
     if sock is None:
@@ -12,11 +44,73 @@ class Conn:
         socket.AF_INET, socket.SOCK_STREAM)
     else:
       self.sock = sock
-    self.partial_msg = ''
+    self.timeout = None
+    self.rbuf = bytearray(RECV_BUF_SIZE)
+    self.rview = memoryview(self.rbuf)
+    self.rstart = 0
+    self.rend = 0
+    self.quickack = False
+    self.tune(**TUNING)
       
+  # sets any of the TUNING options; the buffer sizes are best set before
+  # connect, the rest apply at any time. Sockets other than TCP (such as a
+  # socketpair) are left alone.
+  def tune(self, nodelay=None, quickack=None, sndbuf=None, rcvbuf=None,
+           keepalive=None):
+    sock = self.sock
+    if sock.family not in TCP_FAMILIES:
+      return
+    if nodelay is not None:
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay))
+    if quickack is not None:
+      self.quickack = quickack and HAVE_QUICKACK
+      if self.quickack:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    if sndbuf:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    if keepalive is not None:
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(bool(keepalive)))
+      if keepalive:
+        idle = max(1, int(keepalive))
+        # the option names differ by platform
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+          sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        elif hasattr(socket, 'TCP_KEEPALIVE'):
+          sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+          sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, idle)
+        if hasattr(socket, 'TCP_KEEPCNT'):
+          sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_PROBES)
+
   def connect(self, host, port):
-    self.sock.settimeout(1)
+    self.set_timeout(1)
     self.sock.connect((host, port))
+
+  # starts connecting without blocking; poll finish_connect until it is done
+  def start_connect(self, host, port):
+    self.set_timeout(0)
+    err = self.sock.connect_ex((host, port))
+    if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+      raise OSError(err, os.strerror(err))
+
+  # True once a start_connect has completed, False while it is in progress;
+  # raises OSError if it failed. Afterwards the socket behaves as connect left it.
+  def finish_connect(self):
+    _, writable, _ = select.select([], [self.sock], [], 0)
+    if not writable:
+      return False
+    err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+    if err:
+      raise OSError(err, os.strerror(err))
+    self.set_timeout(1)
+    return True
+
+  def set_timeout(self, timeout):
+    if timeout != self.timeout:
+      self.sock.settimeout(timeout)
+      self.timeout = timeout
     
   def send(self, msg):
     if DELMT in msg:
@@ -28,81 +122,162 @@ class Conn:
     while totalsent < len(emsg):
       sent = self.sock.send(emsg[totalsent:])
       if sent == 0:
-        raise RuntimeError("socket connection broken")
+        raise ConnectionLost("socket connection broken")
       totalsent = totalsent + sent
 
+  # number of received bytes not yet returned as a frame
+  def buffered(self):
+    return self.rend - self.rstart
 
-  # returns (connection still valid, full message)
-  def recv(self):
-    msg = self.partial_msg
-    while not DELMT in msg:
-      chunk = self.sock.recv(10)
-      if chunk == b'':
-        return (False, msg)
-      msg = msg + chunk.decode('utf-8')
-    parts = msg.split(DELMT)
-    if len(parts) == 3:
-      print('Error: doubly overflowing message')
-    self.partial_msg = parts[1]
-    msg = parts[0]
-    while msg[-1].isspace():
-      msg = msg[:-1]
-    return (True, msg)
+  # one recv_into the free end of the buffer; returns the byte count (0 on EOF)
+  def fill(self):
+    if self.rstart == self.rend:
+      self.rstart = self.rend = 0
+    elif self.rend == len(self.rbuf):
+      n = self.rend - self.rstart
+      if self.rstart > 0:
+        self.rbuf[:n] = bytes(self.rview[self.rstart:self.rend])
+      else:
+        rbuf = bytearray(len(self.rbuf) * 2)
+        rbuf[:n] = self.rview[:n]
+        self.rbuf = rbuf
+        self.rview = memoryview(rbuf)
+      self.rstart = 0
+      self.rend = n
+    if metrics.ENABLED:
+      start = time.perf_counter()
+      got = self.sock.recv_into(self.rview[self.rend:])
+      metrics.observe('conn.recv_wait', time.perf_counter() - start)
+      metrics.count('conn.bytes_in', got)
+    else:
+      got = self.sock.recv_into(self.rview[self.rend:])
+    self.rend += got
+    if self.quickack and got:
+      self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    return got
 
-  # returns (connection still valid, full message)
-  def new_recv(self):
-    msg = self.partial_msg
-    while not DELMT in msg:
+  def take(self, n):
+    view = self.rview[self.rstart:self.rstart + n]
+    self.rstart += n
+    return view
+
+  def next_line(self, ignore_reset):
+    while True:
+      i = self.rbuf.find(b'\n', self.rstart, self.rend)
+      if i >= 0:
+        msg = self.take(i - self.rstart + 1)
+        return (True, str(msg[:-1], 'utf-8').rstrip())
       try:
-        chunk = self.sock.recv(10)
+        got = self.fill()
       except ConnectionResetError:
+        if not ignore_reset:
+          raise
         print('Port was scanned')
         continue
-      if chunk == b'':
-        return (False, msg)
-      msg = msg + chunk.decode('utf-8')
-    parts = msg.split(DELMT)
-    if len(parts) == 3:
-      print('Error: doubly overflowing message')
-    self.partial_msg = parts[1]
-    msg = parts[0]
-    while msg[-1].isspace():
-      msg = msg[:-1]
-    return (True, msg)
-
-
-  
+      if got == 0:
+        return (False, str(self.take(self.buffered()), 'utf-8'))
+
+  # returns (connection still valid, full message)
+  def recv(self):
+    return self.next_line(False)
+
+  # returns (connection still valid, full message)
+  def new_recv(self):
+    return self.next_line(True)
+
+  # returns every complete newline-delimited message, waiting for at least one
+  def recv_lines(self):
+    valid, msg = self.next_line(False)
+    if not valid:
+      return (False, [msg])
+    msgs = [msg]
+    while True:
+      i = self.rbuf.find(b'\n', self.rstart, self.rend)
+      if i < 0:
+        return (True, msgs)
+      msgs.append(str(self.take(i - self.rstart + 1)[:-1], 'utf-8').rstrip())
+
   def send_bytes(self, msg):
-    totalsent = 0
-    while totalsent < len(msg):
-      sent = self.sock.send(msg[totalsent:])
+    if metrics.ENABLED:
+      metrics.count('conn.bytes_out', len(msg))
+      metrics.count('conn.writes')
+    sent = self.sock.send(msg)
+    if sent == len(msg):
+      return
+    # resend the rest through a view so partial sends copy nothing
+    view = memoryview(msg).cast('B')
+    totalsent = sent
+    while totalsent < len(view):
       if sent == 0:
-        raise RuntimeError("socket connection broken")
+        raise ConnectionLost("socket connection broken")
+      sent = self.sock.send(view[totalsent:])
       totalsent = totalsent + sent
 
-  def recv_bytes(self, num_bytes):
-    self.sock.settimeout(2)
-    msg = b''
-    while len(msg) < num_bytes:
+  # several buffers in one system call; large ones are not joined first
+  def send_frames(self, frames):
+    total = sum(len(f) for f in frames)
+    if not HAVE_SENDMSG or total < SENDMSG_MIN_BYTES:
+      self.send_bytes(b''.join(frames))
+      return
+    sent = self.sock.sendmsg(frames)
+    if metrics.ENABLED:
+      metrics.count('conn.bytes_out', sent)
+      metrics.count('conn.writes')
+    if sent == 0 and total:
+      raise ConnectionLost("socket connection broken")
+    if sent < total:
+      self.send_bytes(b''.join(frames)[sent:])
+
+  # returns (connection still valid, view of the next num_bytes bytes); the
+  # view is only valid until the next recv call on this Conn
+  def recv_view(self, num_bytes):
+    self.set_timeout(2)
+    while self.rend - self.rstart < num_bytes:
       try:
-        chunk = self.sock.recv(num_bytes - len(msg))
-      except:
+        got = self.fill()
+      except OSError as e:
         self.sock.close()
-        print('timed out; len ' + str(len(msg)) + ", num_bytes " + str(num_bytes))
-        sys.exit(1)
-      if chunk == b'':
-        return (False, msg)
-      msg += chunk
-    return (True, msg)
-    
-    
+        raise ConnectionLost('timed out; len ' + str(self.buffered()) +
+                             ", num_bytes " + str(num_bytes)) from e
+      if got == 0:
+        return (False, self.take(self.buffered()))
+    return (True, self.take(num_bytes))
 
+  def recv_bytes(self, num_bytes):
+    valid, view = self.recv_view(num_bytes)
+    return (valid, bytes(view))
 
+  # returns (connection still valid, code, payload) for a StoC message: a
+  # one byte code and a 4 byte little endian length, then the payload
+  def recv_stoc(self):
+    frame = self.next_stoc()
+    if frame is not None:
+      return (True, frame[0], frame[1])
+    valid, header = self.recv_view(STOC_HEADER_LEN)
+    if not valid:
+      return (False, None, bytes(header))
+    code, length = STOC_HEADER.unpack(header)
+    valid, payload = self.recv_bytes(length)
+    return (valid, code, payload)
 
-  def close(self):
-    self.sock.close()
-
-    
+  # (code, payload) of the next StoC message if it is completely buffered
+  def next_stoc(self):
+    start = self.rstart
+    if self.rend - start < STOC_HEADER_LEN:
+      return None
+    code, length = STOC_HEADER.unpack_from(self.rbuf, start)
+    end = start + STOC_HEADER_LEN + length
+    if end > self.rend:
+      return None
+    self.rstart = end
+    return (code, bytes(self.rview[start + STOC_HEADER_LEN:end]))
 
+  # yields (code, payload) for every complete StoC message already buffered
+  def buffered_stocs(self):
+    frame = self.next_stoc()
+    while frame is not None:
+      yield frame
+      frame = self.next_stoc()
 
-  
+  def close(self):
+    self.sock.close()
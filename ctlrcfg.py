@@ -1,13 +1,29 @@
+import array
 import math
+import struct
+
+import cfgarrays
+import metrics
 
 BYTES_PER_INT = 4
 NUM_INTS_CTOS = 8
 NUM_BYTES_CTOS = NUM_INTS_CTOS*BYTES_PER_INT
 NUM_INTS_CONTROLDATUM = 6
 NUM_BYTES_CONTROLDATUM = NUM_INTS_CONTROLDATUM * BYTES_PER_INT
+# the last int of a ControlPacket frame carries its sequence number
+SEQ_INDEX = NUM_INTS_CTOS - 1
+SEQ_OFFSET = SEQ_INDEX * BYTES_PER_INT
 
 INT_MAX = 2147483647
 
+# optional protocol features negotiated with the Dimensions message; a server
+# that supports some of them answers with a StoC Caps message first
+CAP_UDP_MOVES = 1
+CAP_COMPACT_MOVES = 2
+CAP_BATCH = 4
+
+CTOS_STRUCT = struct.Struct('<' + str(NUM_INTS_CTOS) + 'i')
+
 
 def dist(x1, y1, x2, y2):
   dx = x2 - x1
@@ -25,17 +41,19 @@ def nums_to_bytes(nums):
   return ret
 
 
-MSG_TYPES = {"Heartbeat":9, "Disconnect":10, "Dimensions":11, "ControlPacket":12}
+MSG_TYPES = {"Heartbeat":9, "Disconnect":10, "Dimensions":11, "ControlPacket":12,
+             "Batch":13, "CompactMove":14, "MoveFence":15}
 class CtoS:
-  def __init__(self, msg_type, w, h, ctl_packet):
+  def __init__(self, msg_type, w, h, ctl_packet, seq=0, caps=0):
     self.msg_type = msg_type
     self.w = int(w)
     self.h = int(h)
     self.ctl_packet = ctl_packet
+    self.seq = seq
+    self.caps = caps # CAP_* bits a Dimensions message asks the server for
 
   def to_bytes(self):
-    nums = self.to_nums()
-    return nums_to_bytes(nums)
+    return CTOS_STRUCT.pack(*self.to_nums())
 
   def to_nums(self):
     ret = [0] * NUM_INTS_CTOS
@@ -45,6 +63,7 @@ class CtoS:
     elif self.msg_type == MSG_TYPES["Dimensions"]:
       ret[1] = self.w
       ret[2] = self.h
+      ret[3] = self.caps
     elif self.msg_type == MSG_TYPES["ControlPacket"]:
       ret[1] = self.ctl_packet.element_id
       ret[2] = self.ctl_packet.datum.datum_type
@@ -59,6 +78,7 @@ class CtoS:
         ret[4] = b
         ret[5] = c
         ret[6] = d
+      ret[SEQ_INDEX] = self.seq
     return ret
 
 def float_to_two_ints(f):
@@ -69,6 +89,87 @@ def float_to_two_ints(f):
   return a, b
 
 
+# Same bytes as CtoS(ControlPacket, 0, 0, ControlPacket(elem_id,
+# ControlDatum(datum_type, x, y))).to_bytes() without the intermediate objects.
+def packet_to_bytes(elem_id, datum_type, x, y, seq=0):
+  if datum_type == MOVE:
+    a = int(x)
+    b = int((x - a) * INT_MAX)
+    c = int(y)
+    d = int((y - c) * INT_MAX)
+    return CTOS_STRUCT.pack(CONTROL_PACKET, elem_id, datum_type, a, b, c, d, seq)
+  if datum_type == SQUEEZE:
+    a = int(x)
+    b = int((x - a) * INT_MAX)
+    return CTOS_STRUCT.pack(CONTROL_PACKET, elem_id, datum_type, a, b, 0, 0, seq)
+  return CTOS_STRUCT.pack(CONTROL_PACKET, elem_id, datum_type, 0, 0, 0, 0, seq)
+
+
+# A Batch is a CtoS header frame (msg_type Batch, count in int 1, sequence
+# number in the last int) followed by count packed ControlPackets, each being
+# ints 1-6 of the ControlPacket frame it replaces. The server acks it once.
+PACKED_PACKET_STRUCT = struct.Struct('<' + str(NUM_INTS_CONTROLDATUM) + 'i')
+
+class BatchEncoder:
+  def __init__(self, max_packets=16):
+    self.resize(max_packets)
+
+  def resize(self, max_packets):
+    self.max_packets = max_packets
+    self.buf = bytearray(NUM_BYTES_CTOS + NUM_BYTES_CONTROLDATUM * max_packets)
+    self.view = memoryview(self.buf)
+
+  # frames are ControlPacket frames; returns a view into the reused buffer
+  def encode(self, frames):
+    count = len(frames)
+    if count > self.max_packets:
+      self.resize(count)
+    CTOS_STRUCT.pack_into(self.buf, 0, BATCH, count, 0, 0, 0, 0, 0, 0)
+    offset = NUM_BYTES_CTOS
+    for frame in frames:
+      end = offset + NUM_BYTES_CONTROLDATUM
+      self.buf[offset:end] = frame[BYTES_PER_INT:BYTES_PER_INT + NUM_BYTES_CONTROLDATUM]
+      offset = end
+    return self.view[:offset]
+
+
+def batch_count(header):
+  return CTOS_STRUCT.unpack_from(header)[1]
+
+# yields (element_id, datum_type, x, y) for the packed packets after a header
+def unpack_batch(body):
+  for elem_id, datum_type, a, b, c, d in PACKED_PACKET_STRUCT.iter_unpack(body):
+    yield elem_id, datum_type, a + b / INT_MAX, c + d / INT_MAX
+
+
+# With CAP_COMPACT_MOVES a Move may instead be sent as 8 bytes: msg_type,
+# padding, uint16 element id and x, y as int16 in units of 1/COMPACT_SCALE.
+COMPACT_MOVE_STRUCT = struct.Struct('<BxHhh')
+NUM_BYTES_COMPACT_MOVE = COMPACT_MOVE_STRUCT.size
+COMPACT_SCALE = 10000
+COMPACT_LIMIT = 32767
+
+# returns None if the element id or the values do not fit
+def compact_move(elem_id, x, y):
+  qx = round(x * COMPACT_SCALE)
+  qy = round(y * COMPACT_SCALE)
+  if (elem_id < 0 or elem_id > 0xFFFF or
+      qx < -COMPACT_LIMIT or qx > COMPACT_LIMIT or
+      qy < -COMPACT_LIMIT or qy > COMPACT_LIMIT):
+    return None
+  return COMPACT_MOVE_STRUCT.pack(COMPACT_MOVE, elem_id, qx, qy)
+
+# the compact form of a Move ControlPacket frame, or None
+def compact_from_frame(frame):
+  msg_type, elem_id, datum_type, a, b, c, d, seq = CTOS_STRUCT.unpack(frame)
+  return compact_move(elem_id, a + b / INT_MAX, c + d / INT_MAX)
+
+# returns (element_id, x, y)
+def unpack_compact_move(buf, offset=0):
+  msg_type, elem_id, qx, qy = COMPACT_MOVE_STRUCT.unpack_from(buf, offset)
+  return elem_id, qx / COMPACT_SCALE, qy / COMPACT_SCALE
+
+
 class ControlPacket:
   def __init__(self, element_id, datum):
     self.element_id = element_id
@@ -76,6 +177,16 @@ class ControlPacket:
 
 
 DATUM_TYPES = {"Press": 21, "Release":22, "Squeeze":23, "Move":24}    
+CONTROL_PACKET = MSG_TYPES["ControlPacket"]
+BATCH = MSG_TYPES["Batch"]
+COMPACT_MOVE = MSG_TYPES["CompactMove"]
+PRESS = DATUM_TYPES["Press"]
+RELEASE = DATUM_TYPES["Release"]
+SQUEEZE = DATUM_TYPES["Squeeze"]
+MOVE = DATUM_TYPES["Move"]
+# messages whose bytes never change, built once
+HEARTBEAT_BYTES = CtoS(MSG_TYPES["Heartbeat"], 0, 0, None).to_bytes()
+DISCONNECT_BYTES = CtoS(MSG_TYPES["Disconnect"], 0, 0, None).to_bytes()
 class ControlDatum:
   def __init__(self, datum_type, x, y):
    self.datum_type = datum_type
@@ -101,6 +212,7 @@ class CtlrCfg:
       j.index = i
     for i, jp in enumerate(self.joystickpads):
       jp.index = i
+    self.reindex()
     
 
   def from_str(s):
@@ -127,12 +239,172 @@ class CtlrCfg:
     for jstk in self.joysticks:
       s += jstk.to_str()
       s += ';'
+    s += ']'
     for jstkpd in self.joystickpads:
       s += jstkpd.to_str()
       s += ';'
     return s
 
+  # fixed-size little endian records per element type, after BIN_HEADER;
+  # see BIN_RECORDS
+  def from_bin(buf):
+    view = memoryview(buf)
+    if len(view) < BIN_HEADER.size:
+      exit('binary controller config is truncated')
+    magic, version, fmt, *counts = BIN_HEADER.unpack_from(view)
+    if magic != BIN_MAGIC or version != BIN_VERSION:
+      exit('not a version ' + str(BIN_VERSION) + ' binary controller config')
+    records = BIN_RECORDS.get(fmt)
+    if records is None:
+      exit('unknown coordinate format in binary controller config')
+    offset = BIN_HEADER.size
+    sections = []
+    for count, record in zip(counts, records):
+      end = offset + count * record.size
+      if end > len(view):
+        exit('binary controller config is truncated')
+      sections.append(record.iter_unpack(view[offset:end]))
+      offset = end
+    pnls = [Panel(*rec) for rec in sections[0]]
+    btns = [Button(*rec) for rec in sections[1]]
+    jstks = [Joystick(*rec) for rec in sections[2]]
+    jstkpds = [JoystickPad(*rec) for rec in sections[3]]
+    return CtlrCfg(pnls, btns, jstks, jstkpds)
+
+  def to_bin(self):
+    kinds = (self.panels, self.buttons, self.joysticks, self.joystickpads)
+    coords = [v for p in self.panels for v in p.geometry()[:4]]
+    for elems in kinds[1:]:
+      coords += [v for e in elems for v in e.geometry()]
+    fmt = bin_format(coords)
+    records = BIN_RECORDS[fmt]
+    size = BIN_HEADER.size
+    for elems, record in zip(kinds, records):
+      size += len(elems) * record.size
+    buf = bytearray(size)
+    BIN_HEADER.pack_into(buf, 0, BIN_MAGIC, BIN_VERSION, fmt,
+                         *[len(elems) for elems in kinds])
+    offset = BIN_HEADER.size
+    whole = fmt in BIN_INT_FORMATS
+    for elems, record in zip(kinds, records):
+      for e in elems:
+        geometry = e.geometry()
+        if whole:
+          geometry = [int(v) for v in geometry]
+        record.pack_into(buf, offset, e.elem_id, *geometry)
+        offset += record.size
+    return bytes(buf)
+
+  # the same layout with fresh elements, as if just parsed
+  def copy(self):
+    return CtlrCfg(*[[type(e)(e.elem_id, *e.geometry()) for e in getattr(self, kind)]
+                     for kind in ELEMENT_KINDS])
+
+  # same elements, in the same order, with the same ids and geometry
+  def same_layout(self, other):
+    for kind in ELEMENT_KINDS:
+      mine = getattr(self, kind)
+      theirs = getattr(other, kind)
+      if len(mine) != len(theirs):
+        return False
+      for a, b in zip(mine, theirs):
+        if a.elem_id != b.elem_id or a.geometry() != b.geometry():
+          return False
+    return True
+
+  # what changed going from this config to other, matched by elem_id
+  def diff(self, other):
+    d = CfgDiff()
+    for kind in ELEMENT_KINDS:
+      old = {e.elem_id: e for e in getattr(self, kind)}
+      new_elems = getattr(other, kind)
+      new_ids = set()
+      for e in new_elems:
+        new_ids.add(e.elem_id)
+        prev = old.get(e.elem_id)
+        if prev is None:
+          d.added[kind].append(e)
+        elif prev.geometry() != e.geometry():
+          d.changed[kind].append((prev, e))
+        else:
+          d.unchanged[kind].append((prev, e))
+      d.removed[kind] = [e for e in getattr(self, kind)
+                         if e.elem_id not in new_ids]
+    return d
+
+  # swaps in the old objects for elements the diff found unchanged, so
+  # their nodes and touch state carry over
+  def reuse_unchanged(self, diff):
+    for kind in ELEMENT_KINDS:
+      old_for = {id(new): old for old, new in diff.unchanged[kind]}
+      elems = getattr(self, kind)
+      for i, e in enumerate(elems):
+        old = old_for.get(id(e))
+        if old is not None:
+          old.index = i
+          elems[i] = old
+    self.reindex()
+
+  # the grid is built by the next hit test and the coordinate arrays by the
+  # next flip or bounds, so a config that is parsed, diffed or scaled and
+  # then replaced is never indexed
+  def reindex(self):
+    self.grid = None
+    self.arrays = {}
+
+  # the elements' coordinates are the source of truth; this is a copy of
+  # one kind's, built on first use after a change
+  def coord_array(self, kind):
+    arr = self.arrays.get(kind)
+    if arr is None:
+      arr = self.arrays[kind] = cfgarrays.CoordArray(kind, getattr(self, kind))
+    return arr
+
+  # per element of a kind, its coordinates with y flipped for a screen
+  # height high, in the column order of cfgarrays.COLUMNS
+  def screen_rows(self, kind, height):
+    return self.coord_array(kind).flipped_rows(height)
+
+  # rescales the whole layout in place, e.g. from the Dimensions it was made
+  # for to new ones; configs shared through a CfgCache must not be scaled.
+  # Radii scale by the smaller factor so circles stay round.
+  def scale(self, sx, sy):
+    r = min(sx, sy)
+    for e in self.panels + self.buttons:
+      e.x1 *= sx
+      e.x2 *= sx
+      e.y1 *= sy
+      e.y2 *= sy
+    for e in self.joysticks:
+      e.x *= sx
+      e.y *= sy
+      e.r *= r
+    for e in self.joystickpads:
+      e.x1 *= sx
+      e.x2 *= sx
+      e.y1 *= sy
+      e.y2 *= sy
+      e.r *= r
+    self.reindex()
+
+  # (x1, y1, x2, y2) around every element, or None for an empty config
+  def bounds(self):
+    return cfgarrays.union(self.coord_array(kind).bounds()
+                           for kind in ELEMENT_KINDS)
+
+  # a new connection's server assumes every stick is centred
+  def reset_sent_state(self):
+    for elem in self.joysticks + self.joystickpads:
+      elem.sent_level = (0, 0)
+
   def get_element_containing_point(self, x, y):
+    grid = self.grid
+    if grid is None:
+      grid = self.grid = GridIndex(self)
+    return grid.query(x, y)
+
+  # the linear scan the grid must agree with
+  def scan_element_containing_point(self, x, y):
     for i, btn in enumerate(self.buttons):
       if (btn.x1 <= x and x < btn.x2 and
           btn.y1 <= y and y < btn.y2):
@@ -167,6 +439,134 @@ class CtlrCfg:
       exit('invalid dtype')
   '''
   
+ELEMENT_KINDS = ('panels', 'buttons', 'joysticks', 'joystickpads')
+
+# binary config: magic, version, the format of the coordinates (a struct
+# code) and the four element counts, then the records
+BIN_MAGIC = b'CTLB'
+BIN_VERSION = 1
+BIN_HEADER = struct.Struct('<4sBc2x4I')
+# per coordinate format, the panel, button, joystick and joystick pad
+# records: elem_id then the element's geometry(), a panel's ending in its
+# colour. Coordinates are stored in the narrowest format that holds all of
+# them exactly; whole pixels usually fit int16.
+BIN_RECORDS = {fmt: (struct.Struct('<i4' + fmt.decode() + 'I'),
+                     struct.Struct('<i4' + fmt.decode()),
+                     struct.Struct('<i3' + fmt.decode()),
+                     struct.Struct('<i5' + fmt.decode()))
+               for fmt in (b'h', b'i', b'f', b'd')}
+BIN_INT_FORMATS = (b'h', b'i')
+
+def bin_format(coords):
+  if all(float(v).is_integer() for v in coords):
+    lo = min(coords, default=0)
+    hi = max(coords, default=0)
+    if lo >= -0x8000 and hi < 0x8000:
+      return b'h'
+    if lo >= -0x80000000 and hi < 0x80000000:
+      return b'i'
+  if array.array('f', coords).tolist() == coords:
+    return b'f'
+  return b'd'
+# per-touch state a changed element takes over from the one it replaces
+TOUCH_STATE = ('depressed', 'magnitude', 'stick_x', 'stick_y',
+               'circle_x', 'circle_y', 'sent_level')
+
+class CfgDiff:
+  def __init__(self):
+    self.added = {kind: [] for kind in ELEMENT_KINDS}
+    self.removed = {kind: [] for kind in ELEMENT_KINDS}
+    self.changed = {kind: [] for kind in ELEMENT_KINDS} # (old, new)
+    self.unchanged = {kind: [] for kind in ELEMENT_KINDS} # (old, new)
+
+  def empty(self):
+    for kind in ELEMENT_KINDS:
+      if self.added[kind] or self.removed[kind] or self.changed[kind]:
+        return False
+    return True
+
+  # maps id() of each old element to the element that takes its place after
+  # reuse_unchanged (None if it was removed)
+  def successors(self):
+    ret = {}
+    for kind in ELEMENT_KINDS:
+      for e in self.removed[kind]:
+        ret[id(e)] = None
+      for old, new in self.changed[kind]:
+        ret[id(old)] = new
+      for old, new in self.unchanged[kind]:
+        ret[id(old)] = old
+    return ret
+
+
+def carry_touch_state(old, new):
+  for attr in TOUCH_STATE:
+    if hasattr(old, attr):
+      setattr(new, attr, getattr(old, attr))
+
+
+MAX_GRID_CELLS = 64 # per side
+
+# Uniform grid over the touchable elements. Each cell lists the elements
+# whose hit area overlaps it, in the same priority order as the linear scan
+# (buttons, then joysticks, then joystick pads, each by index), so the first
+# hit in a cell is the element the scan would have returned.
+class GridIndex:
+  def __init__(self, cfg):
+    areas = []
+    for i, btn in enumerate(cfg.buttons):
+      areas.append((False, i, btn, btn.x1, btn.y1, btn.x2, btn.y2))
+    for i, jstk in enumerate(cfg.joysticks):
+      areas.append((True, i, jstk, jstk.x - jstk.r, jstk.y - jstk.r,
+                    jstk.x + jstk.r, jstk.y + jstk.r))
+    for i, jstkpd in enumerate(cfg.joystickpads):
+      areas.append((False, i, jstkpd, jstkpd.x1, jstkpd.y1, jstkpd.x2, jstkpd.y2))
+    self.cols = 0
+    self.rows = 0
+    if not areas:
+      return
+    self.x0 = min(a[3] for a in areas)
+    self.y0 = min(a[4] for a in areas)
+    x_end = max(a[5] for a in areas)
+    y_end = max(a[6] for a in areas)
+    side = min(MAX_GRID_CELLS, max(1, int(math.sqrt(len(areas)))))
+    self.cell_w = (x_end - self.x0) / side or 1
+    self.cell_h = (y_end - self.y0) / side or 1
+    self.cols = side
+    self.rows = side
+    self.cells = [[] for _ in range(side * side)]
+    for circle, i, elem, x1, y1, x2, y2 in areas:
+      entry = (circle, i, elem)
+      c1, r1 = self.cell_of(x1, y1)
+      c2, r2 = self.cell_of(x2, y2)
+      for r in range(r1, r2 + 1):
+        row = r * side
+        for c in range(c1, c2 + 1):
+          self.cells[row + c].append(entry)
+
+  def cell_of(self, x, y):
+    c = int((x - self.x0) // self.cell_w)
+    r = int((y - self.y0) // self.cell_h)
+    return (min(max(c, 0), self.cols - 1), min(max(r, 0), self.rows - 1))
+
+  def query(self, x, y):
+    c = (x - self.x0) // self.cell_w if self.cols else -1
+    r = (y - self.y0) // self.cell_h if self.cols else -1
+    if c < 0 or r < 0:
+      return -1, None
+    # points on the far edge still belong to the last cell
+    c = min(int(c), self.cols - 1)
+    r = min(int(r), self.rows - 1)
+    for circle, i, elem in self.cells[r * self.cols + c]:
+      if circle:
+        if dist(x, y, elem.x, elem.y) < elem.r:
+          return i, elem
+      elif (elem.x1 <= x and x < elem.x2 and
+            elem.y1 <= y and y < elem.y2):
+        return i, elem
+    return -1, None
+
+
 # datum type constants
 TYPE_PANEL       = 10
 TYPE_BUTTON      = 11
@@ -175,6 +575,9 @@ TYPE_JOYSTICKPAD = 13
 
 
 class Panel:
+  __slots__ = ('elem_type', 'elem_id', 'x1', 'y1', 'x2', 'y2', 'color',
+               'index', 'nodes')
+
   def __init__(self, elem_id, x1, y1, x2, y2, color):
     self.elem_type = TYPE_PANEL
     self.elem_id = elem_id
@@ -182,7 +585,12 @@ class Panel:
     self.y1 = y1
     self.x2 = x2
     self.y2 = y2
-    self.color = int.from_bytes(color, 'little')
+    if isinstance(color, int):
+      self.color = color
+    else:
+      self.color = int.from_bytes(color, 'little')
+    self.index = None
+    self.nodes = []
 
   def from_str(s):
     parts = s.split(',')
@@ -194,15 +602,22 @@ class Panel:
     w = float(parts[3])
     h = float(parts[4])
     color = int(parts[5])
-    c_bytes = color.to_bytes(4, 'little')
-    return Panel(elem_id, x, y, x + w, y + h, c_bytes)
+    return Panel(elem_id, x, y, x + w, y + h, color)
 
   def to_str(self):
-    return (str(self.x1) + ',' + str(self.y1) + ',' + str(self.x2) +
-            ',' + str(self.y2) + ',' + str(self.color.to_bytes(4, 'little')))
+    return (str(self.elem_id) + ',' + str(self.x1) + ',' + str(self.y1) + ',' +
+            str(self.x2 - self.x1) + ',' + str(self.y2 - self.y1) + ',' +
+            str(self.color))
+
+  def geometry(self):
+    return (self.x1, self.y1, self.x2, self.y2, self.color)
 
 
 class Button:
+  __slots__ = ('elem_type', 'elem_id', 'x1', 'y1', 'x2', 'y2', 'index',
+               'nodes', 'depressed', 'on_press', 'on_release', 'press_bytes',
+               'release_bytes')
+
   def __init__(self, elem_id, x1, y1, x2, y2):
     self.elem_type = TYPE_BUTTON
     self.elem_id = elem_id
@@ -211,10 +626,15 @@ class Button:
     self.x2 = x2
     self.y2 = y2
     self.index = None
+    self.nodes = []
     self.depressed = False # should we keep track of state within the elements
     # themselves or just use the elements as stateless conduits?
     self.on_press = None
     self.on_release = None
+    # a button's packets depend only on its id; a new config builds new
+    # elements, so these never go stale
+    self.press_bytes = packet_to_bytes(elem_id, PRESS, 0, 0)
+    self.release_bytes = packet_to_bytes(elem_id, RELEASE, 0, 0)
 
   def set_on_press(self, func):
     self.on_press = func
@@ -234,8 +654,11 @@ class Button:
     return Button(elem_id, x, y, x + w, y + h)
 
   def to_str(self):
-    return (str(self.x1) + ',' + str(self.y1) + ',' + str(self.x2) +
-            ',' + str(self.y2))
+    return (str(self.elem_id) + ',' + str(self.x1) + ',' + str(self.y1) + ',' +
+            str(self.x2 - self.x1) + ',' + str(self.y2 - self.y1))
+
+  def geometry(self):
+    return (self.x1, self.y1, self.x2, self.y2)
 
   '''
   def handle_datum(self, datum):
@@ -250,24 +673,61 @@ class Button:
   
   # touch began
   def datum_from_TB(self, x, y):
-    print("press from " + str(self.elem_id))
+    if metrics.ENABLED:
+      metrics.note('press from', self.elem_id)
     self.depressed = True
-    ctos = CtoS(MSG_TYPES["ControlPacket"], 0, 0, ControlPacket
-                   (self.elem_id, ControlDatum(DATUM_TYPES["Press"], 0, 0)))
-    return ctos.to_bytes()
+    return self.press_bytes
 
   def datum_from_TM(self, x, y):
     return None
   
   def datum_from_TE(self, x, y):
     self.depressed = False
-    ctos = CtoS(MSG_TYPES["ControlPacket"], 0, 0, ControlPacket
-                   (self.elem_id, ControlDatum(DATUM_TYPES["Release"], 0, 0)))
-    return ctos.to_bytes()
+    return self.release_bytes
 
   
 
+# (quantization step, dead zone) for stick values, which run from -1 to 1,
+# per element type; change before the config is built, or per element with
+# set_quantization
+STICK_QUANT = {TYPE_JOYSTICK: (0.01, 0.0), TYPE_JOYSTICKPAD: (0.01, 0.0)}
+
+
+def quantize_stick(sx, sy, step, dead_zone):
+  if sx*sx + sy*sy < dead_zone*dead_zone:
+    return 0, 0
+  return round(sx / step), round(sy / step)
+
+
+# Updates the stick position of a Joystick or JoystickPad and returns its
+# Move packet, or None when the quantized value is what was last sent. The
+# server starts out assuming a centred stick.
+def stick_datum(elem, sx, sy):
+  qx, qy = quantize_stick(sx, sy, elem.quant_step, elem.dead_zone)
+  elem.stick_x = round(qx * elem.quant_step, 6)
+  elem.stick_y = round(qy * elem.quant_step, 6)
+  last_x, last_y = elem.sent_level
+  if qx == last_x and qy == last_y:
+    return None
+  elem.sent_level = (qx, qy)
+  return stick_move_bytes(elem)
+
+
+# the Move packet for the value a Joystick or JoystickPad last sent
+def stick_move_bytes(elem):
+  qx, qy = elem.sent_level
+  if qx == 0 and qy == 0:
+    return elem.centre_bytes
+  return packet_to_bytes(elem.elem_id, MOVE, round(qx * elem.quant_step, 6),
+                         -round(qy * elem.quant_step, 6))
+
+
 class Joystick:
+  __slots__ = ('elem_type', 'elem_id', 'x', 'y', 'r', 'index', 'depressed',
+               'magnitude', 'stick_x', 'stick_y', 'quant_step', 'dead_zone',
+               'sent_level', 'centre_bytes', 'knob_x', 'knob_y', 'jstk_node',
+               'nodes', 'on_press', 'on_release', 'on_move')
+
   def __init__(self, elem_id, x, y, r):
     self.elem_type = TYPE_JOYSTICK
     self.elem_id = elem_id
@@ -276,9 +736,17 @@ class Joystick:
     self.r = r
     self.index = None
     self.depressed = False
+    self.magnitude = 0
+    # where a renderer draws the stick's knob
+    self.knob_x = x
+    self.knob_y = y
     self.stick_x = 0
     self.stick_y = 0
+    self.quant_step, self.dead_zone = STICK_QUANT[TYPE_JOYSTICK]
+    self.sent_level = (0, 0)
+    self.centre_bytes = packet_to_bytes(elem_id, MOVE, 0, 0)
     self.jstk_node = None
+    self.nodes = []
     self.on_press = None
     self.on_release = None
     self.on_move = None
@@ -294,7 +762,11 @@ class Joystick:
     return Joystick(elem_id, x, y, r)
 
   def to_str(self):
-    return (str(self.x) + ',' + str(self.y) + ',' + str(self.r))
+    return (str(self.elem_id) + ',' + str(self.x) + ',' + str(self.y) + ',' +
+            str(self.r))
+
+  def geometry(self):
+    return (self.x, self.y, self.r)
 
   def set_on_press(self, func):
     self.on_press = func
@@ -305,6 +777,10 @@ class Joystick:
   def set_on_move(self, func):
     self.on_move = func
 
+  def set_quantization(self, step, dead_zone):
+    self.quant_step = step
+    self.dead_zone = dead_zone
+
   '''
   def handle_datum(self, datum):
     parts = datum.split(',')
@@ -337,12 +813,9 @@ class Joystick:
       x /= self.magnitude
       y /= self.magnitude
       self.magnitude = 1
-    self.stick_x = round(x/self.r, 2)
-    self.stick_y = round(y/self.r, 2)
-    self.jstk_node.position = (self.x+x, self.y+y)
-    ctos = CtoS(MSG_TYPES["ControlPacket"], 0, 0, ControlPacket
-                   (self.elem_id, ControlDatum(DATUM_TYPES["Move"], self.stick_x, -self.stick_y)))
-    return ctos.to_bytes()
+    self.knob_x = self.x + x
+    self.knob_y = self.y + y
+    return stick_datum(self, x/self.r, y/self.r)
   
     
   
@@ -352,16 +825,19 @@ class Joystick:
   def datum_from_TE(self, tx, ty):
     self.depressed = False
     self.magnitude = 0
-    self.stick_x = 0
-    self.stick_y = 0
-    self.jstk_node.position = (self.x, self.y)
-    ctos = CtoS(MSG_TYPES["ControlPacket"], 0, 0, ControlPacket
-                   (self.elem_id, ControlDatum(DATUM_TYPES["Move"], self.stick_x, -self.stick_y)))
-    return ctos.to_bytes()
+    self.knob_x = self.x
+    self.knob_y = self.y
+    return stick_datum(self, 0, 0)
 
 
   
 class JoystickPad:
+  __slots__ = ('elem_type', 'elem_id', 'x1', 'y1', 'x2', 'y2', 'r', 'index',
+               'depressed', 'magnitude', 'circle_x', 'circle_y', 'stick_x',
+               'stick_y', 'quant_step', 'dead_zone', 'sent_level',
+               'centre_bytes', 'knob_x', 'knob_y', 'jcrc_node', 'jstk_node',
+               'nodes', 'on_press', 'on_release', 'on_move')
+
   def __init__(self, elem_id, x1, y1, x2, y2, r):
     self.elem_type = TYPE_JOYSTICKPAD
     self.elem_id = elem_id
@@ -372,12 +848,19 @@ class JoystickPad:
     self.r = r
     self.index = None
     self.depressed = False
+    self.magnitude = 0
     self.circle_x = 0
     self.circle_y = 0
+    self.knob_x = 0
+    self.knob_y = 0
     self.stick_x = 0
     self.stick_y = 0
+    self.quant_step, self.dead_zone = STICK_QUANT[TYPE_JOYSTICKPAD]
+    self.sent_level = (0, 0)
+    self.centre_bytes = packet_to_bytes(elem_id, MOVE, 0, 0)
     self.jcrc_node = None
     self.jstk_node = None
+    self.nodes = []
     self.on_press = None
     self.on_release = None
     self.on_move = None
@@ -395,7 +878,12 @@ class JoystickPad:
     return JoystickPad(elem_id, x, y, x+w, y+h, r)
 
   def to_str(self):
-    return (str(self.x1) + ',' + str(self.y1) + ',' + str(self.x2) + ',' + str(self.y2) + ',' + str(self.r))
+    return (str(self.elem_id) + ',' + str(self.x1) + ',' + str(self.y1) + ',' +
+            str(self.x2 - self.x1) + ',' + str(self.y2 - self.y1) + ',' +
+            str(self.r))
+
+  def geometry(self):
+    return (self.x1, self.y1, self.x2, self.y2, self.r)
 
   def set_on_press(self, func):
     self.on_press = func
@@ -405,6 +893,10 @@ class JoystickPad:
 
   def set_on_move(self, func):
     self.on_move = func
+
+  def set_quantization(self, step, dead_zone):
+    self.quant_step = step
+    self.dead_zone = dead_zone
     
   '''
   def handle_datum(self, datum):
@@ -433,13 +925,9 @@ class JoystickPad:
     self.depressed = True
     self.circle_x = tx
     self.circle_y = ty
-    self.jcrc_node.alpha = 1
-    self.jstk_node.alpha = 1
-    self.jcrc_node.position = (self.circle_x, self.circle_y)
-    self.jstk_node.position = (self.circle_x, self.circle_y)
-    ctos = CtoS(MSG_TYPES["ControlPacket"], 0, 0, ControlPacket
-                   (self.elem_id, ControlDatum(DATUM_TYPES["Move"], self.stick_x, -self.stick_y)))
-    return ctos.to_bytes()
+    self.knob_x = tx
+    self.knob_y = ty
+    return stick_datum(self, 0, 0)
   
     
   
@@ -451,26 +939,16 @@ class JoystickPad:
       x /= self.magnitude
       y /= self.magnitude
       self.magnitude = 1
-    self.stick_x = round(x/self.r, 2)
-    self.stick_y = round(y/self.r, 2)
-    self.jstk_node.position = (self.circle_x+x, self.circle_y+y)
-    ctos = CtoS(MSG_TYPES["ControlPacket"], 0, 0, ControlPacket
-                   (self.elem_id, ControlDatum(DATUM_TYPES["Move"], self.stick_x, -self.stick_y)))
-    return ctos.to_bytes()
+    self.knob_x = self.circle_x + x
+    self.knob_y = self.circle_y + y
+    return stick_datum(self, x/self.r, y/self.r)
 
   def datum_from_TE(self, tx, ty):
-    # TODO: change z position to hide crc and stk (or use alpha)
     self.depressed = False
     self.magnitude = 0
     self.circle_x = 0
     self.circle_y = 0
-    self.stick_x = 0
-    self.stick_y = 0
-    self.jcrc_node.alpha = 0
-    self.jstk_node.alpha = 0
-    ctos = CtoS(MSG_TYPES["ControlPacket"], 0, 0, ControlPacket
-                   (self.elem_id, ControlDatum(DATUM_TYPES["Move"], self.stick_x, -self.stick_y)))
-    return ctos.to_bytes()
+    return stick_datum(self, 0, 0)
 
 # datum: element type, element index,
 
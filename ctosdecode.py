@@ -0,0 +1,132 @@
+import array
+import sys
+
+import ctlrcfg as cc
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# the ints of a ControlPacket frame, and of a packed packet in a Batch body
+# (the frame's ints 1-6)
+FRAME_COLUMNS = ('msg_type', 'element_id', 'datum_type', 'a', 'b', 'c', 'd',
+                 'seq')
+PACKED_COLUMNS = FRAME_COLUMNS[1:1 + cc.NUM_INTS_CONTROLDATUM]
+
+
+# Decoded frames as one column per field: msg_type, element_id, datum_type
+# and seq as int32, x and y as float64 put back together from the two ints
+# float_to_two_ints split them into. numpy arrays when numpy is available,
+# else array('i') and array('d'). The columns are copies, so they stay valid
+# after the buffer they came from is reused. Only ControlPacket rows have a
+# meaningful x and y; for Dimensions element_id and datum_type hold the
+# width and height. used is how many bytes of the buffer were decoded.
+class CtoSColumns:
+  def __init__(self, count, used, msg_type, element_id, datum_type, x, y, seq):
+    self.count = count
+    self.used = used
+    self.msg_type = msg_type
+    self.element_id = element_id
+    self.datum_type = datum_type
+    self.x = x
+    self.y = y
+    self.seq = seq
+
+  def __len__(self):
+    return self.count
+
+  # rows as (msg_type, element_id, datum_type, x, y, seq) tuples
+  def rows(self):
+    cols = (self.msg_type, self.element_id, self.datum_type, self.x, self.y,
+            self.seq)
+    if numpy is not None:
+      cols = [c.tolist() for c in cols]
+    return list(zip(*cols))
+
+
+# the two ints of each value back into floats; the inverse of
+# float_to_two_ints
+def join_ints(whole, frac):
+  if numpy is not None:
+    return whole + frac / cc.INT_MAX
+  return array.array('d', [a + b / cc.INT_MAX for a, b in zip(whole, frac)])
+
+
+# the first count rows of buf as little-endian int32s: a count x width
+# view with numpy, else one flat copy in an array('i'), whose strided
+# slices are the columns
+def int_rows(buf, count, width):
+  if numpy is not None:
+    return numpy.frombuffer(buf, dtype='<i4', count=count * width).reshape(
+      count, width)
+  ints = array.array('i')
+  ints.frombytes(memoryview(buf)[:count * width * cc.BYTES_PER_INT])
+  if sys.byteorder == 'big':
+    ints.byteswap()
+  return ints
+
+
+def column(rows, i, width):
+  if numpy is not None:
+    return rows[:, i].copy()
+  return rows[i::width]
+
+
+def decode_rows(buf, width, names, used):
+  count = used // (width * cc.BYTES_PER_INT)
+  rows = int_rows(buf, count, width)
+  cols = {name: column(rows, i, width) for i, name in enumerate(names)}
+  x = join_ints(cols['a'], cols['b'])
+  y = join_ints(cols['c'], cols['d'])
+  return count, cols, x, y
+
+
+# Decodes every whole 32 byte frame at the start of buf (bytes, bytearray,
+# memoryview) in one pass. A partial frame at the end is left for the next
+# call: columns.used says where it starts. Batch bodies and CompactMoves are
+# not whole frames, so a stream that may carry them has to be split at those
+# first (see decode_packed for Batch bodies).
+def decode(buf):
+  used = len(buf) - len(buf) % cc.NUM_BYTES_CTOS
+  count, cols, x, y = decode_rows(buf, cc.NUM_INTS_CTOS, FRAME_COLUMNS, used)
+  return CtoSColumns(count, used, cols['msg_type'], cols['element_id'],
+                     cols['datum_type'], x, y, cols['seq'])
+
+
+# the packed ControlPackets of a Batch body, as columns whose msg_type is
+# ControlPacket and seq 0 (the Batch header has the sequence number)
+def decode_packed(body):
+  used = len(body) - len(body) % cc.NUM_BYTES_CONTROLDATUM
+  count, cols, x, y = decode_rows(body, cc.NUM_INTS_CONTROLDATUM,
+                                  PACKED_COLUMNS, used)
+  if numpy is not None:
+    msg_type = numpy.full(count, cc.CONTROL_PACKET, dtype=numpy.int32)
+    seq = numpy.zeros(count, dtype=numpy.int32)
+  else:
+    msg_type = array.array('i', [cc.CONTROL_PACKET]) * count
+    seq = array.array('i', [0]) * count
+  return CtoSColumns(count, used, msg_type, cols['element_id'],
+                     cols['datum_type'], x, y, seq)
+
+
+# Decodes a stream of whole frames as it arrives in chunks of any size,
+# carrying a partial trailing frame over to the next feed().
+class CtoSStreamDecoder:
+  def __init__(self):
+    self.pending = bytearray()
+    self.frames = 0
+
+  def feed(self, data):
+    if self.pending:
+      self.pending += data
+      buf = self.pending
+    else:
+      buf = data
+    cols = decode(buf)
+    if buf is self.pending:
+      del self.pending[:cols.used]
+    else:
+      self.pending += memoryview(data)[cols.used:]
+    self.frames += cols.count
+    return cols
@@ -0,0 +1,168 @@
+import ctlrcfg as cc
+
+# why a datum was rejected
+UNKNOWN_ELEMENT = 'unknown element'
+DOUBLE_PRESS = 'press while pressed'
+DOUBLE_RELEASE = 'release while released'
+WRONG_DATUM = 'datum type the element does not send'
+
+PRESS = cc.PRESS
+RELEASE = cc.RELEASE
+MOVE = cc.MOVE
+
+
+# A button's pressed state. on_press and on_release are read from the
+# element on each datum, so they can be set after the dispatcher is built.
+class ButtonHandler:
+  __slots__ = ('elem', 'pressed')
+
+  def __init__(self, elem):
+    self.elem = elem
+    self.pressed = False
+
+  # returns None, or why the datum is impossible in the current state
+  def datum(self, datum_type, x, y):
+    if datum_type == PRESS:
+      if self.pressed:
+        return DOUBLE_PRESS
+      self.pressed = True
+      if self.elem.on_press:
+        self.elem.on_press()
+      return None
+    if datum_type == RELEASE:
+      if not self.pressed:
+        return DOUBLE_RELEASE
+      self.pressed = False
+      if self.elem.on_release:
+        self.elem.on_release()
+      return None
+    return WRONG_DATUM
+
+
+# A Joystick's or JoystickPad's state. The client only sends these Moves:
+# the stick leaving the centre is a press, a Move back to (0, 0) a release
+# and anything in between a move. Explicit Press and Release datums are
+# accepted too. A centre Move while released changes nothing.
+class StickHandler:
+  __slots__ = ('elem', 'pressed', 'x', 'y')
+
+  def __init__(self, elem):
+    self.elem = elem
+    self.pressed = False
+    self.x = 0
+    self.y = 0
+
+  def datum(self, datum_type, x, y):
+    if datum_type == MOVE:
+      self.x = x
+      self.y = y
+      if self.pressed:
+        if x == 0 and y == 0:
+          self.pressed = False
+          if self.elem.on_release:
+            self.elem.on_release(x, y)
+        elif self.elem.on_move:
+          self.elem.on_move(x, y)
+      elif x or y:
+        self.pressed = True
+        if self.elem.on_press:
+          self.elem.on_press(x, y)
+      return None
+    if datum_type == PRESS:
+      if self.pressed:
+        return DOUBLE_PRESS
+      self.pressed = True
+      if self.elem.on_press:
+        self.elem.on_press(self.x, self.y)
+      return None
+    if datum_type == RELEASE:
+      if not self.pressed:
+        return DOUBLE_RELEASE
+      self.pressed = False
+      if self.elem.on_release:
+        self.elem.on_release(self.x, self.y)
+      return None
+    return WRONG_DATUM
+
+
+# Server side: calls the on_press/on_release/on_move callbacks of a
+# config's elements for the ControlPackets a client sends, through an
+# elem_id -> handler table built once per config. Datums that are impossible
+# in the element's current state are counted and passed to on_reject
+# (elem_id, datum_type, reason) if set, and otherwise dropped.
+class Dispatcher:
+  def __init__(self, config=None):
+    self.handlers = {}
+    self.events = 0
+    self.rejected = 0
+    self.on_reject = None
+    if config is not None:
+      self.set_config(config)
+
+  # a new config keeps the pressed state of elements whose id and type
+  # survive
+  def set_config(self, config):
+    handlers = {}
+    for btn in config.buttons:
+      handlers[btn.elem_id] = ButtonHandler(btn)
+    for stick in config.joysticks + config.joystickpads:
+      handlers[stick.elem_id] = StickHandler(stick)
+    for elem_id, h in handlers.items():
+      old = self.handlers.get(elem_id)
+      if old is not None and type(old) is type(h):
+        h.pressed = old.pressed
+        if type(h) is StickHandler:
+          h.x = old.x
+          h.y = old.y
+    self.handlers = handlers
+
+  def reject(self, elem_id, datum_type, reason):
+    self.rejected += 1
+    if self.on_reject:
+      self.on_reject(elem_id, datum_type, reason)
+
+  # True if the datum was accepted
+  def dispatch(self, elem_id, datum_type, x=0, y=0):
+    self.events += 1
+    h = self.handlers.get(elem_id)
+    err = UNKNOWN_ELEMENT if h is None else h.datum(datum_type, x, y)
+    if err is None:
+      return True
+    self.reject(elem_id, datum_type, err)
+    return False
+
+  # packets as (elem_id, datum_type, x, y), e.g. from cc.unpack_batch
+  def dispatch_packets(self, packets):
+    get = self.handlers.get
+    n = 0
+    for elem_id, datum_type, x, y in packets:
+      n += 1
+      h = get(elem_id)
+      err = UNKNOWN_ELEMENT if h is None else h.datum(datum_type, x, y)
+      if err is not None:
+        self.reject(elem_id, datum_type, err)
+    self.events += n
+
+  # the ControlPacket rows of ctosdecode columns; other messages are skipped
+  def dispatch_columns(self, cols):
+    cols = (cols.msg_type, cols.element_id, cols.datum_type, cols.x, cols.y)
+    if hasattr(cols[0], 'tolist'):
+      cols = [c.tolist() for c in cols]
+    get = self.handlers.get
+    n = 0
+    for msg_type, elem_id, datum_type, x, y in zip(*cols):
+      if msg_type != cc.CONTROL_PACKET:
+        continue
+      n += 1
+      h = get(elem_id)
+      err = UNKNOWN_ELEMENT if h is None else h.datum(datum_type, x, y)
+      if err is not None:
+        self.reject(elem_id, datum_type, err)
+    self.events += n
+
+  # a single 32 byte ControlPacket frame, at offset in buf
+  def dispatch_frame(self, buf, offset=0):
+    _, elem_id, datum_type, a, b, c, d, _ = cc.CTOS_STRUCT.unpack_from(buf,
+                                                                       offset)
+    return self.dispatch(elem_id, datum_type, a + b / cc.INT_MAX,
+                         c + d / cc.INT_MAX)
@@ -0,0 +1,419 @@
+import time
+
+import cfgcache
+import coalesce
+import common
+import ctlrcfg as cc
+import liveness
+import metrics
+import recorder
+import udpchan
+import window
+
+# unacknowledged packets allowed in flight; 1 is the old stop-and-wait
+WINDOW_SIZE = 8
+# send a frame's control packets together from update(): as one Batch if the
+# server accepts CAP_BATCH, otherwise as ControlPackets in one write. A Batch
+# of n packets is 32 + 24n bytes against 32n, so below 5 packets it is no
+# smaller on the wire (larger below 4); it still takes one ack instead of n.
+BATCH_FRAMES = True
+# offer to send stick Moves as UDP datagrams; used if the server accepts
+# and then reports one of the engine's probe datagrams
+UDP_MOVES = True
+# offer 8 byte CompactMove frames for stick Moves sent over TCP
+COMPACT_MOVES = True
+# seconds a reconnect from update() may spend setting up the connection
+CONNECT_TIMEOUT = 1.0
+
+
+# calls one of an element's datum_from_* methods, timing it and counting
+# touches that produce no packet
+def timed_datum(datum_from, name, tx, ty):
+  start = time.perf_counter()
+  datum = datum_from(tx, ty)
+  metrics.observe(name, time.perf_counter() - start)
+  if datum is None:
+    metrics.count('touches_without_packet')
+  return datum
+
+
+# What the engine needs from a display. Coordinates handed to a renderer
+# are screen coordinates, y measured from the bottom.
+class Renderer:
+  # draw a whole config, replacing whatever is on screen
+  def show_config(self, config):
+    pass
+
+  # screen is the element's coordinates with y reversed (see
+  # CtlrCfg.screen_rows), or None to work them out
+  def add_element(self, kind, elem, screen=None):
+    pass
+
+  def remove_element(self, elem):
+    pass
+
+  # a touch moved a stick's knob (knob_x, knob_y) or showed or hid a pad
+  def element_changed(self, elem):
+    pass
+
+
+# draws nothing; counts calls so benchmarks can see the engine's work
+class HeadlessRenderer(Renderer):
+  def __init__(self):
+    self.shown = 0
+    self.added = 0
+    self.removed = 0
+    self.changed = 0
+
+  def show_config(self, config):
+    self.shown += 1
+
+  def add_element(self, kind, elem, screen=None):
+    self.added += 1
+
+  def remove_element(self, elem):
+    self.removed += 1
+
+  def element_changed(self, elem):
+    self.changed += 1
+
+
+# The controller without a display: the Dimensions handshake, config
+# replies, touch routing, batching, keepalive and reconnects. Whatever
+# shows the layout (a Pythonista scene, or nothing) is a Renderer, and the
+# host calls update() once per frame and the touch_* methods as touches
+# arrive.
+class Engine:
+  def __init__(self, host, port, width, height, renderer=None, cache=None,
+               record_path=None):
+    self.host = host
+    self.port = port
+    self.width = width
+    self.height = height
+    self.renderer = renderer if renderer is not None else HeadlessRenderer()
+    if cache is None:
+      cache = cfgcache.CfgCache(cfgcache.cache_path(host, port, width, height))
+    self.cache = cache
+    self.conn = None
+    self.connecting = None # (Conn, start time) of a reconnect in progress
+    self.sender = None
+    self.udp = None
+    self.compact = False
+    self.batch = False # the server accepted CAP_BATCH
+    self.compact_out = []
+    self.udp_refresh_at = 0 # next refresh_udp
+    self.ctouches = {}
+    self.config = None
+    self.coalescer = coalesce.MoveCoalescer()
+    # stick touches that sent a Move, and those whose quantized value had
+    # not changed
+    self.sticks_emitted = 0
+    self.sticks_suppressed = 0
+    self.outbox = []
+    self.batcher = cc.BatchEncoder()
+    self.reconnector = liveness.Reconnector(self.connect_nowait)
+    self.reconnects = 0
+    self.lost_at = None
+    self.recorder = recorder.Recorder(record_path) if record_path else None
+
+  # draws the last layout this server sent for this screen size right away
+  # (the reply to Dimensions replaces it from update()), then connects
+  def start(self):
+    cached = self.cache.latest()
+    if cached is not None:
+      self.apply_config(cached)
+    return self.connect()
+
+  # opens the connection and sends Dimensions; the current config stays on
+  # screen until the reply replaces it
+  def connect(self):
+    conn = common.Conn()
+    try:
+      conn.connect(self.host, self.port)
+    except OSError:
+      conn.close()
+      return False
+    return self.connected(conn)
+
+  # connect() for update(), which must not block: the first call starts
+  # connecting and later ones check on it. Returns None while in progress.
+  def connect_nowait(self):
+    now = time.monotonic()
+    if self.connecting is None:
+      conn = common.Conn()
+      try:
+        conn.start_connect(self.host, self.port)
+      except OSError:
+        conn.close()
+        return False
+      self.connecting = (conn, now)
+    conn, started = self.connecting
+    try:
+      if not conn.finish_connect():
+        if now - started < CONNECT_TIMEOUT:
+          return None
+        raise TimeoutError('connect timed out')
+    except OSError:
+      self.connecting = None
+      conn.close()
+      return False
+    self.connecting = None
+    return self.connected(conn)
+
+  # sends Dimensions on a freshly connected Conn
+  def connected(self, conn):
+    try:
+      sender = window.WindowedSender(conn, WINDOW_SIZE, self.handle_reply)
+      sender.liveness = liveness.Liveness()
+      sender.recorder = self.recorder
+      caps = 0
+      if UDP_MOVES:
+        caps |= cc.CAP_UDP_MOVES
+      if COMPACT_MOVES:
+        caps |= cc.CAP_COMPACT_MOVES
+      if BATCH_FRAMES:
+        caps |= cc.CAP_BATCH
+      dims_ctos = cc.CtoS(cc.MSG_TYPES['Dimensions'], self.width, self.height,
+                         cc.ControlPacket(0, None), caps=caps)
+      sender.send(dims_ctos.to_bytes())
+    except (OSError, RuntimeError):
+      conn.close()
+      return False
+    self.conn = conn
+    self.sender = sender
+    if self.config is not None:
+      self.config.reset_sent_state()
+    if self.lost_at is not None:
+      print('reconnected after ' +
+            str(round(time.monotonic() - self.lost_at, 3)) + ' s')
+      self.lost_at = None
+    return True
+
+  def connection_lost(self, err):
+    print('connection lost: ' + str(err))
+    self.reconnects += 1
+    self.lost_at = time.monotonic()
+    self.conn.close()
+    if self.udp is not None:
+      self.udp.close()
+    self.conn = None
+    self.sender = None
+    self.udp = None
+    self.compact = False
+    self.batch = False
+    self.outbox.clear()
+    self.compact_out.clear()
+    # Moves held for this frame describe the old session's sticks
+    self.coalescer.clear()
+    self.reconnector.reset(self.lost_at)
+
+  def update(self, now=None):
+    if now is None:
+      now = time.monotonic()
+    if metrics.ENABLED:
+      metrics.tick(now)
+    if self.sender is None:
+      self.reconnector.poll(now)
+      return
+    try:
+      self.flush_frame()
+      if self.udp is not None and now >= self.udp_refresh_at:
+        self.udp_refresh_at = now + liveness.KEEPALIVE_INTERVAL
+        self.refresh_udp()
+      live = self.sender.liveness
+      if live.needs_keepalive(now):
+        if metrics.ENABLED:
+          metrics.count('heartbeats')
+        self.sender.send(cc.HEARTBEAT_BYTES)
+      self.sender.poll()
+      if live.peer_dead(now, self.sender.oldest_unacked()):
+        raise common.ConnectionLost('no reply for ' +
+                                    str(round(live.dead_timeout(), 3)) + ' s')
+    except (OSError, RuntimeError) as e:
+      self.connection_lost(e)
+
+  # switch to a new config, touching only the elements that changed
+  def apply_config(self, config):
+    if self.config is None:
+      self.config = config
+      self.renderer.show_config(config)
+      return
+    diff = self.config.diff(config)
+    config.reuse_unchanged(diff)
+    for kind in cc.ELEMENT_KINDS:
+      for elem in diff.removed[kind]:
+        self.renderer.remove_element(elem)
+      for old, new in diff.changed[kind]:
+        self.renderer.remove_element(old)
+        cc.carry_touch_state(old, new)
+        self.renderer.add_element(kind, new)
+      for elem in diff.added[kind]:
+        self.renderer.add_element(kind, elem)
+    # keep in-progress touches bound to the surviving elements
+    successors = diff.successors()
+    for touch_id, elem in self.ctouches.items():
+      if elem is not None:
+        self.ctouches[touch_id] = successors.get(id(elem), elem)
+    self.config = config
+
+  def send_datum(self, datum):
+    if self.sender is None:
+      return
+    if metrics.ENABLED:
+      metrics.count('datums')
+    try:
+      self.queue_frames(self.coalescer.push(datum))
+    except (OSError, RuntimeError) as e:
+      self.connection_lost(e)
+
+  # Moves go out as datagrams when the server accepted UDP and has reported
+  # seeing one, or as CompactMove frames when it accepted those; everything
+  # else over the TCP connection. A Move back to the centre releases the
+  # stick, so it always goes over TCP: a lost datagram would leave the stick
+  # deflected on the server, and refresh_udp only resends deflected sticks.
+  # Its MoveFence goes first so the server can drop datagrams it overtook.
+  def queue_frames(self, frames):
+    for frame in frames:
+      elem_id = coalesce.move_elem_id(frame)
+      if self.udp is not None and self.udp.confirmed and elem_id is not None:
+        if not coalesce.is_centre_move(frame):
+          self.udp.send(frame)
+          if self.recorder:
+            self.recorder.ctos(frame)
+          continue
+        self.sender.send(self.udp.fence_frame(elem_id))
+      if self.compact and elem_id is not None:
+        compact = cc.compact_from_frame(frame)
+        if compact is not None:
+          if BATCH_FRAMES:
+            self.compact_out.append(compact)
+          else:
+            self.sender.send(compact)
+          continue
+      if BATCH_FRAMES:
+        self.outbox.append(frame)
+      else:
+        self.sender.send(frame)
+
+  def flush_frame(self):
+    self.queue_frames(self.coalescer.flush())
+    # a frame's CompactMoves share one write, ahead of its Batch
+    if self.compact_out:
+      self.sender.send_many(self.compact_out)
+      self.compact_out.clear()
+    frames = self.outbox
+    if len(frames) == 1:
+      self.sender.send(frames[0])
+    elif frames and not self.batch:
+      self.sender.send_many(frames)
+    elif frames:
+      if metrics.ENABLED:
+        start = time.perf_counter()
+        batch = self.batcher.encode(frames)
+        metrics.observe('encode.batch', time.perf_counter() - start)
+        metrics.count('batched_packets', len(frames))
+      else:
+        batch = self.batcher.encode(frames)
+      self.sender.send(batch)
+    frames.clear()
+
+  # A held stick sends nothing new, and a lost datagram is not resent, so
+  # every keepalive interval the deflected sticks send their last Move again.
+  # Until the server reports a datagram, a probe goes instead and Moves stay
+  # on TCP, which is where they stay if UDP is blocked.
+  def refresh_udp(self):
+    if not self.udp.confirmed:
+      self.udp.probe()
+      return
+    if self.config is None:
+      return
+    for elem in self.config.joysticks + self.config.joystickpads:
+      if elem.sent_level != (0, 0):
+        frame = cc.stick_move_bytes(elem)
+        self.udp.send(frame)
+        if self.recorder:
+          self.recorder.ctos(frame)
+        if metrics.ENABLED:
+          metrics.count('udp.resent')
+
+  def handle_reply(self, seq, code, payload):
+    if code == window.STOC_CAPS:
+      caps, token = udpchan.CAPS_PAYLOAD.unpack(payload)
+      if caps & cc.CAP_UDP_MOVES:
+        self.udp = udpchan.UdpMoveSender(self.host, self.port, token)
+        self.udp.probe()
+        self.udp_refresh_at = time.monotonic() + liveness.KEEPALIVE_INTERVAL
+      self.compact = bool(caps & cc.CAP_COMPACT_MOVES)
+      self.batch = bool(caps & cc.CAP_BATCH)
+    elif code == window.STOC_UDP_SEEN:
+      if self.udp is not None:
+        self.udp.confirmed = True
+    elif code == window.STOC_STRING_SPEC or code == window.STOC_BINARY_SPEC:
+      if metrics.ENABLED:
+        metrics.note('spec len', len(payload))
+        metrics.observe('spec_bytes', len(payload), metrics.SIZE_BOUNDS)
+      config = self.cache.get(code, payload)
+      if config is not self.config:
+        self.apply_config(config)
+
+  # touch positions are screen coordinates, y measured from the bottom
+
+  def touch_began(self, touch_id, tx, ty):
+    if self.config is None:
+      self.ctouches[touch_id] = None
+      return
+    # have to reverse y dimension
+    i, elem = self.config.get_element_containing_point(tx, self.height - ty)
+    self.ctouches[touch_id] = elem
+    if elem:
+      if metrics.ENABLED:
+        datum = timed_datum(elem.datum_from_TB, 'encode.touch_began', tx, ty)
+      else:
+        datum = elem.datum_from_TB(tx, ty)
+      self.element_touched(elem, datum)
+
+  def touch_moved(self, touch_id, tx, ty):
+    elem = self.ctouches[touch_id]
+    if elem:
+      if metrics.ENABLED:
+        datum = timed_datum(elem.datum_from_TM, 'encode.touch_moved', tx, ty)
+      else:
+        datum = elem.datum_from_TM(tx, ty)
+      self.element_touched(elem, datum)
+
+  def touch_ended(self, touch_id, tx, ty):
+    elem = self.ctouches[touch_id]
+    if elem:
+      if metrics.ENABLED:
+        datum = timed_datum(elem.datum_from_TE, 'encode.touch_ended', tx, ty)
+      else:
+        datum = elem.datum_from_TE(tx, ty)
+      self.element_touched(elem, datum)
+    del self.ctouches[touch_id]
+
+  def element_touched(self, elem, datum):
+    if elem.elem_type != cc.TYPE_BUTTON:
+      self.renderer.element_changed(elem)
+    if elem.elem_type in cc.STICK_QUANT:
+      if datum:
+        self.sticks_emitted += 1
+      else:
+        self.sticks_suppressed += 1
+      if metrics.ENABLED:
+        metrics.count('sticks.emitted' if datum else 'sticks.suppressed')
+    if datum:
+      self.send_datum(datum)
+
+  def stop(self):
+    print('coalesced away ' + str(self.coalescer.saved()) + ' of ' +
+          str(self.coalescer.moves_in) + ' move packets')
+    print('suppressed ' + str(self.sticks_suppressed) +
+          ' unchanged stick packets, sent ' + str(self.sticks_emitted))
+    if self.udp is not None:
+      self.udp.close()
+    if self.conn is not None:
+      self.conn.close()
+    if self.connecting is not None:
+      self.connecting[0].close()
+    if self.recorder is not None:
+      self.recorder.close()
@@ -0,0 +1,346 @@
+#!/usr/bin/python
+# Controller hub: one selectors loop serving many controllers on port 50079.
+# Each controller's Dimensions picks its layout, which is encoded once per
+# screen size and shared by every controller of that size, including when a
+# new layout is pushed. ControlPackets go to a dispatch.Dispatcher per
+# controller; every frame is answered like standin does.
+import argparse
+import itertools
+import queue
+import selectors
+import socket
+import threading
+import time
+
+import common
+import ctlrcfg as cc
+import dispatch
+import standin
+import udpchan
+import window
+
+NONE_REPLY = common.STOC_HEADER.pack(window.STOC_NONE, 0)
+# None replies for 0..MAX_NONE_RUN frames read at once, built up front so
+# answering heartbeats and packets allocates nothing
+MAX_NONE_RUN = 64
+NONE_RUNS = tuple(NONE_REPLY * n for n in range(MAX_NONE_RUN + 1))
+RECV_SIZE = 64 * 1024
+DIMENSIONS = cc.MSG_TYPES['Dimensions']
+DISCONNECT = cc.MSG_TYPES['Disconnect']
+
+
+# per-connection state
+class Client:
+  def __init__(self, sock, addr, token):
+    self.sock = sock
+    self.addr = addr
+    self.token = token
+    self.dims = None # (w, h) from its Dimensions
+    self.caps = 0 # CAP_* bits accepted
+    self.config = None
+    self.dispatcher = dispatch.Dispatcher()
+    self.pending_in = bytearray() # a partial frame from the last read
+    self.out = bytearray() # replies the socket has not taken yet
+    self.push = None # spec reply that answers the next frame instead of None
+    self.frames = 0
+    self.packets = 0
+
+
+class Hub:
+  def __init__(self, config, host='127.0.0.1', port=0, binary=False,
+               compact=False, design=None):
+    if isinstance(config, str):
+      config = cc.CtlrCfg.from_str(config)
+    self.config = config
+    self.design = design # (w, h) config is laid out for; None sends it as is
+    self.binary = binary # send configs as BinarySpec instead of StringSpec
+    self.compact = compact # accept 8 byte CompactMove frames
+    self.layouts = {} # (w, h) -> (config, encoded spec reply)
+    self.groups = {} # (w, h) -> set of clients
+    self.clients = set()
+    self.pushes = queue.Queue()
+    self.tokens = itertools.count(1)
+    self.encodes = 0
+    self.frames = 0
+    self.packets = 0
+    self.cpu = 0 # seconds of CPU time used by the loop
+    self.rbuf = bytearray(RECV_SIZE)
+    self.rview = memoryview(self.rbuf)
+    self.sel = selectors.DefaultSelector()
+    self.lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.lsock.bind((host, port))
+    self.lsock.listen(1024)
+    self.lsock.setblocking(False)
+    self.sel.register(self.lsock, selectors.EVENT_READ, None)
+    self.host = host
+    self.port = self.lsock.getsockname()[1]
+    self.running = False
+
+  def start(self):
+    self.running = True
+    self.thread = threading.Thread(target=self.serve, daemon=True)
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.running = False
+    self.thread.join()
+    for client in list(self.clients):
+      self.close(client)
+    self.sel.close()
+    self.lsock.close()
+
+  # the next frame from every controller is answered with the new layout;
+  # safe to call from other threads
+  def push_config(self, config):
+    if isinstance(config, str):
+      config = cc.CtlrCfg.from_str(config)
+    self.pushes.put(config)
+
+  def supported_caps(self):
+    if self.compact:
+      return cc.CAP_BATCH | cc.CAP_COMPACT_MOVES
+    return cc.CAP_BATCH
+
+  def spec_reply(self, config):
+    if self.binary:
+      payload = config.to_bin()
+      code = window.STOC_BINARY_SPEC
+    else:
+      payload = config.to_str().encode()
+      code = window.STOC_STRING_SPEC
+    return common.STOC_HEADER.pack(code, len(payload)) + payload
+
+  # the config and its encoded reply for one screen size, built once
+  def layout_for(self, dims):
+    layout = self.layouts.get(dims)
+    if layout is None:
+      config = self.config
+      if self.design is not None and dims != self.design:
+        config = cc.CtlrCfg.from_bin(config.to_bin())
+        config.scale(dims[0] / self.design[0], dims[1] / self.design[1])
+      layout = (config, self.spec_reply(config))
+      self.layouts[dims] = layout
+      self.encodes += 1
+    return layout
+
+  def set_layout(self, client, config):
+    client.config = config
+    client.dispatcher.set_config(config)
+
+  def apply_pushes(self):
+    while not self.pushes.empty():
+      self.config = self.pushes.get()
+      self.layouts.clear()
+      for dims, clients in self.groups.items():
+        config, reply = self.layout_for(dims)
+        for client in clients:
+          self.set_layout(client, config)
+          client.push = reply
+
+  def serve(self):
+    start = time.thread_time()
+    while self.running:
+      self.apply_pushes()
+      for key, events in self.sel.select(0.1):
+        client = key.data
+        if client is None:
+          self.accept()
+          continue
+        if events & selectors.EVENT_WRITE:
+          self.flush(client)
+        if events & selectors.EVENT_READ and client.sock is not None:
+          self.read(client)
+      self.cpu = time.thread_time() - start
+
+  def accept(self):
+    while True:
+      try:
+        sock, addr = self.lsock.accept()
+      except (BlockingIOError, InterruptedError):
+        return
+      sock.setblocking(False)
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      client = Client(sock, addr, next(self.tokens))
+      self.clients.add(client)
+      self.sel.register(sock, selectors.EVENT_READ, client)
+
+  def close(self, client):
+    if client.sock is None:
+      return
+    self.sel.unregister(client.sock)
+    client.sock.close()
+    client.sock = None
+    self.clients.discard(client)
+    if client.dims is not None:
+      group = self.groups[client.dims]
+      group.discard(client)
+      if not group:
+        del self.groups[client.dims]
+
+  def read(self, client):
+    try:
+      n = client.sock.recv_into(self.rbuf)
+    except (BlockingIOError, InterruptedError):
+      return
+    except OSError:
+      n = 0
+    if n == 0:
+      self.close(client)
+      return
+    if client.pending_in:
+      client.pending_in += self.rview[:n]
+      buf = client.pending_in
+      end = len(buf)
+    else:
+      buf = self.rview
+      end = n
+    used = self.handle_frames(client, buf, end)
+    if used is None:
+      return
+    if buf is client.pending_in:
+      del client.pending_in[:used]
+    elif used < end:
+      client.pending_in += self.rview[used:end]
+
+  # handles the whole frames in buf[:end] and answers them in one write;
+  # returns the bytes used, or None if the client disconnected
+  def handle_frames(self, client, buf, end):
+    pos = 0
+    frames = 0
+    packets = 0
+    nones = 0
+    parts = None
+    while end - pos >= cc.NUM_BYTES_COMPACT_MOVE:
+      msg_type = buf[pos]
+      reply = None
+      if msg_type == cc.COMPACT_MOVE and client.caps & cc.CAP_COMPACT_MOVES:
+        size = cc.NUM_BYTES_COMPACT_MOVE
+        elem_id, x, y = cc.unpack_compact_move(buf, pos)
+        client.dispatcher.dispatch(elem_id, cc.MOVE, x, y)
+        packets += 1
+      else:
+        size = cc.NUM_BYTES_CTOS
+        if end - pos < size:
+          break
+        if msg_type == cc.CONTROL_PACKET:
+          client.dispatcher.dispatch_frame(buf, pos)
+          packets += 1
+        elif msg_type == cc.BATCH:
+          count = cc.CTOS_STRUCT.unpack_from(buf, pos)[1]
+          size += count * cc.NUM_BYTES_CONTROLDATUM
+          if end - pos < size:
+            break
+          client.dispatcher.dispatch_packets(
+            cc.unpack_batch(buf[pos + cc.NUM_BYTES_CTOS:pos + size]))
+          packets += count
+        elif msg_type == DIMENSIONS:
+          reply = self.handshake(client, buf, pos)
+        elif msg_type == DISCONNECT:
+          self.count(client, frames + 1, packets)
+          self.close(client)
+          return None
+      pos += size
+      frames += 1
+      if reply is None and client.push is not None:
+        reply = client.push
+        client.push = None
+      if reply is None:
+        nones += 1
+        continue
+      if parts is None:
+        parts = []
+      if nones:
+        parts.append(NONE_REPLY * nones)
+        nones = 0
+      parts.append(reply)
+    self.count(client, frames, packets)
+    if parts is not None:
+      if nones:
+        parts.append(NONE_REPLY * nones)
+      self.write(client, b''.join(parts))
+    elif nones:
+      self.write(client, NONE_RUNS[nones] if nones <= MAX_NONE_RUN
+                 else NONE_REPLY * nones)
+    return pos
+
+  def count(self, client, frames, packets):
+    client.frames += frames
+    client.packets += packets
+    self.frames += frames
+    self.packets += packets
+
+  # joins the client to the group for its screen size and returns the
+  # Caps and spec replies
+  def handshake(self, client, buf, pos):
+    _, w, h, caps, _, _, _, _ = cc.CTOS_STRUCT.unpack_from(buf, pos)
+    dims = (w, h)
+    if client.dims is not None:
+      self.groups[client.dims].discard(client)
+    client.dims = dims
+    self.groups.setdefault(dims, set()).add(client)
+    client.caps = caps & self.supported_caps()
+    config, reply = self.layout_for(dims)
+    self.set_layout(client, config)
+    client.push = None
+    if client.caps:
+      payload = udpchan.CAPS_PAYLOAD.pack(client.caps, client.token)
+      return (common.STOC_HEADER.pack(window.STOC_CAPS, len(payload)) +
+              payload + reply)
+    return reply
+
+  def write(self, client, data):
+    if client.out:
+      client.out += data
+      return
+    try:
+      sent = client.sock.send(data)
+    except (BlockingIOError, InterruptedError):
+      sent = 0
+    except OSError:
+      self.close(client)
+      return
+    if sent < len(data):
+      client.out += memoryview(data)[sent:]
+      self.sel.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE,
+                      client)
+
+  def flush(self, client):
+    try:
+      sent = client.sock.send(client.out)
+    except (BlockingIOError, InterruptedError):
+      return
+    except OSError:
+      self.close(client)
+      return
+    del client.out[:sent]
+    if not client.out:
+      self.sel.modify(client.sock, selectors.EVENT_READ, client)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='multi-controller hub')
+  parser.add_argument('--host', default='0.0.0.0')
+  parser.add_argument('--port', type=int, default=50079)
+  parser.add_argument('--binary', action='store_true',
+                      help='send configs as BinarySpec')
+  parser.add_argument('--compact', action='store_true',
+                      help='accept CompactMove frames')
+  parser.add_argument('--design', default=None,
+                      help='WxH the layout is made for; other screen sizes '
+                      'get it scaled')
+  args = parser.parse_args()
+  design = None
+  if args.design:
+    design = tuple(int(v) for v in args.design.split('x'))
+  hub = Hub(standin.DEFAULT_SPEC, args.host, args.port, args.binary,
+            args.compact, design).start()
+  print('hub listening on ' + args.host + ':' + str(hub.port))
+  try:
+    while True:
+      time.sleep(1)
+      print(str(len(hub.clients)) + ' controllers in ' + str(len(hub.groups)) +
+            ' screen sizes, ' + str(hub.packets) + ' packets')
+  except KeyboardInterrupt:
+    hub.stop()
@@ -0,0 +1,84 @@
+import time
+
+KEEPALIVE_INTERVAL = 0.25 # send a Heartbeat after this long with no traffic
+MIN_DEAD_TIMEOUT = 1.0
+MAX_DEAD_TIMEOUT = 5.0
+RECONNECT_MIN_DELAY = 0.05
+RECONNECT_MAX_DELAY = 0.5
+
+
+# Tracks traffic in both directions on a monotonic clock. Anything sent on
+# the connection counts as a keepalive, so Heartbeats only go out when it is
+# idle; datagrams on the side do not, as nothing answers them.
+# Round trip times feed a smoothed estimate (as in TCP's RTO) that decides
+# how long a reply may be outstanding before the peer is declared dead.
+class Liveness:
+  def __init__(self, now=None):
+    if now is None:
+      now = time.monotonic()
+    self.last_sent = now
+    self.last_heard = now
+    self.srtt = None
+    self.rttvar = None
+    self.keepalives = 0
+
+  def sent(self, now):
+    self.last_sent = now
+
+  def heard(self, now, rtt=None):
+    self.last_heard = now
+    if rtt is None:
+      return
+    if self.srtt is None:
+      self.srtt = rtt
+      self.rttvar = rtt / 2
+    else:
+      self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+      self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+  def needs_keepalive(self, now):
+    if now - self.last_sent >= KEEPALIVE_INTERVAL:
+      self.keepalives += 1
+      return True
+    return False
+
+  def dead_timeout(self):
+    if self.srtt is None:
+      return MAX_DEAD_TIMEOUT
+    return min(MAX_DEAD_TIMEOUT,
+               max(MIN_DEAD_TIMEOUT, 4 * (self.srtt + 4 * self.rttvar)))
+
+  # oldest_unacked is when the oldest unanswered frame was sent, or None
+  def peer_dead(self, now, oldest_unacked):
+    if oldest_unacked is None:
+      return False
+    return now - oldest_unacked > self.dead_timeout()
+
+
+# Calls connect() no more often than an exponentially growing delay allows,
+# so a missing server does not stall every frame. connect() returns True on
+# success, False on failure, or None while a connection is still being set
+# up, in which case it is called again on the next poll.
+class Reconnector:
+  def __init__(self, connect):
+    self.connect = connect
+    self.reset(0)
+
+  def reset(self, now):
+    self.delay = RECONNECT_MIN_DELAY
+    self.next_attempt = now
+    self.attempts = 0
+
+  def poll(self, now):
+    if now < self.next_attempt:
+      return False
+    result = self.connect()
+    if result is None:
+      return False
+    self.attempts += 1
+    if result:
+      self.reset(now)
+      return True
+    self.next_attempt = now + self.delay
+    self.delay = min(self.delay * 2, RECONNECT_MAX_DELAY)
+    return False
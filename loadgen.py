@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# Headless load generator for the port 50079 protocol: N simulated
+# controllers do the Dimensions handshake and then stream ControlPackets at
+# a fixed rate each. Reports packets/s, bytes/s and reply latency.
+import argparse
+import asyncio
+import json
+import time
+
+import aconn
+import cfgcache
+import ctlrcfg as cc
+import standin
+
+
+class Stats:
+  def __init__(self):
+    self.packets = 0
+    self.bytes = 0
+    self.rtts = []
+    self.failed = 0
+
+
+def percentile(sorted_vals, p):
+  if not sorted_vals:
+    return 0
+  i = min(len(sorted_vals) - 1, int(p * len(sorted_vals)))
+  return sorted_vals[i]
+
+
+# Press/Release for the buttons and sweeping Moves for the sticks of the
+# config the server sent, in a fixed cycle
+def packet_cycle(config):
+  packets = []
+  for btn in config.buttons:
+    packets.append(cc.packet_to_bytes(btn.elem_id, cc.PRESS, 0, 0))
+    packets.append(cc.packet_to_bytes(btn.elem_id, cc.RELEASE, 0, 0))
+  sticks = config.joysticks + config.joystickpads
+  for step in range(20):
+    v = round(step / 10 - 1, 2)
+    for stick in sticks:
+      packets.append(cc.packet_to_bytes(stick.elem_id, cc.MOVE, v, -v))
+  if not packets:
+    packets.append(cc.HEARTBEAT_BYTES)
+  return packets
+
+
+def retrieve(fut):
+  if not fut.cancelled():
+    fut.exception()
+
+
+async def controller(args, cache, stats, start_at, stop_at):
+  conn = aconn.AsyncConn()
+  try:
+    await conn.connect(args.host, args.port, timeout=5)
+    ctl = aconn.AsyncController(conn, args.width, args.height, args.window,
+                                cache)
+    ctl.rtt_sink = stats.rtts
+    await ctl.setup()
+  except (OSError, asyncio.TimeoutError, RuntimeError):
+    stats.failed += 1
+    conn.close()
+    return
+  packets = packet_cycle(ctl.config)
+  interval = 1 / args.rate
+  next_send = max(start_at, time.monotonic())
+  i = 0
+  try:
+    while next_send < stop_at:
+      delay = next_send - time.monotonic()
+      if delay > 0:
+        await asyncio.sleep(delay)
+      datum = packets[i % len(packets)]
+      fut = await ctl.send_datum(datum)
+      # a lost connection is counted once, from send_datum or drain
+      fut.add_done_callback(retrieve)
+      stats.packets += 1
+      stats.bytes += len(datum)
+      i += 1
+      next_send += interval
+    await ctl.drain()
+    await ctl.close()
+  except (OSError, ConnectionError):
+    stats.failed += 1
+    await ctl.close()
+
+
+async def run(args):
+  cache = cfgcache.CfgCache()
+  stats = Stats()
+  start_at = time.monotonic() + 0.5
+  stop_at = start_at + args.duration
+  await asyncio.gather(*[controller(args, cache, stats, start_at, stop_at)
+                         for _ in range(args.clients)])
+  return stats, time.monotonic() - start_at
+
+
+def main():
+  parser = argparse.ArgumentParser(description='controller load generator')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=50079)
+  parser.add_argument('--clients', type=int, default=10)
+  parser.add_argument('--rate', type=float, default=60,
+                      help='packets/s per controller')
+  parser.add_argument('--duration', type=float, default=5)
+  parser.add_argument('--window', type=int, default=8)
+  parser.add_argument('--width', type=int, default=1024)
+  parser.add_argument('--height', type=int, default=768)
+  parser.add_argument('--local', action='store_true',
+                      help='start a stand-in server in this process')
+  parser.add_argument('--latency', type=float, default=0,
+                      help='reply delay of the local stand-in server')
+  parser.add_argument('--json', action='store_true')
+  args = parser.parse_args()
+  server = None
+  if args.local:
+    server = standin.StandInServer(port=0, latency=args.latency).start()
+    args.port = server.port
+  stats, elapsed = asyncio.run(run(args))
+  if server:
+    server.stop()
+  rtts = sorted(stats.rtts)
+  report = {
+    'clients': args.clients,
+    'failed': stats.failed,
+    'packets': stats.packets,
+    'packets_per_s': stats.packets / elapsed,
+    'bytes_per_s': stats.bytes / elapsed,
+    'rtt_p50_ms': percentile(rtts, 0.5) * 1e3,
+    'rtt_p99_ms': percentile(rtts, 0.99) * 1e3,
+    'rtt_p999_ms': percentile(rtts, 0.999) * 1e3,
+  }
+  if args.json:
+    print(json.dumps(report))
+    return
+  print('%d controllers (%d failed), %d packets in %.2f s' %
+        (args.clients, stats.failed, stats.packets, elapsed))
+  print('%.0f packets/s, %.0f bytes/s' %
+        (report['packets_per_s'], report['bytes_per_s']))
+  print('rtt p50 %.2f ms, p99 %.2f ms, p999 %.2f ms' %
+        (report['rtt_p50_ms'], report['rtt_p99_ms'], report['rtt_p999_ms']))
+
+
+if __name__ == '__main__':
+  main()
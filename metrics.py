@@ -0,0 +1,136 @@
+import bisect
+import collections
+import time
+
+# Off by default. Every instrumented spot checks ENABLED first, so disabled
+# metrics cost one attribute lookup; see enable()
+ENABLED = False
+DUMP_INTERVAL = None # seconds between dumps from tick(), None for never
+NOTE_RING = 256 # notes kept, oldest dropped first
+
+# histogram bucket upper bounds: seconds from 1 us to about 67 s and sizes
+# from 1 byte to 16 MB, each a factor of 2 apart
+TIME_BOUNDS = [1e-6 * 2**i for i in range(27)]
+SIZE_BOUNDS = [float(2**i) for i in range(25)]
+
+COUNTERS = {}
+HISTOGRAMS = {}
+NOTES = collections.deque(maxlen=NOTE_RING) # (time, what, args)
+STATE = {'last_dump': None}
+
+
+# Fixed buckets plus count, sum, min and max. Percentiles are the upper
+# bound of the bucket they fall in (at most max), so within a factor of 2.
+class Histogram:
+  def __init__(self, bounds=TIME_BOUNDS):
+    self.bounds = bounds
+    self.buckets = [0] * (len(bounds) + 1) # the last one is past the bounds
+    self.count = 0
+    self.total = 0
+    self.min = None
+    self.max = None
+
+  def add(self, value):
+    self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+    self.count += 1
+    self.total += value
+    if self.min is None or value < self.min:
+      self.min = value
+    if self.max is None or value > self.max:
+      self.max = value
+
+  def percentile(self, p):
+    if not self.count:
+      return None
+    rank = p * self.count
+    seen = 0
+    for i, n in enumerate(self.buckets):
+      seen += n
+      if seen >= rank and n:
+        if i < len(self.bounds):
+          return min(self.bounds[i], self.max)
+        return self.max
+    return self.max
+
+  def summary(self):
+    return {
+      'count': self.count,
+      'mean': self.total / self.count if self.count else None,
+      'min': self.min,
+      'max': self.max,
+      'p50': self.percentile(0.5),
+      'p90': self.percentile(0.9),
+      'p99': self.percentile(0.99),
+    }
+
+
+def enable(dump_interval=None):
+  global ENABLED, DUMP_INTERVAL
+  ENABLED = True
+  DUMP_INTERVAL = dump_interval
+  STATE['last_dump'] = time.monotonic()
+
+
+def disable():
+  global ENABLED
+  ENABLED = False
+
+
+def reset():
+  COUNTERS.clear()
+  HISTOGRAMS.clear()
+  NOTES.clear()
+
+
+def count(name, n=1):
+  COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+
+def observe(name, value, bounds=TIME_BOUNDS):
+  hist = HISTOGRAMS.get(name)
+  if hist is None:
+    hist = HISTOGRAMS[name] = Histogram(bounds)
+  hist.add(value)
+
+
+# an event worth seeing that used to be printed; formatted only when dumped
+def note(what, *args):
+  NOTES.append((time.monotonic(), what, args))
+
+
+def snapshot():
+  return {
+    'counters': dict(COUNTERS),
+    'histograms': {name: h.summary() for name, h in HISTOGRAMS.items()},
+    'notes': [(t, what) + args for t, what, args in NOTES],
+  }
+
+
+def format_value(name, v):
+  if v is None:
+    return '-'
+  if HISTOGRAMS[name].bounds is TIME_BOUNDS:
+    return '%.3f ms' % (v * 1e3)
+  return '%.0f' % v
+
+
+def dump(out=print):
+  for name in sorted(COUNTERS):
+    out('%-32s %d' % (name, COUNTERS[name]))
+  for name in sorted(HISTOGRAMS):
+    s = HISTOGRAMS[name].summary()
+    out('%-32s n=%d mean %s p50 %s p99 %s max %s' %
+        (name, s['count'], format_value(name, s['mean']),
+         format_value(name, s['p50']), format_value(name, s['p99']),
+         format_value(name, s['max'])))
+  while NOTES:
+    t, what, args = NOTES.popleft()
+    out(' '.join([what] + [str(a) for a in args]))
+
+
+# called once per frame by the engine; dumps every DUMP_INTERVAL seconds
+def tick(now):
+  if DUMP_INTERVAL is None or now - STATE['last_dump'] < DUMP_INTERVAL:
+    return
+  STATE['last_dump'] = now
+  dump()
@@ -0,0 +1,93 @@
+import mmap
+import struct
+import time
+
+# Session log: fixed 48 byte records, so a log can be memory-mapped and
+# indexed by record number. Each record is the seconds since the session
+# started, a kind, the StoC code (0 for CtoS), the full length of the
+# message and its first 32 bytes. A CtoS message longer than 32 bytes (a
+# Batch) carries on in KIND_MORE records; StoC payloads are cut at 32 bytes,
+# as a replay only needs their codes.
+RECORD = struct.Struct('<dBBxxI32s')
+RECORD_LEN = RECORD.size
+DATA_LEN = 32
+KIND_HEADER = 0
+KIND_CTOS = 1
+KIND_STOC = 2
+KIND_MORE = 3
+MAGIC = b'ctlrec1'
+
+
+class Recorder:
+  def __init__(self, path):
+    self.path = path
+    self.f = open(path, 'wb')
+    self.start = time.monotonic()
+    self.records = 0
+    # the header's time is the wall clock the session started at
+    self.write(time.time(), KIND_HEADER, 0, len(MAGIC), MAGIC)
+
+  def write(self, t, kind, code, length, data):
+    self.f.write(RECORD.pack(t, kind, code, length, bytes(data)))
+    self.records += 1
+
+  def ctos(self, frame):
+    t = time.monotonic() - self.start
+    n = len(frame)
+    self.write(t, KIND_CTOS, 0, n, frame[:DATA_LEN])
+    for i in range(DATA_LEN, n, DATA_LEN):
+      self.write(t, KIND_MORE, 0, n, frame[i:i + DATA_LEN])
+
+  def stoc(self, code, payload):
+    t = time.monotonic() - self.start
+    if payload is None:
+      payload = b''
+    self.write(t, KIND_STOC, code, len(payload), payload[:DATA_LEN])
+
+  def close(self):
+    self.f.close()
+
+
+# Reads a session log through mmap without loading it.
+class LogReader:
+  def __init__(self, path):
+    self.f = open(path, 'rb')
+    self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.count = len(self.map) // RECORD_LEN
+    if self.count == 0:
+      raise ValueError(path + ' is not a session log')
+    started, kind, code, length, data = self.record(0)
+    if kind != KIND_HEADER or data[:length] != MAGIC:
+      raise ValueError(path + ' is not a session log')
+    self.started = started
+
+  # (t, kind, code, length, data) of record i
+  def record(self, i):
+    return RECORD.unpack_from(self.map, i * RECORD_LEN)
+
+  # yields (t, kind, code, message) per CtoS frame or StoC reply, with
+  # continued CtoS frames joined back together; a frame cut short by the
+  # end of the log is dropped
+  def messages(self):
+    i = 1
+    while i < self.count:
+      t, kind, code, length, data = self.record(i)
+      i += 1
+      if kind == KIND_STOC:
+        yield t, kind, code, data[:min(length, DATA_LEN)]
+      elif kind == KIND_CTOS:
+        parts = [data[:min(length, DATA_LEN)]]
+        got = len(parts[0])
+        while got < length and i < self.count:
+          t2, kind2, code2, length2, more = self.record(i)
+          if kind2 != KIND_MORE:
+            break
+          i += 1
+          parts.append(more[:min(length - got, DATA_LEN)])
+          got += len(parts[-1])
+        if got == length:
+          yield t, kind, code, b''.join(parts)
+
+  def close(self):
+    self.map.close()
+    self.f.close()
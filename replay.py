@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# Streams the CtoS frames of a session log written by recorder.Recorder to a
+# server: on the recorded schedule, N times faster, or as fast as the window
+# allows. Reports frames/s, bytes/s and reply latency.
+import argparse
+import json
+import select
+import time
+
+import common
+import ctlrcfg as cc
+import loadgen
+import recorder
+import standin
+import udpchan
+import window
+
+
+class Replay:
+  def __init__(self, conn, window_size):
+    self.sender = window.WindowedSender(conn, window_size, self.on_reply)
+    self.accepted_caps = 0
+    self.rtts = []
+    self.replies = {} # StoC code -> count
+
+  def on_reply(self, seq, code, payload):
+    if code == window.STOC_CAPS:
+      self.accepted_caps, token = udpchan.CAPS_PAYLOAD.unpack(payload)
+      return
+    if code == window.STOC_UDP_SEEN:
+      return
+    self.rtts.append(self.sender.last_rtt)
+    self.replies[code] = self.replies.get(code, 0) + 1
+
+  # handles replies as they come in until the deadline
+  def wait_until(self, deadline):
+    while True:
+      self.sender.poll()
+      delay = deadline - time.monotonic()
+      if delay <= 0:
+        return
+      if self.sender.in_flight:
+        select.select([self.sender.conn.sock], [], [], delay)
+      else:
+        time.sleep(delay)
+
+  # a recorded CompactMove or Batch goes out as ControlPackets if this
+  # server did not accept them
+  def frames_for(self, msg):
+    if msg[0] == cc.COMPACT_MOVE and not self.accepted_caps & cc.CAP_COMPACT_MOVES:
+      elem_id, x, y = cc.unpack_compact_move(msg)
+      return [cc.packet_to_bytes(elem_id, cc.MOVE, x, y)]
+    # fences only mean something to a server taking Moves as datagrams
+    if msg[0] == udpchan.MOVE_FENCE and not self.accepted_caps & cc.CAP_UDP_MOVES:
+      return []
+    if msg[0] == cc.BATCH and not self.accepted_caps & cc.CAP_BATCH:
+      body = msg[cc.NUM_BYTES_CTOS:]
+      return [cc.CTOS_STRUCT.pack(cc.CONTROL_PACKET, *packed, 0)
+              for packed in cc.PACKED_PACKET_STRUCT.iter_unpack(body)]
+    return [msg]
+
+
+# speed 1 keeps the recorded timing, 0 sends as fast as possible
+def replay(log, host, port, speed=1, window_size=8):
+  conn = common.Conn()
+  conn.connect(host, port)
+  rp = Replay(conn, window_size)
+  frames = 0
+  sent_bytes = 0
+  recorded = 0
+  start = time.monotonic()
+  for t, kind, code, msg in log.messages():
+    if kind != recorder.KIND_CTOS or msg[0] == cc.MSG_TYPES['Disconnect']:
+      continue
+    recorded = t
+    if speed > 0:
+      rp.wait_until(start + t / speed)
+    for frame in rp.frames_for(msg):
+      rp.sender.send(frame)
+      frames += 1
+      sent_bytes += len(frame)
+    # the caps this server accepts decide how later frames are sent
+    if msg[0] == cc.MSG_TYPES['Dimensions']:
+      rp.sender.drain()
+    else:
+      rp.sender.poll()
+  rp.sender.drain()
+  elapsed = time.monotonic() - start
+  conn.close()
+  rtts = sorted(rp.rtts)
+  return {
+    'frames': frames,
+    'bytes': sent_bytes,
+    'recorded_s': recorded,
+    'elapsed_s': elapsed,
+    'frames_per_s': frames / elapsed,
+    'bytes_per_s': sent_bytes / elapsed,
+    'rtt_p50_ms': loadgen.percentile(rtts, 0.5) * 1e3,
+    'rtt_p99_ms': loadgen.percentile(rtts, 0.99) * 1e3,
+    'rtt_p999_ms': loadgen.percentile(rtts, 0.999) * 1e3,
+    'replies': rp.replies,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description='replay a recorded session')
+  parser.add_argument('log')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=50079)
+  parser.add_argument('--speed', type=float, default=1,
+                      help='multiple of the recorded speed; 0 for as fast '
+                           'as possible')
+  parser.add_argument('--window', type=int, default=8)
+  parser.add_argument('--local', action='store_true',
+                      help='start a stand-in server in this process')
+  parser.add_argument('--json', action='store_true')
+  args = parser.parse_args()
+  server = None
+  if args.local:
+    server = standin.StandInServer(port=0, compact=True).start()
+    args.port = server.port
+  log = recorder.LogReader(args.log)
+  report = replay(log, args.host, args.port, args.speed, args.window)
+  log.close()
+  if server:
+    server.stop()
+  if args.json:
+    print(json.dumps(report))
+    return
+  print('%d frames recorded over %.2f s, replayed in %.2f s' %
+        (report['frames'], report['recorded_s'], report['elapsed_s']))
+  print('%.0f frames/s, %.0f bytes/s' %
+        (report['frames_per_s'], report['bytes_per_s']))
+  print('rtt p50 %.2f ms, p99 %.2f ms, p999 %.2f ms' %
+        (report['rtt_p50_ms'], report['rtt_p99_ms'], report['rtt_p999_ms']))
+
+
+if __name__ == '__main__':
+  main()
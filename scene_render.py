@@ -0,0 +1,238 @@
+import collections
+
+from scene import *
+import ui
+
+import cfgarrays
+import ctlrcfg as cc
+import engine
+
+ROUNDNESS = 8
+SPACE = 2
+
+BUTTON_CLR   = '#999999'
+JOYPAD_CLR   = '#888888'
+JOYSTICK_CLR = '#9999A2'
+
+SHAPE_CACHE_SIZE = 64 # distinct paths kept
+NODE_POOL_SIZE = 256 # detached nodes kept for reuse
+
+def color_int_to_str(num):
+  byts = num.to_bytes(4, 'little')
+  s = '#'
+  s += hex(byts[0]).split('x')[1]
+  s += hex(byts[1]).split('x')[1]
+  s += hex(byts[2]).split('x')[1]
+  return s
+
+
+# rounded rect shape node
+def get_RRSN(x, y, w, h, color):
+  shape = ui.Path.rounded_rect(0, 0, w-SPACE*2, h-SPACE*2, ROUNDNESS)
+  shape_node = ShapeNode(shape, color)
+  shape_node.position = (SPACE+x+w/2, SPACE+y+h/2)
+  return shape_node
+
+
+# rounded rect shape node
+def get_RRSN2(x1, y1, x2, y2, color):
+  w = x2 - x1
+  h = y2 - y1
+  shape = ui.Path.rounded_rect(0, 0, w-SPACE*2, h-SPACE*2, ROUNDNESS)
+  shape_node = ShapeNode(shape, color)
+  shape_node.position = (SPACE+x1+w/2, SPACE+y1+h/2)
+  return shape_node
+
+def get_RSN2(x1, y1, x2, y2, color):
+  w = x2 - x1
+  h = y2 - y1
+  shape = ui.Path.rect(0, 0, w-SPACE*2, h-SPACE*2)
+  shape_node = ShapeNode(shape, color_int_to_str(color))
+  shape_node.position = (SPACE+x1+w/2, SPACE+y1+h/2)
+  return shape_node
+
+# circle shape node
+def get_CircSN(x, y, r, color):
+  shape = ui.Path.oval(0, 0, (r-SPACE)*2, (r-SPACE)*2)
+  shape_node = ShapeNode(shape, color)
+  shape_node.position = (x, y)
+  return shape_node
+
+
+# Paths and nodes for the renderer. Layouts reuse a handful of sizes and
+# colours, so ui.Paths are kept in an LRU keyed by shape kind and size, and
+# nodes taken off the screen wait in a pool keyed by (kind, size, colour)
+# until a node of the same shape is wanted again. Only the position of a
+# reused node changes.
+class ShapeCache:
+  def __init__(self, max_paths=SHAPE_CACHE_SIZE, max_pooled=NODE_POOL_SIZE):
+    self.max_paths = max_paths
+    self.max_pooled = max_pooled
+    self.paths = collections.OrderedDict() # (kind, w, h) -> ui.Path
+    self.colors = {}
+    self.pool = {} # (kind, w, h, color) -> [ShapeNode]
+    self.pooled = 0
+    self.paths_built = 0
+    self.nodes_built = 0
+    self.reused = 0
+
+  def path(self, kind, w, h):
+    key = (kind, w, h)
+    path = self.paths.get(key)
+    if path is not None:
+      self.paths.move_to_end(key)
+      return path
+    if kind == 'rounded_rect':
+      path = ui.Path.rounded_rect(0, 0, w, h, ROUNDNESS)
+    elif kind == 'rect':
+      path = ui.Path.rect(0, 0, w, h)
+    else:
+      path = ui.Path.oval(0, 0, w, h)
+    self.paths_built += 1
+    if self.max_paths:
+      self.paths[key] = path
+      while len(self.paths) > self.max_paths:
+        self.paths.popitem(last=False)
+    return path
+
+  # panel colours arrive as ints
+  def color(self, color):
+    if not isinstance(color, int):
+      return color
+    s = self.colors.get(color)
+    if s is None:
+      s = color_int_to_str(color)
+      self.colors[color] = s
+    return s
+
+  # a ShapeNode of the given path and colour, centred on (x, y)
+  def node(self, kind, w, h, color, x, y):
+    w = round(w, 2)
+    h = round(h, 2)
+    key = (kind, w, h, color)
+    nodes = self.pool.get(key)
+    if nodes:
+      node = nodes.pop()
+      self.pooled -= 1
+      self.reused += 1
+      node.alpha = 1
+    else:
+      node = ShapeNode(self.path(kind, w, h), self.color(color))
+      node.shape_key = key
+      self.nodes_built += 1
+    node.position = (x, y)
+    return node
+
+  # takes a node off the screen, keeping it for reuse if there is room
+  def release(self, node):
+    node.remove_from_parent()
+    key = getattr(node, 'shape_key', None)
+    if key is None or self.pooled >= self.max_pooled:
+      return
+    self.pool.setdefault(key, []).append(node)
+    self.pooled += 1
+
+  def rounded_rect_node(self, x1, y1, x2, y2, color):
+    w = x2 - x1
+    h = y2 - y1
+    return self.node('rounded_rect', w-SPACE*2, h-SPACE*2, color,
+                     SPACE+x1+w/2, SPACE+y1+h/2)
+
+  def rect_node(self, x1, y1, x2, y2, color):
+    w = x2 - x1
+    h = y2 - y1
+    return self.node('rect', w-SPACE*2, h-SPACE*2, color,
+                     SPACE+x1+w/2, SPACE+y1+h/2)
+
+  def circle_node(self, x, y, r, color):
+    return self.node('oval', (r-SPACE)*2, (r-SPACE)*2, color, x, y)
+
+
+# Draws a config as ShapeNodes in a Pythonista scene. Each element keeps
+# its nodes in elem.nodes so they move with it when a new config reuses it.
+class SceneRenderer(engine.Renderer):
+  def __init__(self, scene, shapes=None):
+    self.scene = scene
+    self.shapes = shapes if shapes is not None else ShapeCache()
+
+  def show_config(self, config):
+    # clear previous children
+    for node in list(self.scene.children):
+      self.shapes.release(node)
+
+    # add new children, with the y flip done for each kind at once
+    for kind in cc.ELEMENT_KINDS:
+      rows = config.screen_rows(kind, self.scene.size.y)
+      for elem, screen in zip(getattr(config, kind), rows):
+        self.add_element(kind, elem, screen)
+
+  def add_element(self, kind, elem, screen=None):
+    if screen is None:
+      screen = cfgarrays.flip_elem(kind, elem, self.scene.size.y)
+    getattr(self, 'add_' + kind[:-1] + '_nodes')(elem, screen)
+
+  def remove_element(self, elem):
+    for node in elem.nodes:
+      self.shapes.release(node)
+    elem.nodes = []
+
+  def element_changed(self, elem):
+    if elem.elem_type == cc.TYPE_JOYSTICK:
+      elem.jstk_node.position = (elem.knob_x, elem.knob_y)
+    elif elem.elem_type == cc.TYPE_JOYSTICKPAD:
+      # the pad's circle and stick only show while it is touched
+      alpha = 1 if elem.depressed else 0
+      elem.jcrc_node.alpha = alpha
+      elem.jstk_node.alpha = alpha
+      if elem.depressed:
+        elem.jcrc_node.position = (elem.circle_x, elem.circle_y)
+        elem.jstk_node.position = (elem.knob_x, elem.knob_y)
+
+  # z order: panels, pads and buttons, joystick circles, sticks
+  def add_node(self, elem, node, z):
+    node.z_position = z
+    self.scene.add_child(node)
+    elem.nodes.append(node)
+
+  def add_panel_nodes(self, pnl, screen):
+    pnl.nodes = []
+    x1, y1, x2, y2 = screen
+    pnl_node = self.shapes.rect_node(x1, y1,
+                                     x2, y2, pnl.color)
+    self.add_node(pnl, pnl_node, 0)
+
+  def add_button_nodes(self, btn, screen):
+    btn.nodes = []
+    x1, y1, x2, y2 = screen
+    btn_node = self.shapes.rounded_rect_node(x1, y1,
+                                             x2, y2, BUTTON_CLR)
+    self.add_node(btn, btn_node, 1)
+
+  def add_joystick_nodes(self, jstk, screen):
+    jstk.nodes = []
+    x, y, r = screen
+    jcrc_node = self.shapes.circle_node(x, y,
+                                        r, JOYPAD_CLR)
+    jstk_node = self.shapes.circle_node(x, y,
+                                        .48*r, JOYSTICK_CLR)
+    jstk.jstk_node = jstk_node
+    self.add_node(jstk, jcrc_node, 2)
+    self.add_node(jstk, jstk_node, 3)
+
+  def add_joystickpad_nodes(self, jstkpd, screen):
+    jstkpd.nodes = []
+    x1, y1, x2, y2, r = screen
+    jpad_node = self.shapes.rounded_rect_node(x1, y1,
+                                              x2, y2, BUTTON_CLR)
+    jcrc_node = self.shapes.circle_node(x1, y1,
+                                        r, JOYPAD_CLR)
+    jstk_node = self.shapes.circle_node(x1, y1,
+                                        .48*r, JOYSTICK_CLR)
+    if jstkpd.depressed:
+      jcrc_node.position = (jstkpd.circle_x, jstkpd.circle_y)
+      jstk_node.position = (jstkpd.circle_x, jstkpd.circle_y)
+    jstkpd.jcrc_node = jcrc_node
+    jstkpd.jstk_node = jstk_node
+    self.add_node(jstkpd, jpad_node, 1)
+    self.add_node(jstkpd, jcrc_node, 2)
+    self.add_node(jstkpd, jstk_node, 3)
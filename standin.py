@@ -0,0 +1,277 @@
+#!/usr/bin/python
+# Local stand-in for the controller server on port 50079, for benchmarks and
+# load testing. Answers the Dimensions handshake with a StringSpec and every
+# other CtoS frame with StoC::None, optionally after an injected delay.
+import argparse
+import itertools
+import queue
+import socket
+import threading
+import time
+
+import coalesce
+import common
+import ctlrcfg as cc
+import udpchan
+import window
+
+NONE_REPLY = common.STOC_HEADER.pack(window.STOC_NONE, 0)
+DEFAULT_SPEC = ('0,0,0,1024,768,4286611584;]' +
+                '1,20,20,160,160;2,20,200,160,160;3,200,20,160,160;]' +
+                '4,800,200,150;]' +
+                '5,400,400,300,300,80;')
+
+
+def recv_exact(sock, num_bytes):
+  buf = bytearray(num_bytes)
+  view = memoryview(buf)
+  got = 0
+  while got < num_bytes:
+    n = sock.recv_into(view[got:])
+    if n == 0:
+      return None
+    got += n
+  return buf
+
+
+class StandInServer:
+  def __init__(self, host='127.0.0.1', port=0, spec=DEFAULT_SPEC, latency=0,
+               binary=False, udp=False, compact=False, batch=True):
+    self.spec = spec
+    self.binary = binary # send configs as BinarySpec instead of StringSpec
+    self.udp = udp # accept Move datagrams on the same port number
+    self.compact = compact # accept 8 byte CompactMove frames
+    self.batch = batch # offer CAP_BATCH
+    self.tokens = itertools.count(1)
+    self.udp_receiver = udpchan.UdpMoveReceiver()
+    # (token, elem_id) -> newest Move frame applied, over UDP or TCP
+    self.latest_moves = {}
+    self.compact_moves = {} # elem_id -> newest (x, y) from a CompactMove
+    self.latency = latency # seconds between receiving a frame and replying
+    self.frames = 0
+    self.packets = 0
+    self.batches = 0
+    self.bytes = 0
+    self.pending_specs = queue.Queue()
+    self.silent = False # read frames but never reply, like a hung server
+    self.socks = set()
+    self.running = False
+    self.lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.lsock.bind((host, port))
+    self.lsock.listen(1024)
+    self.host = host
+    self.port = self.lsock.getsockname()[1]
+    self.usock = None
+    if udp:
+      self.usock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+      self.usock.bind((host, self.port))
+      self.usock.settimeout(0.1)
+
+  def start(self):
+    self.running = True
+    self.thread = threading.Thread(target=self.serve, daemon=True)
+    self.thread.start()
+    if self.usock:
+      self.udp_thread = threading.Thread(target=self.serve_udp, daemon=True)
+      self.udp_thread.start()
+    return self
+
+  def stop(self):
+    self.running = False
+    self.thread.join()
+    self.lsock.close()
+    for sock in list(self.socks):
+      try:
+        sock.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+    if self.usock:
+      self.udp_thread.join()
+      self.usock.close()
+
+  def serve_udp(self):
+    while self.running:
+      try:
+        datagram = self.usock.recv(udpchan.DATAGRAM_LEN + 1)
+      except socket.timeout:
+        continue
+      except OSError:
+        break
+      accepted = self.udp_receiver.accept(datagram)
+      if accepted:
+        token, elem_id, frame = accepted
+        self.latest_moves[(token, elem_id)] = frame
+
+  # the next non-handshake reply will be a StringSpec instead of a None
+  def push_spec(self, spec):
+    self.pending_specs.put(spec)
+
+  def serve(self):
+    self.lsock.settimeout(0.1)
+    while self.running:
+      try:
+        sock, addr = self.lsock.accept()
+      except socket.timeout:
+        continue
+      except OSError:
+        break
+      sock.settimeout(None)
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      threading.Thread(target=self.handle, args=(sock,), daemon=True).start()
+
+  def supported_caps(self):
+    caps = 0
+    if self.udp:
+      caps |= cc.CAP_UDP_MOVES
+    if self.compact:
+      caps |= cc.CAP_COMPACT_MOVES
+    if self.batch:
+      caps |= cc.CAP_BATCH
+    return caps
+
+  def spec_reply(self, spec):
+    if self.binary:
+      payload = cc.CtlrCfg.from_str(spec).to_bin()
+      code = window.STOC_BINARY_SPEC
+    else:
+      payload = spec.encode()
+      code = window.STOC_STRING_SPEC
+    return common.STOC_HEADER.pack(code, len(payload)) + payload
+
+  # session holds what the connection was told, e.g. its UDP token
+  def reply_for(self, frame, session=None):
+    reply = self.frame_reply(frame, session)
+    # datagrams that arrived since the last report go in front of the reply
+    if session is not None and session['token'] is not None:
+      seen = self.udp_receiver.seen.get(session['token'], 0)
+      if seen != session['seen']:
+        session['seen'] = seen
+        return (common.STOC_HEADER.pack(window.STOC_UDP_SEEN,
+                                        udpchan.SEEN_PAYLOAD.size) +
+                udpchan.SEEN_PAYLOAD.pack(seen) + reply)
+    return reply
+
+  def frame_reply(self, frame, session):
+    msg_type = frame[0]
+    if msg_type == cc.MSG_TYPES['Dimensions']:
+      caps = cc.CTOS_STRUCT.unpack_from(frame)[3] & self.supported_caps()
+      if caps:
+        token = next(self.tokens)
+        if session is not None:
+          session['token'] = token
+        payload = udpchan.CAPS_PAYLOAD.pack(caps, token)
+        return (common.STOC_HEADER.pack(window.STOC_CAPS, len(payload)) +
+                payload + self.spec_reply(self.spec))
+      return self.spec_reply(self.spec)
+    if not self.pending_specs.empty():
+      return self.spec_reply(self.pending_specs.get())
+    return NONE_REPLY
+
+  # a Move that came over TCP, unless its MoveFence found a newer datagram
+  def tcp_move(self, session, elem_id, frame):
+    token = session['token']
+    if token is None or elem_id in session['stale']:
+      session['stale'].discard(elem_id)
+      return
+    self.latest_moves[(token, elem_id)] = frame
+
+  def handle(self, sock):
+    self.socks.add(sock)
+    session = {'token': None, 'stale': set(), 'seen': 0}
+    replies = queue.Queue()
+    writer = threading.Thread(target=self.write_replies, args=(sock, replies),
+                              daemon=True)
+    writer.start()
+    try:
+      while self.running:
+        # every frame is at least as long as a CompactMove
+        frame = recv_exact(sock, cc.NUM_BYTES_COMPACT_MOVE)
+        if frame is None:
+          break
+        if frame[0] != cc.COMPACT_MOVE:
+          rest = recv_exact(sock, cc.NUM_BYTES_CTOS - len(frame))
+          if rest is None:
+            break
+          frame += rest
+        self.frames += 1
+        self.bytes += len(frame)
+        if frame[0] == cc.MSG_TYPES['Disconnect']:
+          break
+        if frame[0] == cc.BATCH:
+          count = cc.batch_count(frame)
+          body = recv_exact(sock, count * cc.NUM_BYTES_CONTROLDATUM)
+          if body is None:
+            break
+          self.bytes += len(body)
+          self.batches += 1
+          for elem_id, datum_type, x, y in cc.unpack_batch(body):
+            self.packets += 1
+            if datum_type == cc.MOVE:
+              self.tcp_move(session, elem_id,
+                            cc.packet_to_bytes(elem_id, cc.MOVE, x, y))
+        elif frame[0] == cc.CONTROL_PACKET:
+          self.packets += 1
+          elem_id = coalesce.move_elem_id(frame)
+          if elem_id is not None:
+            self.tcp_move(session, elem_id, bytes(frame))
+        elif frame[0] == udpchan.MOVE_FENCE and session['token'] is not None:
+          elem_id, fresh = self.udp_receiver.fence(session['token'], frame)
+          if not fresh:
+            session['stale'].add(elem_id)
+        elif frame[0] == cc.COMPACT_MOVE:
+          elem_id, x, y = cc.unpack_compact_move(frame)
+          self.compact_moves[elem_id] = (x, y)
+          self.packets += 1
+          self.tcp_move(session, elem_id,
+                        cc.packet_to_bytes(elem_id, cc.MOVE, x, y))
+        if self.silent:
+          continue
+        replies.put((time.monotonic() + self.latency,
+                     self.reply_for(frame, session)))
+    except OSError:
+      pass
+    replies.put(None)
+    writer.join()
+    self.socks.discard(sock)
+    sock.close()
+
+  def write_replies(self, sock, replies):
+    while True:
+      item = replies.get()
+      if item is None:
+        return
+      due, data = item
+      delay = due - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+      try:
+        sock.sendall(data)
+      except OSError:
+        return
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='stand-in controller server')
+  parser.add_argument('--host', default='0.0.0.0')
+  parser.add_argument('--port', type=int, default=50079)
+  parser.add_argument('--latency', type=float, default=0,
+                      help='reply delay in seconds')
+  parser.add_argument('--binary', action='store_true',
+                      help='send configs as BinarySpec')
+  parser.add_argument('--udp', action='store_true',
+                      help='accept Move packets over UDP')
+  parser.add_argument('--compact', action='store_true',
+                      help='accept CompactMove frames')
+  parser.add_argument('--no-batch', action='store_true',
+                      help='do not offer Batch frames')
+  args = parser.parse_args()
+  server = StandInServer(args.host, args.port, latency=args.latency,
+                         binary=args.binary, udp=args.udp,
+                         compact=args.compact, batch=not args.no_batch).start()
+  print('stand-in server listening on ' + args.host + ':' + str(server.port))
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    server.stop()
@@ -0,0 +1,140 @@
+import socket
+import struct
+
+import ctlrcfg as cc
+import coalesce
+import metrics
+
+# payload of StoC Caps: the CAP_* bits the server accepted and the token the
+# client puts in front of every datagram
+CAPS_PAYLOAD = struct.Struct('<II')
+# payload of StoC UdpSeen: the number of datagrams the server has had from
+# the token
+SEEN_PAYLOAD = struct.Struct('<I')
+# a datagram is the token followed by one Move frame whose last int is the
+# datagram sequence number
+DATAGRAM_HEADER = struct.Struct('<I')
+DATAGRAM_LEN = DATAGRAM_HEADER.size + cc.NUM_BYTES_CTOS
+SEQ_OFFSET = DATAGRAM_HEADER.size + cc.SEQ_OFFSET
+SEQ_WRAP = 1 << 30
+# With UDP Moves on, a Move that goes over TCP instead (a stick's release)
+# follows a MoveFence frame: msg_type, element id and the sequence number of
+# the next datagram. The server drops the element's datagrams sent before it,
+# and the Move itself if a datagram sent after it has already arrived.
+MOVE_FENCE = cc.MSG_TYPES['MoveFence']
+# a datagram holding a Heartbeat frame only asks the server to report the
+# token in a StoC UdpSeen, for a client that does not know yet whether its
+# datagrams get through
+PROBE = cc.MSG_TYPES['Heartbeat']
+
+
+# Sends Move frames as fire-and-forget datagrams. A lost one is not resent
+# here, and a stick held still sends no new Move, so the engine sends the
+# deflected sticks' Moves again every keepalive interval. Until the server
+# has confirmed it sees the datagrams, the engine sends probes and keeps its
+# Moves on TCP.
+class UdpMoveSender:
+  def __init__(self, host, port, token):
+    self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.sock.setblocking(False)
+    self.sock.connect((host, port))
+    self.buf = bytearray(DATAGRAM_LEN)
+    DATAGRAM_HEADER.pack_into(self.buf, 0, token)
+    self.next_seq = 1
+    self.sent = 0
+    self.probes = 0
+    self.send_errors = 0
+    self.confirmed = False # the server reported a datagram from the token
+
+  def send(self, frame):
+    seq = self.next_seq
+    self.next_seq = seq + 1 if seq < cc.INT_MAX else 1
+    self.buf[DATAGRAM_HEADER.size:] = frame
+    struct.pack_into('<i', self.buf, SEQ_OFFSET, seq)
+    if not self.transmit():
+      return
+    self.sent += 1
+    if metrics.ENABLED:
+      metrics.count('packets.UdpMove')
+      metrics.count('bytes.UdpMove', DATAGRAM_LEN)
+
+  def probe(self):
+    self.buf[DATAGRAM_HEADER.size:] = cc.HEARTBEAT_BYTES
+    if not self.transmit():
+      return
+    self.probes += 1
+    if metrics.ENABLED:
+      metrics.count('packets.UdpProbe')
+
+  def transmit(self):
+    try:
+      self.sock.send(self.buf)
+      return True
+    except OSError:
+      self.send_errors += 1
+      return False
+
+  def fence_frame(self, elem_id):
+    return cc.CTOS_STRUCT.pack(MOVE_FENCE, elem_id, self.next_seq, 0, 0, 0, 0, 0)
+
+  def close(self):
+    self.sock.close()
+
+
+def seq_newer(seq, last):
+  if seq > last:
+    return seq - last < SEQ_WRAP
+  return last - seq > SEQ_WRAP
+
+
+# Server side: keeps the newest sequence number seen per (token, element)
+# and drops any datagram that is not newer, so a reordered Move never
+# overwrites a later one. Counts the well-formed datagrams per token for
+# StoC UdpSeen.
+class UdpMoveReceiver:
+  def __init__(self):
+    self.last_seq = {}
+    self.seen = {}
+    self.accepted = 0
+    self.stale = 0
+    self.malformed = 0
+
+  # returns (token, elem_id, frame) for a datagram to apply, or None
+  def accept(self, datagram):
+    if len(datagram) != DATAGRAM_LEN:
+      self.malformed += 1
+      return None
+    token, = DATAGRAM_HEADER.unpack_from(datagram)
+    frame = datagram[DATAGRAM_HEADER.size:]
+    elem_id = coalesce.move_elem_id(frame)
+    if elem_id is None and frame[0] != PROBE:
+      self.malformed += 1
+      return None
+    self.seen[token] = self.seen.get(token, 0) + 1
+    if elem_id is None:
+      return None
+    seq, = struct.unpack_from('<i', frame, cc.SEQ_OFFSET)
+    key = (token, elem_id)
+    last = self.last_seq.get(key)
+    if last is not None and not seq_newer(seq, last):
+      self.stale += 1
+      return None
+    self.last_seq[key] = seq
+    self.accepted += 1
+    return token, elem_id, frame
+
+  # for a MoveFence frame from the client with this token; returns its
+  # element id and whether the TCP Move after it is still the element's newest
+  def fence(self, token, frame):
+    _, elem_id, seq, _, _, _, _, _ = cc.CTOS_STRUCT.unpack_from(frame)
+    key = (token, elem_id)
+    last = self.last_seq.get(key)
+    if last is not None and not seq_newer(seq, last):
+      return elem_id, False
+    self.last_seq[key] = seq - 1 if seq > 1 else cc.INT_MAX
+    return elem_id, True
+
+  def forget(self, token):
+    for key in [k for k in self.last_seq if k[0] == token]:
+      del self.last_seq[key]
+    self.seen.pop(token, None)
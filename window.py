@@ -0,0 +1,176 @@
+import collections
+import select
+import struct
+import time
+
+import common
+import ctlrcfg as cc
+import metrics
+
+STOC_NONE = 31
+STOC_STRING_SPEC = 32
+STOC_BINARY_SPEC = 33
+# informational; not a reply to any one frame
+STOC_CAPS = 34
+# how many datagrams the server has had from this client's UDP token
+STOC_UDP_SEEN = 35
+INFO_CODES = (STOC_CAPS, STOC_UDP_SEEN)
+
+SEQ_MAX = cc.INT_MAX
+SEQUENCED = (cc.CONTROL_PACKET, cc.BATCH)
+
+# names of the metrics a CtoS frame is counted under, by msg_type and, for
+# ControlPackets, datum_type
+MSG_NAMES = {v: k for k, v in cc.MSG_TYPES.items()}
+DATUM_NAMES = {v: k for k, v in cc.DATUM_TYPES.items()}
+FRAME_KINDS = {}
+
+
+# (packets counter, bytes counter, rtt histogram) names for a frame
+def frame_kind(frame):
+  msg_type = frame[0]
+  datum_type = 0
+  if msg_type == cc.CONTROL_PACKET and len(frame) >= cc.NUM_BYTES_CTOS:
+    datum_type = frame[2 * cc.BYTES_PER_INT]
+  key = msg_type << 8 | datum_type
+  kind = FRAME_KINDS.get(key)
+  if kind is None:
+    name = MSG_NAMES.get(msg_type, str(msg_type))
+    if datum_type:
+      name += '.' + DATUM_NAMES.get(datum_type, str(datum_type))
+    kind = ('packets.' + name, 'bytes.' + name, 'rtt.' + name)
+    FRAME_KINDS[key] = kind
+  return kind
+
+
+# counts a frame going out; returns its kind for the reply's round trip
+def count_frame(frame):
+  kind = frame_kind(frame)
+  metrics.count(kind[0])
+  metrics.count(kind[1], len(frame))
+  return kind
+
+
+# Sends CtoS frames without waiting for each StoC reply. Up to `window`
+# frames may be unacknowledged at once; the server answers in order, so
+# replies are matched to the oldest outstanding sequence number.
+# window=1 behaves like the old stop-and-wait send_datum.
+class WindowedSender:
+  def __init__(self, conn, window=1, on_reply=None):
+    self.conn = conn
+    self.window = max(1, window)
+    self.on_reply = on_reply # on_reply(seq, code, payload); seq None for Caps
+    self.next_seq = 1
+    # (seq, time sent, frame_kind or None when metrics are off)
+    self.in_flight = collections.deque()
+    self.sendbuf = bytearray(cc.NUM_BYTES_CTOS)
+    self.last_rtt = None
+    self.liveness = None # told about every send and reply if set
+    self.recorder = None # logs every frame and reply if set
+
+  def send(self, datum):
+    while len(self.in_flight) >= self.window:
+      self.recv_reply()
+    seq = self.next_seq
+    self.next_seq = seq + 1 if seq < SEQ_MAX else 1
+    if len(datum) >= cc.NUM_BYTES_CTOS and datum[0] in SEQUENCED:
+      datum = self.stamp(datum, seq)
+    self.conn.send_bytes(datum)
+    now = time.monotonic()
+    kind = count_frame(datum) if metrics.ENABLED else None
+    self.in_flight.append((seq, now, kind))
+    if self.liveness:
+      self.liveness.sent(now)
+    if self.recorder:
+      self.recorder.ctos(datum)
+    return seq
+
+  # several frames in one write, each acknowledged on its own
+  def send_many(self, frames):
+    i = 0
+    while i < len(frames):
+      while len(self.in_flight) >= self.window:
+        self.recv_reply()
+      n = min(len(frames) - i, self.window - len(self.in_flight))
+      chunk = []
+      seqs = []
+      for datum in frames[i:i + n]:
+        seq = self.next_seq
+        self.next_seq = seq + 1 if seq < SEQ_MAX else 1
+        seqs.append(seq)
+        if len(datum) >= cc.NUM_BYTES_CTOS and datum[0] in SEQUENCED:
+          datum = bytearray(datum)
+          struct.pack_into('<i', datum, cc.SEQ_OFFSET, seq)
+        chunk.append(datum)
+      self.conn.send_frames(chunk)
+      now = time.monotonic()
+      for seq, datum in zip(seqs, chunk):
+        kind = count_frame(datum) if metrics.ENABLED else None
+        self.in_flight.append((seq, now, kind))
+      if self.liveness:
+        self.liveness.sent(now)
+      if self.recorder:
+        for datum in chunk:
+          self.recorder.ctos(datum)
+      i += n
+
+  def stamp(self, datum, seq):
+    n = len(datum)
+    if len(self.sendbuf) < n:
+      self.sendbuf = bytearray(n)
+    view = memoryview(self.sendbuf)[:n]
+    view[:] = datum
+    struct.pack_into('<i', self.sendbuf, cc.SEQ_OFFSET, seq)
+    return view
+
+  # send time of the oldest unacknowledged frame, or None
+  def oldest_unacked(self):
+    if self.in_flight:
+      return self.in_flight[0][1]
+    return None
+
+  # handle every reply that has already arrived, without blocking
+  def poll(self):
+    while self.in_flight and (self.conn.buffered() or self.readable()):
+      self.recv_reply()
+    # with nothing outstanding, readable can only mean the peer hung up
+    if not self.in_flight and not self.conn.buffered() and self.readable():
+      if self.conn.fill() == 0:
+        raise common.ConnectionLost('socket connection broken')
+
+  # block until every outstanding frame has been acknowledged
+  def drain(self):
+    while self.in_flight:
+      self.recv_reply()
+
+  def readable(self):
+    r, _, _ = select.select([self.conn.sock], [], [], 0)
+    return len(r) > 0
+
+  def recv_reply(self):
+    valid, code, payload = self.conn.recv_stoc()
+    if not valid:
+      raise common.ConnectionLost('socket connection broken')
+    while code in INFO_CODES:
+      if self.recorder:
+        self.recorder.stoc(code, payload)
+      if self.on_reply:
+        self.on_reply(None, code, payload)
+      valid, code, payload = self.conn.recv_stoc()
+      if not valid:
+        raise common.ConnectionLost('socket connection broken')
+    seq, sent, kind = self.in_flight.popleft()
+    now = time.monotonic()
+    self.last_rtt = now - sent
+    if kind is not None and metrics.ENABLED:
+      metrics.observe(kind[2], self.last_rtt)
+    if self.liveness:
+      self.liveness.heard(now, self.last_rtt)
+    if self.recorder:
+      self.recorder.stoc(code, payload)
+    if code == STOC_NONE:
+      payload = None
+    elif code != STOC_STRING_SPEC and code != STOC_BINARY_SPEC:
+      print('StoC magic number ' + str(code) + ' cannot be handled')
+    if self.on_reply:
+      self.on_reply(seq, code, payload)